@@ -1,5 +1,5 @@
 #!/usr/bin/env python3
-from config  import X_AKA_INFO, X_ES_INFO, AKAMAI_REQUEST_BC, LOGGER as logger
+from config  import X_AKA_INFO, X_ES_INFO, AKAMAI_REQUEST_BC, BASE_PATH, LOGGER as logger
 import time
 from datetime import datetime, timedelta
 import requests
@@ -8,6 +8,7 @@ import sqlite3
 import pandas as pd
 import os
 import sys
+import threading
 from utils import load_env
 
 
@@ -41,11 +42,1641 @@ SUB_SOURCE_IDS=['4']
 #10545 x-es-info
 TRACEPOINTS_IDS=['10565','10538','10545']
 TESTTYPES = ['web', 'transaction', 'api']
+TESTS_PAGE_SIZE = 100
+#pages fetched one by one when a /tests response has no totalCount, a server ignoring pageNumber can't keep us paging forever
+TESTS_MAX_PAGES = 100
+TESTS_DETAILS_FIELDS = ['name', 'requestData', 'type', 'monitor']
+#just the test ids are needed to fetch a folder's data
+FOLDER_TESTS_FIELDS = ['type']
+
+#null failure counts mean no failure
+FAILURE_METRICS = ['cnt_connection_failures', 'cnt_ssl_failures', 'cnt_response_failures', 'cnt_timeout_failures']
+
+#row scrubbing defaults, see ScrubPolicy
+OUTLIER_THRESHOLD = 2999.99
+POTENTIAL_OUTLIER_FACTOR = 0.6
+#(metric name glob, operator, value): a row is an error when a rule matches and no exemption does
+ERROR_RULES = [('*failures', '>', 0)]
+#failures with an availability drop are real failed runs, not errors ('availibility' is how older metric names spell it)
+ERROR_EXEMPTIONS = [('*availability*', '<', 100), ('*availibility*', '<', 100)]
+SCRUB_OPERATORS = {
+    '>': lambda values, value: values > value,
+    '>=': lambda values, value: values >= value,
+    '<': lambda values, value: values < value,
+    '<=': lambda values, value: values <= value,
+    '==': lambda values, value: values == value,
+    '!=': lambda values, value: values != value,
+}
+#TestData.where(column__operator=value) lookups, a plain column=value is 'eq'. Nulls never match, except isnull=True
+WHERE_OPERATORS = {
+    'eq': lambda values, value: values == value,
+    'ne': lambda values, value: (values != value) & values.notna(),
+    'gt': lambda values, value: values > value,
+    'gte': lambda values, value: values >= value,
+    'lt': lambda values, value: values < value,
+    'lte': lambda values, value: values <= value,
+    'in': lambda values, value: values.isin(list(value)),
+    'not_in': lambda values, value: ~values.isin(list(value)) & values.notna(),
+    'between': lambda values, value: (values >= value[0]) & (values <= value[1]),
+    'contains': lambda values, value: values.astype(str).str.contains(value, regex=False) & values.notna(),
+    'startswith': lambda values, value: values.astype(str).str.startswith(value) & values.notna(),
+    'isnull': lambda values, value: values.isna() if value else values.notna(),
+}
+#bool columns ScrubPolicy adds to TestData.df and excluded_df
+SCRUB_FLAG_COLUMNS = ['is_outlier', 'is_error']
 
 DBG_HDR_DICT = {'x_aka_info': X_AKA_INFO, 
                         'x_es_info' : X_ES_INFO, 
                         'akamai_request_bc': AKAMAI_REQUEST_BC
     }
+#expanded header column -> type, e.g. 'client_asnum' -> 'Int32'
+HEADER_COLUMN_TYPES = {column: column_type for hdr in DBG_HDR_DICT.values() for column, column_type in hdr.values()}
+#tracepoint column -> how it's expanded: 'format' 'kv' ("[k=v,k=v]", `columns` {key: [column name, type]}) or 'json' (an object per value),
+#'lazy' ones keep their raw column and get {tracepoint}_{key} columns when a query or summary uses them, see `register_tracepoint`.
+#Tracepoints not registered here are lazy too, their format is guessed from their values.
+TRACEPOINT_REGISTRY = {
+    'x_aka_info': {'format': 'kv', 'columns': X_AKA_INFO, 'lazy': False},
+    'x_es_info': {'format': 'kv', 'columns': X_ES_INFO, 'lazy': False},
+    'akamai_request_bc': {'format': 'kv', 'columns': AKAMAI_REQUEST_BC, 'lazy': False},
+    #set by cp_api_extract.js: AK_REGION, AK_CLIENT_RTT, TLS info...
+    'resp_json': {'format': 'json', 'lazy': True},
+}
+#a debug header value once the brackets are stripped: comma separated key=value pairs
+HEADER_VALUE_PATTERN = r'[^,=]+=[^,=]*(?:,[^,=]+=[^,=]*)*'
+#string columns (other than dimensions) with fewer distinct values than this share of rows become categoricals
+CATEGORY_MAX_RATIO = 0.5
+
+CP_API_BASE_URL = "https://io.catchpoint.com"
+CP_POOL_SIZE = 10
+#dimension names that hold the data point time, used by incremental refreshes
+TIME_DIMENSIONS = ['time', 'timestamp', 'date', 'datetime']
+#(connect, read) seconds
+CP_TIMEOUT = (5.0, 120.0)
+CP_ASYNC_POOL_SIZE = 50
+CP_CACHE_DIR = os.path.join(BASE_PATH, ".cache", "catchpoint")
+CP_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+#seconds a response for a window that includes "now" stays valid
+CP_CACHE_OPEN_TTL = 120
+#minutes after end_time before a window is treated as closed (late results still trickle in)
+CP_CACHE_CLOSED_AFTER = 30
+CP_RATE_LIMIT_RETRIES = 5
+#seconds folder test lists, folder details and enumerations are reused before they are fetched again
+CP_METADATA_TTL = {
+    'tests': 3600,
+    'folders': 6 * 3600,
+    'enumerations': 24 * 3600,
+}
+CP_METADATA_CACHE_FILE = os.path.join(BASE_PATH, ".cache", "catchpoint", "metadata.json")
+#schema metadata key of the TestData metadata in Arrow/parquet files, and the column flagging excluded rows in them
+TEST_DATA_METADATA_KEY = b'catchpoint_test_data'
+EXCLUDED_COLUMN = '__excluded__'
+#distinct debug header strings kept parsed between fetches
+CP_HEADER_CACHE_SIZE = 200000
+#seconds added to a relative X-Rate-Limit-Reset
+CP_RATE_LIMIT_SLACK = 1.0
+
+#minutes per interval id, used to size time shards
+INTERVAL_MINUTES = {
+    '4':5,
+    '5':10,
+    '6':15,
+    '7':30,
+    '8':60,
+    '11':120,
+    '12':180,
+    '13':240,
+    '15':300,
+    '16':360,
+    '9':1440
+}
+#raw responses have one item per test run, keep their windows short
+RAW_SHARD_HOURS = 1.0
+#max aggregation buckets per aggregated request
+AGGREGATED_SHARD_BUCKETS = 96
+CP_SHARD_RETRIES = 2
+#TestData.query backend, 'sqlite' or 'duckdb' (optional, queries df in place), see QueryEngine
+CP_QUERY_BACKEND = 'sqlite'
+QUERY_BACKENDS = ['sqlite', 'duckdb']
+#dimension columns indexed in the sqlite query table
+QUERY_INDEX_COLUMNS = ['test', 'country', 'host', 'node']
+#query/summary results memoized per TestData until its data changes, see ResultCache
+CP_RESULT_CACHE_SIZE = 128
+CP_RESULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+CP_RESULT_CACHE_ENABLED = True
+#stats get_summary(stats=[...]) computes besides quantiles ('p50', 'p99.9'...), 'stddev' is an alias of 'std'
+SUMMARY_STATS = ['mean', 'median', 'count', 'std', 'stddev', 'min', 'max', 'sum']
+#QuantileSketch relative accuracy (quantiles are within 1% of a value of the data), max buckets kept before the lowest are collapsed,
+#and the smallest magnitude told apart from 0
+CP_SKETCH_ACCURACY = 0.01
+CP_SKETCH_MAX_BINS = 2048
+SKETCH_MIN_VALUE = 1e-9
+#rows per batch of TestData.iter_batches and get_data_stream
+CP_BATCH_ROWS = 50000
+#start method of the extraction worker processes (get_data(extract_processes=N)), forkserver workers don't inherit the fetch threads' locks
+CP_EXTRACT_START_METHOD = 'forkserver'
+
+
+class CatchpointClient:
+    """
+    CatchpointClient wraps a single keep-alive requests.Session so every call to the catchpoint api reuses pooled TCP/TLS connections.
+    A module level instance `CP_CLIENT` is used by all the fetch functions, use `configure_client()` to resize the pool or change the default timeout.
+
+    Usage:
+    import catchpoint_helper as cp
+    cp.configure_client(pool_size=20, timeout=(5, 300))
+    http_status, test_data = cp.get_data(folder_id='1234')
+    print(cp.CP_CLIENT.stats())
+    """
+
+    def __init__(self, pool_size:int=CP_POOL_SIZE, timeout=CP_TIMEOUT, base_url:str=None, rate_limiter=None):
+        from requests.adapters import HTTPAdapter
+        import threading
+
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.base_url = base_url
+        #None means the shared CP_RATE_LIMITER
+        self.rate_limiter = rate_limiter
+        self._lock = threading.Lock()
+        self._request_count = 0
+        self._closed_pool_connections = 0
+        self._closed_pool_requests = 0
+
+        self.session = requests.Session()
+        self.session.headers.update({
+            'accept': 'application/json',
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive',
+        })
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+
+    def url(self, path:str) -> str:
+        """url(self, path:str) -> str: returns the full url of an api path, e.g. '/api/v2/tests/'"""
+        base_url = self.base_url if self.base_url else CP_API_BASE_URL
+        return f"{base_url.rstrip('/')}/{path.lstrip('/')}"
+
+    def get(self, url:str, api_key:str=None, headers:dict=None, params=None, timeout=None, **kwargs) -> requests.Response:
+        """
+        get(self, url:str, api_key:str=None, headers:dict=None, params=None, timeout=None) -> requests.Response: GET on the pooled session, `timeout` overrides the client default for this call only.
+        Every request waits for a rate limiter token first, 429 responses are retried up to CP_RATE_LIMIT_RETRIES times once the server's window resets.
+        """
+        req_headers = {}
+        if api_key:
+            req_headers['Authorization'] = f'Bearer {api_key}'
+        if headers:
+            req_headers.update(headers)
+        if timeout is None:
+            timeout = self.timeout
+        rate_limiter = self.rate_limiter if self.rate_limiter is not None else CP_RATE_LIMITER
+
+        for attempt in range(CP_RATE_LIMIT_RETRIES + 1):
+            rate_limiter.acquire()
+            with self._lock:
+                self._request_count += 1
+            response = self.session.get(url, headers=req_headers, params=params, timeout=timeout, **kwargs)
+            rate_limiter.update(response.headers, response.status_code)
+            if response.status_code != 429:
+                break
+            logger.debug(f"Rate limit exceeded, attempt {attempt + 1}/{CP_RATE_LIMIT_RETRIES + 1}")
+            if attempt < CP_RATE_LIMIT_RETRIES:
+                #hand the connection back to the pool, streamed responses don't until their body is read
+                response.close()
+        return response
+
+    def _pools(self) -> list:
+        pools = self.adapter.poolmanager.pools
+        return [pools[key] for key in pools.keys()]
+
+    def stats(self) -> dict:
+        """stats(self) -> dict: connection reuse counters, `reused_connections` > 0 confirms keep-alive is working."""
+        connections = self._closed_pool_connections
+        pool_requests = self._closed_pool_requests
+        for pool in self._pools():
+            connections += pool.num_connections
+            pool_requests += pool.num_requests
+        with self._lock:
+            request_count = self._request_count
+        return {
+            'requests': request_count,
+            'pool_requests': pool_requests,
+            'new_connections': connections,
+            'reused_connections': max(pool_requests - connections, 0),
+            'pool_size': self.pool_size,
+        }
+
+    def reset_stats(self):
+        """reset_stats(self): zero the request and connection counters."""
+        with self._lock:
+            self._request_count = 0
+            self._closed_pool_connections = 0
+            self._closed_pool_requests = 0
+            for pool in self._pools():
+                pool.num_connections = 0
+                pool.num_requests = 0
+
+    def close(self):
+        """close(self): closes every pooled connection."""
+        for pool in self._pools():
+            self._closed_pool_connections += pool.num_connections
+            self._closed_pool_requests += pool.num_requests
+        self.session.close()
+
+
+class RateLimiter:
+    """
+    RateLimiter is a token bucket refilled from the X-Rate-Limit-Limit, X-Rate-Limit-Remaining and X-Rate-Limit-Reset response headers.
+    Until the server reports a budget requests are not delayed, once the reported budget is used up callers block until the reset time.
+    A 429 empties the bucket until the reset (or Retry-After) time.
+
+    With `state_file` the bucket is kept in a json file guarded by an flock, so several processes sharing the file share one budget.
+    The shared instance `CP_RATE_LIMITER` is used by `CP_CLIENT`, use `configure_rate_limiter()` to replace it.
+    """
+
+    def __init__(self, state_file:str=None):
+        import threading
+
+        self.state_file = state_file
+        self._lock = threading.Lock()
+        self._state = {'limit': None, 'tokens': None, 'reset_at': 0.0}
+        self.waits = 0
+        self.wait_time = 0.0
+        self.rate_limited = 0
+
+    def _locked_state(self, update):
+        """runs update(state) under the thread lock and, if configured, the state file lock and returns its result"""
+        with self._lock:
+            if not self.state_file:
+                return update(self._state)
+
+            import fcntl
+            with open(self.state_file, 'a+') as state_fh:
+                fcntl.flock(state_fh, fcntl.LOCK_EX)
+                try:
+                    state_fh.seek(0)
+                    content = state_fh.read()
+                    state = json.loads(content) if content.strip() else dict(self._state)
+                    result = update(state)
+                    state_fh.seek(0)
+                    state_fh.truncate()
+                    state_fh.write(json.dumps(state))
+                    state_fh.flush()
+                    return result
+                finally:
+                    fcntl.flock(state_fh, fcntl.LOCK_UN)
+
+    def _reserve(self, state:dict) -> float:
+        """takes a token and returns 0, or returns the seconds to wait for the next refill"""
+        now = time.time()
+        if state['tokens'] is not None and state['reset_at'] and now >= state['reset_at']:
+            state['tokens'] = state['limit']
+            state['reset_at'] = 0.0
+        if state['tokens'] is None or state['tokens'] >= 1 or not state['reset_at']:
+            if state['tokens'] is not None:
+                state['tokens'] = max(state['tokens'] - 1, 0)
+            return 0.0
+        return max(state['reset_at'] - now, 0.01)
+
+    def acquire(self):
+        """acquire(self): blocks until a request may be sent"""
+        while True:
+            wait = self._locked_state(self._reserve)
+            if wait <= 0:
+                return
+            self.waits += 1
+            self.wait_time += wait
+            logger.debug(f"Rate limit budget used up, waiting {wait:.2f}s")
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """acquire_async(self): same as acquire() but yields to the event loop while waiting, the state file flock is taken in a worker thread"""
+        import asyncio
+        while True:
+            if self.state_file:
+                wait = await asyncio.to_thread(self._locked_state, self._reserve)
+            else:
+                wait = self._locked_state(self._reserve)
+            if wait <= 0:
+                return
+            self.waits += 1
+            self.wait_time += wait
+            logger.debug(f"Rate limit budget used up, waiting {wait:.2f}s")
+            await asyncio.sleep(wait)
+
+    @staticmethod
+    def _reset_at(value) -> float:
+        """X-Rate-Limit-Reset as an epoch, accepts seconds until reset, an epoch, or an http date"""
+        try:
+            value = float(value)
+            # whole seconds are truncated by the server, waking up early just earns another 429
+            return value if value > 1e9 else time.time() + value + CP_RATE_LIMIT_SLACK
+        except (TypeError, ValueError):
+            pass
+        try:
+            from email.utils import parsedate_to_datetime
+            return parsedate_to_datetime(value).timestamp()
+        except (TypeError, ValueError):
+            return 0.0
+
+    def update(self, headers, status_code:int=200):
+        """update(self, headers, status_code:int=200): re-sync the bucket with the budget reported by a response"""
+        limit = headers.get('X-Rate-Limit-Limit')
+        remaining = headers.get('X-Rate-Limit-Remaining')
+        reset = headers.get('X-Rate-Limit-Reset')
+        if status_code == 429:
+            self.rate_limited += 1
+            logger.debug(f"X-Rate-Limit:{limit} X-Rate-Limit-Remaining:{remaining} X-Rate-Limit-Reset:{reset} Date:{headers.get('Date')}")
+            reset = headers.get('Retry-After', reset)
+        if limit is None and remaining is None and status_code != 429:
+            return
+
+        reset_at = self._reset_at(reset) if reset is not None else 0.0
+        if status_code == 429 and reset_at <= time.time():
+            reset_at = time.time() + 1.0
+
+        def apply(state):
+            if limit is not None:
+                state['limit'] = int(limit)
+            if status_code == 429:
+                state['tokens'] = 0
+            elif remaining is not None:
+                # same window: in-flight requests already took tokens the server has not counted yet
+                new_window = state['tokens'] is None or not state['reset_at'] or reset_at > state['reset_at'] + 1
+                state['tokens'] = int(remaining) if new_window else min(state['tokens'], int(remaining))
+            if reset_at:
+                state['reset_at'] = reset_at
+            elif state['tokens'] is not None and state['tokens'] < 1:
+                state['reset_at'] = time.time() + 1.0
+
+        self._locked_state(apply)
+
+    async def update_async(self, headers, status_code:int=200):
+        """update_async(self, headers, status_code:int=200): same as update() without blocking the event loop on the state file flock"""
+        import asyncio
+        if self.state_file:
+            await asyncio.to_thread(self.update, headers, status_code)
+        else:
+            self.update(headers, status_code)
+
+    def stats(self) -> dict:
+        """stats(self) -> dict: current budget and how often callers had to wait"""
+        state = self._locked_state(dict)
+        return {
+            'limit': state['limit'],
+            'tokens': state['tokens'],
+            'reset_in': max(state['reset_at'] - time.time(), 0.0) if state['reset_at'] else None,
+            'waits': self.waits,
+            'wait_time': round(self.wait_time, 3),
+            'rate_limited': self.rate_limited,
+        }
+
+
+class AsyncCatchpointClient:
+    """
+    AsyncCatchpointClient is the asyncio counterpart of CatchpointClient, one aiohttp session and connection pool for every *_async call.
+    It shares the rate limiter with the blocking client and, unless given its own `base_url`, follows the base url of `CP_CLIENT`.
+    aiohttp is only imported on first use.
+
+    Usage:
+    import asyncio
+    import catchpoint_helper as cp
+    async def main():
+        results = await asyncio.gather(*[cp.get_data_async(folder_id=f) for f in ['1234', '5678']])
+        await cp.CP_ASYNC_CLIENT.close()
+        return results
+    results = asyncio.run(main())
+    """
+
+    def __init__(self, pool_size:int=CP_ASYNC_POOL_SIZE, timeout=CP_TIMEOUT, base_url:str=None, rate_limiter=None):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.base_url = base_url
+        self.rate_limiter = rate_limiter
+        self._session = None
+        self._loop = None
+        self._session_closer = None
+        self._request_count = 0
+        self._new_connections = 0
+        self._reused_connections = 0
+
+    def url(self, path:str) -> str:
+        """url(self, path:str) -> str: returns the full url of an api path, e.g. '/api/v2/tests/'"""
+        if self.base_url:
+            return f"{self.base_url.rstrip('/')}/{path.lstrip('/')}"
+        return CP_CLIENT.url(path)
+
+    def _client_timeout(self, timeout):
+        import aiohttp
+        if timeout is None:
+            timeout = self.timeout
+        if isinstance(timeout, (tuple, list)):
+            return aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1])
+        return aiohttp.ClientTimeout(total=timeout)
+
+    async def _on_connection_create(self, session, context, params):
+        self._new_connections += 1
+
+    async def _on_connection_reuse(self, session, context, params):
+        self._reused_connections += 1
+
+    @staticmethod
+    async def _close_at_loop_shutdown(session):
+        """async generator parked at its first yield, the loop closes it on shutdown (asyncio.run does) and that closes `session` while the loop still runs"""
+        try:
+            yield
+        finally:
+            if not session.closed:
+                await session.close()
+
+    async def _get_session(self):
+        import asyncio
+        import aiohttp
+
+        loop = asyncio.get_running_loop()
+        #a session is bound to the loop it was created in, one of another loop is closed by that loop's shutdown
+        if self._session is None or self._session.closed or self._loop is not loop:
+            trace_config = aiohttp.TraceConfig()
+            trace_config.on_connection_create_end.append(self._on_connection_create)
+            trace_config.on_connection_reuseconn.append(self._on_connection_reuse)
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                headers={'accept': 'application/json', 'Accept-Encoding': 'gzip, deflate'},
+                trace_configs=[trace_config],
+            )
+            self._loop = loop
+            self._session_closer = self._close_at_loop_shutdown(self._session)
+            await self._session_closer.asend(None)
+        return self._session
+
+    async def get(self, url:str, api_key:str=None, headers:dict=None, params:dict=None, timeout=None) -> tuple:
+        """
+        get(self, url:str, api_key:str=None, headers:dict=None, params:dict=None, timeout=None) -> tuple: (http_status_code, body text, response headers)
+        Paced by the shared rate limiter, 429 responses are retried like CatchpointClient.get does.
+        """
+        session = await self._get_session()
+        req_headers = {}
+        if api_key:
+            req_headers['Authorization'] = f'Bearer {api_key}'
+        if headers:
+            req_headers.update(headers)
+        if params:
+            #aiohttp only takes str values, str() keeps the wire format requests uses
+            params = {key: str(value) for key, value in params.items()}
+        rate_limiter = self.rate_limiter if self.rate_limiter is not None else CP_RATE_LIMITER
+
+        for attempt in range(CP_RATE_LIMIT_RETRIES + 1):
+            await rate_limiter.acquire_async()
+            self._request_count += 1
+            async with session.get(url, headers=req_headers, params=params, timeout=self._client_timeout(timeout)) as response:
+                status_code = response.status
+                body = await response.text()
+                response_headers = response.headers
+            await rate_limiter.update_async(response_headers, status_code)
+            if status_code != 429:
+                break
+            logger.debug(f"Rate limit exceeded, attempt {attempt + 1}/{CP_RATE_LIMIT_RETRIES + 1}")
+        return status_code, body, response_headers
+
+    def stats(self) -> dict:
+        """stats(self) -> dict: connection reuse counters"""
+        return {
+            'requests': self._request_count,
+            'new_connections': self._new_connections,
+            'reused_connections': self._reused_connections,
+            'pool_size': self.pool_size,
+        }
+
+    async def close(self):
+        """close(self): closes the session and its pooled connections"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        if self._session_closer is not None:
+            await self._session_closer.aclose()
+        self._session = None
+        self._session_closer = None
+
+
+class ResponseCache:
+    """
+    ResponseCache is a content addressed on-disk cache of explorer responses, keyed by account (a hash of the api key), endpoint and the normalized request params.
+    Bodies are stored gzip compressed. Windows that ended more than CP_CACHE_CLOSED_AFTER minutes ago never expire,
+    windows that include "now" expire after `open_ttl` seconds. Once the cache grows past `max_bytes` the least recently used entries are removed.
+
+    Usage:
+    import catchpoint_helper as cp
+    cp.configure_cache(cache_dir='/tmp/cp_cache', max_bytes=10 * 1024**3)
+    http_status, test_data = cp.get_data(test_ids=['1234'], start_time='2024-01-01T00:00:00', end_time='2024-01-02T00:00:00')
+    print(cp.CP_CACHE.stats())
+    """
+
+    #params that identify an explorer response, id lists are order independent
+    KEY_PARAMS = ['testIds', 'startTime', 'endTime', 'interval', 'metricIds', 'dimensionIds', 'subSourceIds', 'tracepointIds']
+    LIST_PARAMS = ['testIds', 'metricIds', 'dimensionIds', 'subSourceIds', 'tracepointIds']
+
+    def __init__(self, cache_dir:str=CP_CACHE_DIR, max_bytes:int=CP_CACHE_MAX_BYTES, open_ttl:int=CP_CACHE_OPEN_TTL):
+        import threading
+
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.open_ttl = open_ttl
+        self._lock = threading.Lock()
+        self._size = None
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+    def key(self, api_key:str, end_point:str, params:dict) -> str:
+        """key(self, api_key:str, end_point:str, params:dict) -> str: sha256 of the account, endpoint and normalized params, an account never gets another one's responses"""
+        import hashlib
+        account = hashlib.sha256(str(api_key).encode()).hexdigest()[:16]
+        normalized = {}
+        for name in self.KEY_PARAMS:
+            value = params.get(name)
+            if value is None:
+                continue
+            if name in self.LIST_PARAMS:
+                value = ",".join(sorted(str(value).split(',')))
+            normalized[name] = str(value)
+        return hashlib.sha256(json.dumps([account, end_point, normalized], sort_keys=True).encode()).hexdigest()
+
+    @staticmethod
+    def is_closed(params:dict) -> bool:
+        """is_closed(params:dict) -> bool: True if the requested window ended long enough ago that its data won't change"""
+        try:
+            end_time = datetime.strptime(params['endTime'], '%Y-%m-%dT%H:%M:%S')
+        except (KeyError, ValueError):
+            return False
+        return end_time < datetime.utcnow() - timedelta(minutes=CP_CACHE_CLOSED_AFTER)
+
+    def _entries(self, key:str) -> list:
+        entry_dir = os.path.join(self.cache_dir, key[:2])
+        if not os.path.isdir(entry_dir):
+            return []
+        return [os.path.join(entry_dir, f) for f in os.listdir(entry_dir) if f.startswith(key) and f.endswith('.json.gz')]
+
+    @staticmethod
+    def _expires(path:str):
+        # <key>.json.gz never expires, <key>.<epoch>.json.gz expires at epoch
+        parts = os.path.basename(path).split('.')
+        return float(parts[1]) if len(parts) == 4 else None
+
+    def path(self, key:str):
+        """path(self, key:str): path of a valid cache entry or None, expired entries are removed"""
+        now = time.time()
+        for path in self._entries(key):
+            expires = self._expires(path)
+            if expires is not None and expires < now:
+                self._remove(path)
+                continue
+            return path
+        return None
+
+    def get(self, key:str):
+        """get(self, key:str): cached response body as bytes, or None"""
+        import gzip
+        path = self.path(key)
+        if path is not None:
+            try:
+                with gzip.open(path, 'rb') as cache_file:
+                    body = cache_file.read()
+                os.utime(path)
+                with self._lock:
+                    self.hits += 1
+                return body
+            except (OSError, EOFError) as e:
+                logger.warning(f"dropping unreadable cache entry {path}: {e}")
+                self._remove(path)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def open(self, key:str):
+        """open(self, key:str): a binary file object reading the decompressed body of a cached response, or None"""
+        import gzip
+        path = self.path(key)
+        if path is not None:
+            try:
+                cache_file = gzip.open(path, 'rb')
+                os.utime(path)
+                with self._lock:
+                    self.hits += 1
+                return cache_file
+            except OSError as e:
+                logger.warning(f"dropping unreadable cache entry {path}: {e}")
+                self._remove(path)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key:str, body:bytes, closed:bool=True):
+        """put(self, key:str, body:bytes, closed:bool=True): stores a response body, entries that are not `closed` expire after open_ttl seconds"""
+        writer = self.writer(key, closed=closed)
+        if writer is None:
+            return
+        try:
+            writer.write(body)
+        except OSError as e:
+            logger.warning(f"failed to write cache entry {writer.path}: {e}")
+            writer.abort()
+            return
+        writer.commit()
+
+    def writer(self, key:str, closed:bool=True):
+        """writer(self, key:str, closed:bool=True): a _CacheWriter to store a body chunk by chunk, nothing is visible until commit(). None if the entry can't be created."""
+        import threading
+        entry_dir = os.path.join(self.cache_dir, key[:2])
+        try:
+            os.makedirs(entry_dir, exist_ok=True)
+        except OSError as e:
+            logger.warning(f"failed to create cache dir {entry_dir}: {e}")
+            return None
+        if closed:
+            path = os.path.join(entry_dir, f"{key}.json.gz")
+        else:
+            path = os.path.join(entry_dir, f"{key}.{int(time.time() + self.open_ttl)}.json.gz")
+        try:
+            return _CacheWriter(self, key, path, f"{path}.{os.getpid()}.{threading.get_ident()}.tmp")
+        except OSError as e:
+            logger.warning(f"failed to write cache entry {path}: {e}")
+            return None
+
+    def _committed(self, key:str, path:str):
+        for old_path in self._entries(key):
+            if old_path != path:
+                self._remove(old_path)
+        with self._lock:
+            self.writes += 1
+            if self._size is not None:
+                self._size += os.path.getsize(path)
+        self._evict()
+
+    def _remove(self, path:str):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            if self._size is not None:
+                self._size -= size
+
+    def _scan(self) -> list:
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for entry_dir in os.listdir(self.cache_dir):
+            entry_dir = os.path.join(self.cache_dir, entry_dir)
+            if not os.path.isdir(entry_dir):
+                continue
+            for f in os.listdir(entry_dir):
+                if not f.endswith('.json.gz'):
+                    continue
+                path = os.path.join(entry_dir, f)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict(self):
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._scan())
+            if self._size <= self.max_bytes:
+                return
+        #least recently used first, down to 90% so we don't evict on every write
+        for _, _, path in sorted(self._scan()):
+            with self._lock:
+                if self._size <= self.max_bytes * 0.9:
+                    break
+            self._remove(path)
+            with self._lock:
+                self.evictions += 1
+
+    def clear(self):
+        """clear(self): removes every cache entry"""
+        for _, _, path in self._scan():
+            self._remove(path)
+        with self._lock:
+            self._size = 0
+
+    def stats(self) -> dict:
+        """stats(self) -> dict: hit/miss counters and disk usage"""
+        entries = self._scan()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+            'writes': self.writes,
+            'evictions': self.evictions,
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+            'max_bytes': self.max_bytes,
+        }
+
+
+class _CacheWriter:
+    """gzip writer for one ResponseCache entry, written to a temp file and moved in place on commit()"""
+
+    def __init__(self, cache:ResponseCache, key:str, path:str, tmp_path:str):
+        import gzip
+        self.cache = cache
+        self.key = key
+        self.path = path
+        self.tmp_path = tmp_path
+        self._fh = gzip.open(tmp_path, 'wb', compresslevel=6)
+
+    def write(self, data:bytes):
+        self._fh.write(data)
+
+    def commit(self):
+        try:
+            self._fh.close()
+            os.replace(self.tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"failed to write cache entry {self.path}: {e}")
+            self.abort()
+            return
+        self.cache._committed(self.key, self.path)
+
+    def abort(self):
+        try:
+            self._fh.close()
+        except OSError:
+            pass
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+class MetadataCache:
+    """
+    MetadataCache keeps folder test lists, folder details and enumerations for CP_METADATA_TTL seconds per kind,
+    so `get_data(folder_id=...)`, `tests`, `folders` and `get_enumerations` don't hit the api every time.
+    Entries are kept in memory, and in `persist_file` (json) too if given so they survive a restart.
+    Entries are keyed by kind, a hash of the api key and the call arguments.
+
+    Usage:
+    import catchpoint_helper as cp
+    cp.configure_metadata_cache(persist_file=cp.CP_METADATA_CACHE_FILE, ttl={'tests': 600})
+    http_status, tests = cp.tests(1234)
+    cp.CP_METADATA_CACHE.invalidate('tests')
+    """
+
+    def __init__(self, ttl:dict=None, persist_file:str=None):
+        import threading
+
+        self.ttl = dict(CP_METADATA_TTL)
+        if ttl:
+            self.ttl.update(ttl)
+        self.persist_file = persist_file
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+        if persist_file:
+            self._load()
+
+    @staticmethod
+    def key(api_key:str, *args) -> str:
+        """key(api_key:str, *args) -> str: cache key of a call, the api key is hashed so it never ends up on disk"""
+        import hashlib
+        account = hashlib.sha256(str(api_key).encode()).hexdigest()[:16]
+        return json.dumps([account] + [a if a is None else str(a) for a in args])
+
+    def get(self, kind:str, *keys):
+        """get(self, kind:str, *keys): a copy of the value of the first of `keys` that is cached and younger than the kind's ttl, None otherwise"""
+        import copy
+        with self._lock:
+            entries = self._entries.get(kind, {})
+            for key in keys:
+                entry = entries.get(key)
+                if entry is None:
+                    continue
+                if time.time() - entry[0] < self.ttl.get(kind, 0):
+                    self.hits += 1
+                    return copy.deepcopy(entry[1])
+                del entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, kind:str, key:str, value):
+        """put(self, kind:str, key:str, value): stores a copy of a value, must be json serializable when persisting"""
+        import copy
+        with self._lock:
+            self._entries.setdefault(kind, {})[key] = [time.time(), copy.deepcopy(value)]
+            self._save()
+
+    def invalidate(self, kind:str=None, key:str=None):
+        """invalidate(self, kind:str=None, key:str=None): drops one entry, all entries of a kind or everything"""
+        with self._lock:
+            if kind is None:
+                self._entries = {}
+            elif key is None:
+                self._entries.pop(kind, None)
+            else:
+                self._entries.get(kind, {}).pop(key, None)
+            self._save()
+
+    def _load(self):
+        try:
+            with open(self.persist_file, 'r') as f:
+                self._entries = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"ignoring unreadable metadata cache {self.persist_file}: {e}")
+
+    def _save(self):
+        if not self.persist_file:
+            return
+        tmp_path = f"{self.persist_file}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.persist_file) or '.', exist_ok=True)
+            with open(tmp_path, 'w') as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_path, self.persist_file)
+        except (OSError, TypeError) as e:
+            logger.warning(f"failed to persist metadata cache {self.persist_file}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def stats(self) -> dict:
+        """stats(self) -> dict: hit/miss counters and entries per kind"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': {kind: len(entries) for kind, entries in self._entries.items()},
+            }
+
+
+class HeaderInternCache:
+    """
+    HeaderInternCache keeps the parsed key values of up to `max_entries` distinct debug header strings (least recently used dropped first),
+    so a header value seen in an earlier fetch, batch or refresh isn't parsed again. `expand_headers` parses each distinct string of a column once
+    and broadcasts the result to its rows, this cache only ever sees distinct strings.
+
+    Usage:
+    import catchpoint_helper as cp
+    cp.configure_header_cache(max_entries=50000)
+    http_status, test_data = cp.get_data(test_ids=test_ids)
+    cp.CP_HEADER_CACHE.stats()    #{'rows':..., 'distinct':..., 'hits':..., 'misses':..., 'hit_rate':..., 'entries':...}
+    """
+
+    def __init__(self, max_entries:int=CP_HEADER_CACHE_SIZE):
+        import threading
+        from collections import OrderedDict
+
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.rows = 0
+        self.distinct = 0
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, column, values) -> list:
+        """lookup(self, column, values) -> list: the cached (values tuple, malformed) of each distinct header string of `column` (a column name and its conversion spec), None where not cached"""
+        with self._lock:
+            found = []
+            for value in values:
+                entry = self._entries.get((column, value))
+                if entry is not None:
+                    self._entries.move_to_end((column, value))
+                found.append(entry)
+            misses = found.count(None)
+            self.hits += len(found) - misses
+            self.misses += misses
+            return found
+
+    def store(self, column, values, entries:list):
+        """store(self, column, values, entries:list): caches the (values tuple, malformed) entries of header strings of `column` (a column name and its conversion spec)"""
+        with self._lock:
+            for value, entry in zip(values, entries):
+                self._entries[(column, value)] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record(self, rows:int, distinct:int):
+        """record(self, rows:int, distinct:int): counts the rows of an expanded column and the distinct strings among them"""
+        with self._lock:
+            self.rows += rows
+            self.distinct += distinct
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """stats(self) -> dict: rows expanded, distinct strings among them, cache hits/misses of the distinct strings and entries kept"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'rows': self.rows,
+                'distinct': self.distinct,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+            }
+
+
+class ResultCache:
+    """
+    ResultCache keeps up to `max_entries` results of a TestData's `query`/`summary` calls taking up to `max_bytes` (least recently used dropped first).
+    Entries belong to one version of the data, a get or put with another version drops them all (`invalidations` counts that).
+    The version changes when a new frame is assigned to TestData.df, not when df is edited in place: `clear()` drops the results then.
+    Results are handed out as copies, changing one doesn't change the cached one.
+
+    Usage:
+    http_status, test_data = cp.get_data(test_ids=test_ids)
+    test_data.summary(stat='p50', group_by='host')
+    test_data.summary(stat='p50', group_by='host')    #from the cache
+    test_data.result_cache.stats()    #{'hits': 1, 'misses': 1, 'hit_rate': 0.5, ...}
+    """
+
+    def __init__(self, max_entries:int=CP_RESULT_CACHE_SIZE, max_bytes:int=CP_RESULT_CACHE_MAX_BYTES):
+        import threading
+        from collections import OrderedDict
+
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.version = None
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _check_version(self, version):
+        if version != self.version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self.bytes = 0
+            self.version = version
+
+    def get(self, key, version):
+        """get(self, key, version): a copy of the result cached for `key` and this version of the data, None if there is none"""
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        result, _ = entry
+        return result.copy() if isinstance(result, pd.DataFrame) else result
+
+    def put(self, key, version, result):
+        """put(self, key, version, result): caches a copy of a query/summary result (DataFrame or error string), unless it alone is over max_bytes"""
+        size = int(result.memory_usage(deep=True).sum()) if isinstance(result, pd.DataFrame) else len(str(result))
+        if size > self.max_bytes:
+            return
+        if isinstance(result, pd.DataFrame):
+            result = result.copy()
+        with self._lock:
+            self._check_version(version)
+            if key in self._entries:
+                self.bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (result, size)
+            self.bytes += size
+            while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+                _, (_, dropped) = self._entries.popitem(last=False)
+                self.bytes -= dropped
+
+    def clear(self):
+        """clear(self): drops all cached results, e.g. after the TestData's df was edited in place"""
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        """stats(self) -> dict: hits/misses, hit rate, invalidations, entries and bytes kept"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'invalidations': self.invalidations,
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+            }
+
+
+def _normalize_sql(sql:str) -> str:
+    """_normalize_sql(sql:str) -> str: sql with runs of whitespace outside quotes collapsed and no trailing ';', the result cache key of a query"""
+    import re
+    parts = re.split(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")""", sql.strip().rstrip(';').strip())
+    return ''.join(part if i % 2 else ' '.join(part.split()) for i, part in enumerate(parts))
+
+
+class QuantileSketch:
+    """
+    QuantileSketch(relative_accuracy:float=CP_SKETCH_ACCURACY, max_bins:int=CP_SKETCH_MAX_BINS) is a DDSketch of a metric's values:
+    values are counted in logarithmic buckets, any quantile is within `relative_accuracy` of the value at that rank, whatever the number of values.
+    count, sum, min and max are exact. Sketches of the same accuracy merge (`merge`) into the sketch of all their values,
+    `to_dict`/`from_dict` turn them into json serializable dicts and back. Beyond `max_bins` buckets the lowest ones are collapsed (their quantiles lose accuracy).
+
+    Usage:
+    sketch = cp.QuantileSketch()
+    sketch.add(test_data.df['ttfb_ms'])
+    sketch.merge(other_hour_sketch).quantile(0.95)
+    """
+
+    def __init__(self, relative_accuracy:float=CP_SKETCH_ACCURACY, max_bins:int=CP_SKETCH_MAX_BINS):
+        import math
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be between 0 and 1")
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        #bucket key -> count of positive values, of negative values by magnitude, and the count of (near) zero values
+        self.bins = {}
+        self.negative_bins = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.sum_squares = 0.0
+        self.min = float('nan')
+        self.max = float('nan')
+
+    def _keys(self, magnitudes):
+        import numpy as np
+        return np.ceil(np.log(magnitudes) / self._log_gamma).astype(np.int64)
+
+    def _value(self, key:int) -> float:
+        """_value(self, key:int) -> float: the value a bucket stands for, within relative_accuracy of all the values in it"""
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def add(self, values) -> 'QuantileSketch':
+        """add(self, values) -> QuantileSketch: adds an array-like (or a single value) of numbers, nulls are skipped"""
+        import numpy as np
+        values = pd.to_numeric(pd.Series(np.atleast_1d(values)), errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return self
+        self._add_parts(self._bin_counts(values[values > SKETCH_MIN_VALUE]),
+                        self._bin_counts(-values[values < -SKETCH_MIN_VALUE]),
+                        int((np.abs(values) <= SKETCH_MIN_VALUE).sum()),
+                        len(values), float(values.sum()), float((values ** 2).sum()), float(values.min()), float(values.max()))
+        return self
+
+    def _bin_counts(self, magnitudes) -> dict:
+        import numpy as np
+        keys, counts = np.unique(self._keys(magnitudes), return_counts=True)
+        return dict(zip(keys.tolist(), counts.tolist()))
+
+    def _add_parts(self, bins:dict, negative_bins:dict, zero_count:int, count:int, total:float, sum_squares:float, minimum:float, maximum:float):
+        import math
+        for store, added in ((self.bins, bins), (self.negative_bins, negative_bins)):
+            for key, key_count in added.items():
+                store[key] = store.get(key, 0) + key_count
+        self.zero_count += zero_count
+        self.count += count
+        self.sum += total
+        self.sum_squares += sum_squares
+        if count:
+            self.min = minimum if math.isnan(self.min) else min(self.min, minimum)
+            self.max = maximum if math.isnan(self.max) else max(self.max, maximum)
+        self._collapse()
+
+    def _collapse(self):
+        """_collapse(self): keeps at most max_bins buckets, the lowest values' buckets (most negative first) are merged into the next one"""
+        while len(self.bins) + len(self.negative_bins) > self.max_bins:
+            if self.negative_bins:
+                #the negative values of largest magnitude are the lowest
+                keys = sorted(self.negative_bins, reverse=True)
+                store = self.negative_bins
+            else:
+                keys = sorted(self.bins)
+                store = self.bins
+            if len(keys) < 2:
+                break
+            excess = min(len(self.bins) + len(self.negative_bins) - self.max_bins, len(keys) - 1)
+            into = keys[excess]
+            for key in keys[:excess]:
+                store[into] += store.pop(key)
+
+    def merge(self, other:'QuantileSketch') -> 'QuantileSketch':
+        """merge(self, other:QuantileSketch) -> QuantileSketch: adds the values of `other` (same relative_accuracy) in place, returns self"""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError(f"can't merge sketches of relative accuracy {other.relative_accuracy} and {self.relative_accuracy}")
+        self._add_parts(other.bins, other.negative_bins, other.zero_count, other.count, other.sum, other.sum_squares, other.min, other.max)
+        return self
+
+    def copy(self) -> 'QuantileSketch':
+        return QuantileSketch.from_dict(self.to_dict())
+
+    def quantile(self, q:float) -> float:
+        """quantile(self, q:float) -> float: the value at quantile q (0 to 1) within relative_accuracy, NaN for an empty sketch"""
+        if not 0 <= q <= 1:
+            raise ValueError(f"quantile {q} is not between 0 and 1")
+        if self.count == 0:
+            return float('nan')
+        rank = q * (self.count - 1)
+        seen = 0
+        value = None
+        for key in sorted(self.negative_bins, reverse=True):
+            seen += self.negative_bins[key]
+            if seen > rank:
+                value = -self._value(key)
+                break
+        if value is None:
+            seen += self.zero_count
+            if seen > rank:
+                value = 0.0
+        if value is None:
+            keys = sorted(self.bins)
+            for key in keys:
+                seen += self.bins[key]
+                if seen > rank:
+                    value = self._value(key)
+                    break
+            else:
+                value = self.max
+        return min(max(value, self.min), self.max)
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else float('nan')
+
+    @property
+    def std(self) -> float:
+        """sample standard deviation (ddof=1), from the exact sum and sum of squares"""
+        import math
+        if self.count < 2:
+            return float('nan')
+        return math.sqrt(max(self.sum_squares - self.sum ** 2 / self.count, 0.0) / (self.count - 1))
+
+    def to_dict(self) -> dict:
+        """to_dict(self) -> dict: json serializable dict of the sketch, `QuantileSketch.from_dict` makes it back"""
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'max_bins': self.max_bins,
+            'bins': [[key, count] for key, count in sorted(self.bins.items())],
+            'negative_bins': [[key, count] for key, count in sorted(self.negative_bins.items())],
+            'zero_count': self.zero_count,
+            'count': self.count,
+            'sum': self.sum,
+            'sum_squares': self.sum_squares,
+            'min': None if self.count == 0 else self.min,
+            'max': None if self.count == 0 else self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data:dict) -> 'QuantileSketch':
+        """from_dict(cls, data:dict) -> QuantileSketch: the sketch of a `to_dict` dict"""
+        sketch = cls(relative_accuracy=data['relative_accuracy'], max_bins=data.get('max_bins', CP_SKETCH_MAX_BINS))
+        sketch._add_parts({key: count for key, count in data['bins']}, {key: count for key, count in data['negative_bins']},
+                          data['zero_count'], data['count'], data['sum'], data['sum_squares'],
+                          float('nan') if data['min'] is None else data['min'], float('nan') if data['max'] is None else data['max'])
+        return sketch
+
+    def __repr__(self):
+        return f"QuantileSketch(count={self.count}, bins={len(self.bins) + len(self.negative_bins)}, relative_accuracy={self.relative_accuracy})"
+
+
+class ScrubPolicy:
+    """
+    ScrubPolicy declares which rows of test data are outliers or errors, and whether they stay in TestData.df or go to TestData.excluded_df.
+    Every row gets `is_outlier`/`is_error` flag columns, evaluated as boolean masks over the whole fetch (all batches and shards at once).
+
+    A row is an outlier when a metric value is >= the metric's threshold: `metric_thresholds[metric]` (None: never an outlier),
+    else the `percentile_thresholds[metric]` quantile (0-1) of the fetched values, else `outlier_threshold`.
+    A row is a potential outlier when it isn't one but a value is >= `potential_factor` * threshold.
+    A row that isn't an outlier is an error when one of the `error_rules` matches and none of the `error_exemptions` do,
+    rules are (metric name glob, operator, value) tuples, operators are the SCRUB_OPERATORS keys. Null values never match.
+
+    Usage:
+    policy = cp.ScrubPolicy(metric_thresholds={'dns_ms': 1000, 'cnt_ssl_failures': None},
+                            percentile_thresholds={'ttfb_ms': 0.99},
+                            inc_outliers=False)
+    http_status, test_data = cp.get_data(test_ids=test_ids, scrub_policy=policy)
+    test_data.scrub_counts    #{'rows':..., 'outliers':..., 'potential_outliers':..., 'errors':..., 'null_rows':..., 'excluded':...}
+    test_data.df[test_data.df['is_error']]
+    """
+
+    def __init__(self,
+                 outlier_threshold:float=OUTLIER_THRESHOLD,
+                 metric_thresholds:dict=None,
+                 percentile_thresholds:dict=None,
+                 potential_factor:float=POTENTIAL_OUTLIER_FACTOR,
+                 error_rules:list=None,
+                 error_exemptions:list=None,
+                 inc_outliers:bool=True,
+                 inc_errors:bool=True):
+        self.outlier_threshold = outlier_threshold
+        self.metric_thresholds = dict(metric_thresholds or {})
+        self.percentile_thresholds = dict(percentile_thresholds or {})
+        self.potential_factor = potential_factor
+        self.error_rules = [tuple(rule) for rule in (ERROR_RULES if error_rules is None else error_rules)]
+        self.error_exemptions = [tuple(rule) for rule in (ERROR_EXEMPTIONS if error_exemptions is None else error_exemptions)]
+        self.inc_outliers = inc_outliers
+        self.inc_errors = inc_errors
+        for metric, quantile in self.percentile_thresholds.items():
+            if not 0 < quantile <= 1:
+                raise ValueError(f"percentile threshold of {metric} must be in (0, 1], got {quantile}")
+        for pattern, op, value in self.error_rules + self.error_exemptions:
+            if op not in SCRUB_OPERATORS:
+                raise ValueError(f"unknown operator {op} in rule ({pattern}, {op}, {value}), use one of {list(SCRUB_OPERATORS)}")
+
+    def thresholds(self, values, metric_names:list) -> dict:
+        """thresholds(self, values, metric_names:list) -> dict: metric -> outlier threshold (None: not checked) for a float matrix of the metric values"""
+        import numpy as np
+
+        thresholds = {}
+        for i, name in enumerate(metric_names):
+            if name in self.metric_thresholds:
+                thresholds[name] = self.metric_thresholds[name]
+            elif name in self.percentile_thresholds:
+                present = values[:, i][~np.isnan(values[:, i])]
+                thresholds[name] = float(np.quantile(present, self.percentile_thresholds[name])) if len(present) else None
+            else:
+                thresholds[name] = self.outlier_threshold
+        return thresholds
+
+    @staticmethod
+    def _rules_mask(values, metric_names:list, rules:list):
+        """_rules_mask(values, metric_names:list, rules:list): rows where any rule matches a (non null) metric value"""
+        import numpy as np
+        from fnmatch import fnmatch
+
+        mask = np.zeros(len(values), dtype=bool)
+        with np.errstate(invalid='ignore'):
+            for pattern, op, value in rules:
+                for i, name in enumerate(metric_names):
+                    if fnmatch(name, pattern):
+                        mask |= SCRUB_OPERATORS[op](values[:, i], value) & ~np.isnan(values[:, i])
+        return mask
+
+    def evaluate(self, df:pd.DataFrame, metric_names:list) -> dict:
+        """
+        evaluate(self, df:pd.DataFrame, metric_names:list) -> dict:
+        row masks 'is_outlier', 'is_potential_outlier', 'is_error', 'has_null' and the 'thresholds' used, for the metric columns of df.
+        """
+        import numpy as np
+
+        metric_names = [name for name in metric_names if name in df.columns]
+        values = df[metric_names].to_numpy(dtype=np.float64, na_value=np.nan) if metric_names else np.empty((len(df), 0))
+        thresholds = self.thresholds(values, metric_names)
+        limits = np.array([np.nan if thresholds[name] is None else thresholds[name] for name in metric_names], dtype=np.float64)
+        with np.errstate(invalid='ignore'):
+            is_outlier = (values >= limits).any(axis=1)
+            is_potential_outlier = (values >= limits * self.potential_factor).any(axis=1) & ~is_outlier
+        is_error = self._rules_mask(values, metric_names, self.error_rules) & ~self._rules_mask(values, metric_names, self.error_exemptions) & ~is_outlier
+        return {
+            'is_outlier': is_outlier,
+            'is_potential_outlier': is_potential_outlier,
+            'is_error': is_error,
+            'has_null': np.isnan(values).any(axis=1),
+            'thresholds': thresholds,
+        }
+
+    def apply(self, df:pd.DataFrame, metric_names:list) -> tuple:
+        """
+        apply(self, df:pd.DataFrame, metric_names:list) -> tuple: (df, excluded_df, counts)
+        flags every row of df (SCRUB_FLAG_COLUMNS, replaced if already there) and splits off the outliers/errors that aren't included.
+        counts has rows, outliers, potential_outliers, errors, null_rows and excluded.
+        """
+        masks = self.evaluate(df, metric_names)
+        df = df.drop(columns=[name for name in SCRUB_FLAG_COLUMNS if name in df.columns])
+        df['is_outlier'] = masks['is_outlier']
+        df['is_error'] = masks['is_error']
+        excluded = (masks['is_outlier'] & (not self.inc_outliers)) | (masks['is_error'] & (not self.inc_errors))
+        counts = {
+            'rows': len(df),
+            'outliers': int(masks['is_outlier'].sum()),
+            'potential_outliers': int(masks['is_potential_outlier'].sum()),
+            'errors': int(masks['is_error'].sum()),
+            'null_rows': int(masks['has_null'].sum()),
+            'excluded': int(excluded.sum()),
+        }
+        logger.debug(f"Outlier thresholds: {masks['thresholds']}")
+        logger.debug(f"Outliers found: {'(Included)' if self.inc_outliers else '(Excluded)'}: {counts['outliers']}")
+        logger.debug(f"Failures found: {'(Included)' if self.inc_errors else '(Excluded)'}: {counts['errors']}")
+        logger.debug(f"Total data points excluded: {counts['excluded']}")
+        logger.debug(f"Potential outliers(included): {counts['potential_outliers']}")
+        logger.debug(f"Null metric valuies count {counts['null_rows']}")
+        if not excluded.any():
+            return df, df.iloc[:0], counts
+        return df[~excluded].reset_index(drop=True), df[excluded].reset_index(drop=True), counts
+
+
+class QueryEngine:
+    """
+    QueryEngine(backend:str=None): the SQL engine of a TestData, its df is loaded once as table `data` and queried until the TestData's version changes.
+    backend 'sqlite' (default CP_QUERY_BACKEND) copies df into an in-memory database with indexes on the QUERY_INDEX_COLUMNS it has,
+    'duckdb' registers df with an in-memory duckdb connection and queries it in place, it falls back to sqlite when duckdb isn't installed.
+    `loads` counts the times the data was (re)loaded.
+    """
+    def __init__(self, backend:str=None):
+        import threading
+        backend = backend or CP_QUERY_BACKEND
+        if backend not in QUERY_BACKENDS:
+            raise ValueError(f"Unsupported query backend {backend}, use one of {QUERY_BACKENDS}")
+        if backend == 'duckdb':
+            try:
+                import duckdb
+            except ImportError:
+                logger.warning("duckdb is not installed, querying with sqlite")
+                backend = 'sqlite'
+        self.backend = backend
+        self.conn = None
+        self.version = None
+        self.loads = 0
+        self._lock = threading.Lock()
+
+    def _load(self, df:pd.DataFrame, version):
+        """_load(self, df:pd.DataFrame, version): (re)loads df as table `data`"""
+        self._close()
+        if self.backend == 'duckdb':
+            import duckdb
+            self.conn = duckdb.connect(':memory:')
+            self.conn.register('data', df)
+        else:
+            self.conn = sqlite3.connect(':memory:', check_same_thread=False)
+            df.to_sql('data', self.conn, index=False)
+            for name in QUERY_INDEX_COLUMNS:
+                if name in df.columns:
+                    self.conn.execute(f'CREATE INDEX "idx_{name}" ON data ("{name}")')
+            self.conn.commit()
+        self.version = version
+        self.loads += 1
+        logger.debug(f"loaded {len(df)} rows into {self.backend}, load {self.loads}")
+
+    def query(self, sql:str, df:pd.DataFrame, version) -> pd.DataFrame:
+        """query(self, sql:str, df:pd.DataFrame, version) -> pd.DataFrame: runs sql on table `data`, loading df first if `version` isn't the loaded one. Errors are returned as strings, like `sql_query`."""
+        logger.debug('---')
+        errors = (sqlite3.Error, pd.errors.DatabaseError)
+        if self.backend == 'duckdb':
+            import duckdb
+            errors = (duckdb.Error,)
+        with self._lock:
+            try:
+                if self.conn is None or self.version != version:
+                    self._load(df, version)
+                if self.backend == 'duckdb':
+                    sub_df = self.conn.execute(sql).df()
+                else:
+                    sub_df = pd.read_sql_query(sql, self.conn)
+                if sub_df.empty:
+                    sub_df = "Query did not return any rows"
+            except errors as e:
+                sub_df = f"{self.backend} error {e}"
+            except Exception as e:
+                sub_df = f"unexpected error {e}"
+        return sub_df
+
+    def _close(self):
+        if self.conn is not None:
+            self.conn.close()
+        self.conn = None
+        self.version = None
+
+    def close(self):
+        """close(self): drops the loaded data, the next query loads it again"""
+        with self._lock:
+            self._close()
+
+
+class Selection:
+    """
+    Selection is a lazy filter/projection of a TestData's df, made by `TestData.select(*columns)` and `TestData.where(**conditions)`
+    and chained with more `select`/`where` calls (each returns a new Selection, conditions are ANDed). Nothing is evaluated until
+    `data_frame`, `count` or `summary`, then every condition is a vectorized mask over df's columns: on a categorical column the condition
+    is evaluated on its categories and broadcast through the codes. No SQL, no copy of df into a database.
+    Conditions are column=value or column__operator=value, operators are the keys of WHERE_OPERATORS.
+
+    Usage:
+    selection = test_data.select('host', 'ttfb_ms').where(country='Japan', test__in=['test1', 'test2'], ttfb_ms__gt=500)
+    selection.summary(stat='p50', group_by='host')
+    selection.data_frame()
+    """
+
+    def __init__(self, test_data:'TestData', columns:list=None, conditions:list=None):
+        self.test_data = test_data
+        self.columns = columns
+        self.conditions = conditions or []
+
+    def select(self, *columns) -> 'Selection':
+        """select(self, *columns) -> Selection: only these columns (group_by columns of `summary` are always kept)"""
+        return Selection(self.test_data, list(columns), self.conditions)
+
+    def where(self, **conditions) -> 'Selection':
+        """where(self, **conditions) -> Selection: rows that also match every condition, column=value or column__operator=value"""
+        parsed = []
+        for lookup, value in conditions.items():
+            column, operator = lookup, 'eq'
+            if '__' in lookup and lookup.rsplit('__', 1)[1] in WHERE_OPERATORS:
+                column, operator = lookup.rsplit('__', 1)
+            parsed.append((column, operator, value))
+        return Selection(self.test_data, self.columns, self.conditions + parsed)
+
+    def _names(self) -> list:
+        return [column for column, _, _ in self.conditions] + (self.columns or [])
+
+    def _conditions_key(self) -> tuple:
+        """_conditions_key(self) -> tuple: the conditions as a hashable result cache key, list-likes by all their values, None if a value isn't hashable"""
+        import numpy as np
+
+        def value_key(value):
+            if isinstance(value, (list, tuple, np.ndarray, pd.Series, pd.Index)):
+                return (type(value).__name__, tuple(value_key(item) for item in value))
+            if isinstance(value, (set, frozenset)):
+                return (type(value).__name__, frozenset(value_key(item) for item in value))
+            hash(value)
+            return value
+
+        try:
+            return tuple((column, operator, value_key(value)) for column, operator, value in self.conditions)
+        except TypeError:
+            return None
+
+    def mask(self):
+        """mask(self) -> numpy bool array: the df rows matching all conditions"""
+        import numpy as np
+        self.test_data.materialize(*self._names())
+        df = self.test_data.df
+        mask = np.ones(len(df), dtype=bool)
+        for column, operator, value in self.conditions:
+            if column not in df.columns:
+                raise ValueError(f"No such column {column}, conditions are column=value or column__operator=value with operators {list(WHERE_OPERATORS)}")
+            values = df[column]
+            if isinstance(values.dtype, pd.CategoricalDtype) and operator != 'isnull':
+                #evaluated once per category, codes -1 (null) match nothing
+                matches = np.append(_bool_mask(WHERE_OPERATORS[operator](pd.Series(values.cat.categories), value)), False)
+                mask &= matches[values.cat.codes.to_numpy()]
+            else:
+                mask &= _bool_mask(WHERE_OPERATORS[operator](values, value))
+        return mask
+
+    def data_frame(self, extra_columns:list=None) -> pd.DataFrame:
+        """data_frame(self, extra_columns:list=None) -> pd.DataFrame: the selected rows and columns (plus `extra_columns`), with a 0 based index"""
+        self.test_data.materialize(*self._names(), *(extra_columns or []))
+        df = self.test_data.df
+        columns = list(df.columns) if self.columns is None else list(self.columns)
+        columns = [name for name in (extra_columns or []) if name not in columns] + columns
+        missing = [name for name in columns if name not in df.columns]
+        if missing:
+            raise ValueError(f"No such column {missing}")
+        mask = self.mask() if self.conditions else None
+        selected = df[columns] if mask is None else df.loc[mask, columns]
+        return selected.reset_index(drop=True)
+
+    def count(self) -> int:
+        """count(self) -> int: number of rows matching the conditions"""
+        return int(self.mask().sum())
+
+    def __len__(self):
+        return self.count()
+
+    def summary(self, stat:str='p95', group_by='test', stats:list=None, approx:bool=False) -> pd.DataFrame:
+        """
+        summary(self, stat:str='p95', group_by='test', stats:list=None, approx:bool=False) -> pd.DataFrame: `TestData.summary` of the selected rows,
+        of the selected metrics (all of them if no metric was selected). Memoized in the TestData's `result_cache`.
+        """
+        keys = [group_by] if isinstance(group_by, str) else list(group_by)
+        metrics = [name for name in (self.columns or []) if name in self.test_data.metrics] or self.test_data.metrics
+        self.test_data.materialize(*self._names(), *keys)
+        cache = self.test_data.result_cache
+        conditions_key = self._conditions_key()
+        if conditions_key is None:
+            cache = None
+        key = ('selection', conditions_key, tuple(metrics), tuple(keys), stat, tuple(stats) if stats is not None else None, approx)
+        if cache is not None:
+            result = cache.get(key, self.test_data._data_version())
+            if result is not None:
+                return result
+        sub_df = Selection(self.test_data, keys + metrics, self.conditions).data_frame()
+        if sub_df.empty:
+            result = "Query did not return any rows"
+            logger.error(result)
+        elif approx:
+            result = sketch_summary(build_sketches(sub_df, group_by=group_by, metrics=metrics), stat=stat, stats=stats, names=keys)
+        else:
+            result = get_summary(sub_df, stat=stat, group_by=group_by, stats=stats)
+        if cache is not None:
+            cache.put(key, self.test_data._data_version(), result)
+        return result
+
+    def __repr__(self):
+        conditions = ", ".join(f"{column}__{operator}={value!r}" for column, operator, value in self.conditions)
+        return f"Selection(columns={self.columns}, where=[{conditions}])"
+
+
+def _bool_mask(values):
+    """_bool_mask(values) -> numpy bool array: a comparison result as bools, nulls (nullable/pyarrow comparisons) as False"""
+    if hasattr(values, 'to_numpy'):
+        return values.to_numpy(dtype=bool, na_value=False)
+    import numpy as np
+    return np.asarray(values, dtype=bool)
+
+
+CP_RATE_LIMITER = RateLimiter()
+CP_CLIENT = CatchpointClient()
+CP_ASYNC_CLIENT = AsyncCatchpointClient()
+CP_CACHE = ResponseCache()
+CP_METADATA_CACHE = MetadataCache()
+CP_SCRUB_POLICY = ScrubPolicy()
+CP_HEADER_CACHE = HeaderInternCache()
+
+
+def configure_client(pool_size:int=None, timeout=None, base_url:str=None) -> CatchpointClient:
+    """
+    configure_client(pool_size:int=None, timeout=None, base_url:str=None) -> CatchpointClient:
+    replaces the shared `CP_CLIENT` with a new one, arguments not provided are carried over from the current client.
+    """
+    global CP_CLIENT
+    old_client = CP_CLIENT
+    CP_CLIENT = CatchpointClient(
+        pool_size=pool_size if pool_size is not None else old_client.pool_size,
+        timeout=timeout if timeout is not None else old_client.timeout,
+        base_url=base_url if base_url is not None else old_client.base_url,
+        rate_limiter=old_client.rate_limiter,
+    )
+    old_client.close()
+    return CP_CLIENT
+
+
+def configure_rate_limiter(state_file:str=None) -> RateLimiter:
+    """
+    configure_rate_limiter(state_file:str=None) -> RateLimiter:
+    replaces the shared `CP_RATE_LIMITER`, pass the same `state_file` in every process that should share one api budget.
+    """
+    global CP_RATE_LIMITER
+    CP_RATE_LIMITER = RateLimiter(state_file=state_file)
+    return CP_RATE_LIMITER
+
+
+def configure_cache(cache_dir:str=CP_CACHE_DIR, max_bytes:int=CP_CACHE_MAX_BYTES, open_ttl:int=CP_CACHE_OPEN_TTL, enabled:bool=True):
+    """
+    configure_cache(cache_dir:str=CP_CACHE_DIR, max_bytes:int=CP_CACHE_MAX_BYTES, open_ttl:int=CP_CACHE_OPEN_TTL, enabled:bool=True):
+    replaces the shared response cache `CP_CACHE`, `enabled=False` turns caching off for every call.
+    """
+    global CP_CACHE
+    CP_CACHE = ResponseCache(cache_dir=cache_dir, max_bytes=max_bytes, open_ttl=open_ttl) if enabled else None
+    return CP_CACHE
+
+
+def configure_metadata_cache(ttl:dict=None, persist_file:str=None, enabled:bool=True) -> MetadataCache:
+    """
+    configure_metadata_cache(ttl:dict=None, persist_file:str=None, enabled:bool=True) -> MetadataCache:
+    replaces the shared `CP_METADATA_CACHE`, `ttl` overrides CP_METADATA_TTL per kind, `persist_file` keeps entries across restarts.
+    """
+    global CP_METADATA_CACHE
+    CP_METADATA_CACHE = MetadataCache(ttl=ttl, persist_file=persist_file) if enabled else None
+    return CP_METADATA_CACHE
+
+
+def configure_header_cache(max_entries:int=CP_HEADER_CACHE_SIZE, enabled:bool=True) -> HeaderInternCache:
+    """
+    configure_header_cache(max_entries:int=CP_HEADER_CACHE_SIZE, enabled:bool=True) -> HeaderInternCache:
+    replaces the shared `CP_HEADER_CACHE` of parsed debug header strings, `enabled=False` parses every fetch's distinct strings again.
+    """
+    global CP_HEADER_CACHE
+    CP_HEADER_CACHE = HeaderInternCache(max_entries=max_entries) if enabled else None
+    return CP_HEADER_CACHE
+
+
+def configure_result_cache(max_entries:int=CP_RESULT_CACHE_SIZE, max_bytes:int=CP_RESULT_CACHE_MAX_BYTES, enabled:bool=True):
+    """
+    configure_result_cache(max_entries:int=CP_RESULT_CACHE_SIZE, max_bytes:int=CP_RESULT_CACHE_MAX_BYTES, enabled:bool=True):
+    sets the size of the ResultCache each TestData creates from now on, `enabled=False` runs every query/summary call.
+    """
+    global CP_RESULT_CACHE_SIZE, CP_RESULT_CACHE_MAX_BYTES, CP_RESULT_CACHE_ENABLED
+    CP_RESULT_CACHE_SIZE = max_entries
+    CP_RESULT_CACHE_MAX_BYTES = max_bytes
+    CP_RESULT_CACHE_ENABLED = enabled
+
+
+def configure_query_backend(backend:str='sqlite') -> str:
+    """configure_query_backend(backend:str='sqlite') -> str: sets `CP_QUERY_BACKEND`, the backend of the query engines TestData objects create from now on (see `QueryEngine`)"""
+    global CP_QUERY_BACKEND
+    if backend not in QUERY_BACKENDS:
+        raise ValueError(f"Unsupported query backend {backend}, use one of {QUERY_BACKENDS}")
+    CP_QUERY_BACKEND = backend
+    return CP_QUERY_BACKEND
+
+
+def configure_scrub_policy(policy:ScrubPolicy=None, **kwargs) -> ScrubPolicy:
+    """
+    configure_scrub_policy(policy:ScrubPolicy=None, **kwargs) -> ScrubPolicy:
+    replaces the shared `CP_SCRUB_POLICY` used when get_data is called without a scrub_policy, with `policy` or a ScrubPolicy(**kwargs).
+    """
+    global CP_SCRUB_POLICY
+    CP_SCRUB_POLICY = policy if policy is not None else ScrubPolicy(**kwargs)
+    return CP_SCRUB_POLICY
 
 
 class TestData:
@@ -79,10 +1710,26 @@ class TestData:
        
     query(self, sql:str, conn:sqlite3.Connection=None) -> pd.DataFrame:
         Executes an SQL query on the test data and returns the result as a pandas DataFrame.
+        The data is loaded into the `query_engine` (sqlite, or duckdb see `configure_query_backend`) on the first query and reused until it changes.
     
-    summary(self, sql=None, stat:str='p95', group_by='test') -> pd.DataFrame:
+    summary(self, sql=None, stat:str='p95', group_by='test', stats:list=None) -> pd.DataFrame:
         Returns a summary of the test data as a pandas dataframe, grouped by the provided dimension and calculated with the provided statistic. 
         If an SQL query is provided, it is used to filter the data before calculating the summary.
+        With `stats=['p50', 'p95', 'p99', 'mean', 'count', 'std']` and/or `group_by=['country', 'host']` every stat is computed in one grouped pass,
+        columns are a (metric, stat) MultiIndex: summary['ttfb_ms']['p95'], summary.stack('metric') for a row per group and metric.
+        `approx=True` answers from mergeable quantile sketches instead of the rows.
+
+    select(self, *columns) -> Selection:
+    where(self, **conditions) -> Selection:
+        Lazy filter/projection without SQL, evaluated as vectorized masks by its `data_frame`, `count` or `summary`:
+        test_data.select('host', 'ttfb_ms').where(country='Japan', ttfb_ms__gt=500).summary(stat='p50', group_by='host')
+
+    sketches(self, group_by='test', relative_accuracy:float=CP_SKETCH_ACCURACY) -> dict:
+        {group: {metric: QuantileSketch}} of the test data. Sketches of several fetches merge (`merge_sketches`) into the sketches of all their rows,
+        `dump_sketches`/`load_sketches` save and load them, `sketch_summary` summarizes them like `summary`.
+        query and summary results are kept in `result_cache` until the data changes (append, refresh, expire, scrub...), `result_cache.stats()` has its hit rate.
+        Edits of df in place (test_data.df.loc[...] = ..., drop(..., inplace=True)) aren't seen: `test_data.result_cache.clear()` drops the cached results,
+        assigning the frame back (`test_data.df = test_data.df`) also reloads the query engine and sketches.
 
     data_frame(self) -> pd.DataFrame:
         Converts the test data to a pandas DataFrame and returns it.
@@ -90,35 +1737,66 @@ class TestData:
     to_html(self) -> str:
         Converts the test data to an HTML table and returns it as a string.
 
-    to_csv(self) -> str:
-        Converts the test data to a CSV string and returns it.
+    to_csv(self, file_path=None):
+        Converts the test data to a CSV string and returns it, or saves it as a CSV file at `file_path` and returns `True` if successful, `False` otherwise.
+
+    to_parquet(self, file_path, compression:str='zstd') -> bool:
+        Saves the test data, excluded rows and metadata as a parquet file. `TestData.from_parquet(file_path)` loads it back (memory mapped).
+
+    to_ipc(self, file_path) -> bool:
+        Saves it as an uncompressed Arrow IPC file instead, `TestData.from_ipc(file_path)` and other Arrow tools read it memory mapped without copying.
 
-    to_csv(self, file_path) -> bool:
-        Saves the test data as a CSV file at the provided file path. Returns `True` if successful, `False` otherwise.
+    iter_batches(self, rows:int=CP_BATCH_ROWS, columns:list=None, excluded:bool=False):
+        Yields the test data `rows` rows at a time as typed DataFrame slices, see also `get_data_stream`.
 
     data(self) -> dict:
         Converts the test data to a dictionary and returns it.
 
+    The data is kept once, in `df`. `rows`, `columns` and `excluded_rows` are built from it on access,
+    the raw api response is only kept (`response_data`) when fetched with keep_response=True.
+    With get_data(compact=True) (default) df uses categorical dimensions and nullable Int32/Float32 metrics and header values,
+    `memory_report` tells how much that saved.
+    Rows are flagged by the fetch's ScrubPolicy (`scrub_policy`) in the `is_outlier`/`is_error` columns, the ones it doesn't include are in
+    `excluded_df`, `scrub_counts` counts them. `scrub(policy)` re-evaluates all rows with another policy.
+    Debug header tracepoints (the eager ones of TRACEPOINT_REGISTRY) are expanded into typed columns, `header_errors` counts the malformed values set to null per header.
+    Other tracepoints (kv or json) keep their raw column, their {tracepoint}_{key} columns are added to df when `query`/`summary` use them
+    or by `materialize`. `lazy_tracepoints` lists them, `tracepoint_columns` the columns they have.
    
     """
         
 
     def __init__(self, test_data:dict):
-        """ __init__(self, test_data:dict):  init from a dictionary of catchpoint test data."""
+        """ __init__(self, test_data:dict):  init from a dictionary of catchpoint test data, rows come from 'frame' (a DataFrame) or 'rows' (a list of lists)."""
        
-        self.df = pd.DataFrame(test_data['rows'], columns=test_data['columns'])
-        hdrs = list(DBG_HDR_DICT.keys())
-        for hdr in hdrs:
-            if hdr in test_data['tracepoint_names']:
-                self.df = extract_and_combine(self.df)
-                break
+        if 'frame' in test_data:
+            self.df = test_data['frame']
+        else:
+            self.df = pd.DataFrame(test_data['rows'], columns=test_data['columns'])
+        #already expanded when extracted in worker processes
+        self.header_errors = dict(test_data.get('header_errors', {}))
+        if any(hdr in self.df.columns for hdr in _eager_headers()):
+            self.df, self.header_errors = expand_headers(self.df)
        
-        self.columns = list(self.df.columns)
-        self.rows = self.df.values.tolist()
         self.dimensions = test_data['dimension_names']
         self.metrics = test_data['metric_names']
         self.tracepoints = test_data['tracepoint_names']
-        self.excluded_rows = test_data['excluded_rows']
+        if 'excluded_frame' in test_data:
+            self.excluded_df = test_data['excluded_frame']
+        else:
+            self.excluded_df = pd.DataFrame(test_data.get('excluded_rows', []), columns=test_data['columns'], dtype=object)
+        if any(hdr in self.excluded_df.columns for hdr in _eager_headers()):
+            self.excluded_df, excluded_errors = expand_headers(self.excluded_df)
+            for hdr, count in excluded_errors.items():
+                self.header_errors[hdr] = self.header_errors.get(hdr, 0) + count
+        self.scrub_policy = test_data.get('scrub_policy')
+        self.scrub_counts = test_data.get('scrub_counts')
+        #lazy tracepoint columns added to df, and the parsed distinct values of their tracepoints
+        self._materialized = []
+        self._tracepoint_cache = {}
+        self.compacted = False
+        self.memory_report = None
+        if test_data.get('compact', False):
+            self.compact()
         self.test_ids = test_data['test_ids']
         self.start_time = test_data['start_time']
         self.end_time = test_data['end_time']
@@ -127,18 +1805,266 @@ class TestData:
         self.dimension_ids = test_data['dimension_ids']
         self.sub_source_ids = test_data['sub_source_ids']
         self.tracepoints_ids = test_data['tracepoints_ids']
-        self.response_data = test_data['response_data']
+        self.response_data = test_data.get('response_data')
+        self.data_type = test_data.get('data_type', 'aggregated')
+        self._query_engine = None
+        self._result_cache = None
+        self._sketch_cache = (None, {})
+
+    @property
+    def df(self) -> pd.DataFrame:
+        """the included rows, assigning a new frame bumps `version`"""
+        return self._df
+
+    @df.setter
+    def df(self, df:pd.DataFrame):
+        self._df = df
+        self.version = getattr(self, 'version', 0) + 1
+
+    @property
+    def query_engine(self) -> QueryEngine:
+        """the QueryEngine `query` runs on, created on first use"""
+        if self._query_engine is None:
+            self._query_engine = QueryEngine()
+        return self._query_engine
+
+    @property
+    def result_cache(self) -> ResultCache:
+        """the ResultCache of `query`/`summary` results, created on first use, None when disabled (see `configure_result_cache`)"""
+        if self._result_cache is None and CP_RESULT_CACHE_ENABLED:
+            self._result_cache = ResultCache(max_entries=CP_RESULT_CACHE_SIZE, max_bytes=CP_RESULT_CACHE_MAX_BYTES)
+        return self._result_cache
+
+    def _data_version(self) -> tuple:
+        """_data_version(self) -> tuple: changes whenever df does, the query engine and result cache are valid for one"""
+        return (self.version, tuple(self.df.columns))
+
+    @property
+    def columns(self) -> list:
+        """column names of `df`"""
+        return list(self.df.columns)
+
+    @property
+    def rows(self) -> list:
+        """rows of `df` as lists (None for nulls), built on every access"""
+        return _object_rows(self.df)
+
+    @property
+    def excluded_rows(self) -> list:
+        """rows left out as outliers/errors as lists (None for nulls), built on every access"""
+        return _object_rows(self.excluded_df)
+
+    def compact(self) -> dict:
+        """compact(self) -> dict: converts df to compact dtypes in place (see `compact_dtypes`), returns and keeps the memory report in `memory_report`"""
+        self.df, self.memory_report = compact_dtypes(self.df, dimensions=self.dimensions, metrics=self.metrics)
+        self.compacted = True
+        logger.debug(f"compact dtypes saved {self.memory_report['bytes_saved'] / 2**20:.1f} MB "
+                     f"({self.memory_report['bytes_before'] / 2**20:.1f} -> {self.memory_report['bytes_after'] / 2**20:.1f} MB)")
+        return self.memory_report
+
+    def scrub(self, policy:ScrubPolicy) -> dict:
+        """scrub(self, policy:ScrubPolicy) -> dict: re-flags df and excluded_df rows with `policy` in place (see `ScrubPolicy.apply`), returns the new `scrub_counts`"""
+        df = self.df
+        if not self.excluded_df.empty:
+            excluded_df = self.excluded_df.reindex(columns=df.columns)
+            df = pd.concat([df, excluded_df], ignore_index=True) if not df.empty else excluded_df
+        self.df, self.excluded_df, self.scrub_counts = policy.apply(df, self.metrics)
+        self.scrub_policy = policy
+        self._tracepoint_cache = {}
+        if self.compacted:
+            self.df, _ = compact_dtypes(self.df, dimensions=self.dimensions, metrics=self.metrics)
+        return self.scrub_counts
+
+    @property
+    def lazy_tracepoints(self) -> dict:
+        """{tracepoint column: 'kv' or 'json'} of the raw tracepoint columns of df whose key columns are added on use"""
+        eager = _eager_headers()
+        found = {}
+        for name in self.tracepoints:
+            if name in self.df.columns and name not in eager:
+                format = _tracepoint_format(name, self.df[name])
+                if format is not None:
+                    found[name] = format
+        return found
+
+    def _parsed_tracepoint(self, name:str, format:str) -> dict:
+        """_parsed_tracepoint(self, name:str, format:str) -> dict: factorize codes, parsed distinct values and column names of a lazy tracepoint, kept until rows change"""
+        if name not in self._tracepoint_cache:
+            codes, uniques = pd.factorize(self.df[name].astype(object))
+            columns = TRACEPOINT_REGISTRY.get(name, {}).get('columns')
+            parsed, malformed = _parse_tracepoint_values(name, uniques, format, columns)
+            if malformed:
+                logger.warning(f"{malformed} malformed {name} values")
+            names = {}
+            for values in parsed:
+                names.update(dict.fromkeys(values))
+            self._tracepoint_cache[name] = {'codes': codes, 'parsed': parsed, 'columns': list(names), 'malformed': malformed}
+        return self._tracepoint_cache[name]
+
+    def tracepoint_columns(self, name:str) -> list:
+        """tracepoint_columns(self, name:str) -> list: the key columns a lazy tracepoint has (parses its distinct values), see `materialize`"""
+        format = self.lazy_tracepoints.get(name)
+        if format is None:
+            raise ValueError(f"No lazy tracepoint {name}, lazy tracepoints: {list(self.lazy_tracepoints)}")
+        return self._parsed_tracepoint(name, format)['columns']
+
+    def materialize(self, *names) -> list:
+        """
+        materialize(self, *names) -> list: adds the lazy tracepoint columns `names` to df, returns the ones added.
+        Names already in df or that aren't a column of a lazy tracepoint are skipped. Done by `query` and `summary` for the columns they use.
+        """
+        lazy = self.lazy_tracepoints
+        added = []
+        for name in names:
+            if name in self.df.columns or name in added:
+                continue
+            for tracepoint in sorted(lazy, key=len, reverse=True):
+                columns = TRACEPOINT_REGISTRY.get(tracepoint, {}).get('columns') or {}
+                column_types = {column: column_type for column, column_type in columns.values()}
+                if not (name.startswith(f"{tracepoint}_") or name in column_types):
+                    continue
+                parsed = self._parsed_tracepoint(tracepoint, lazy[tracepoint])
+                if name in parsed['columns']:
+                    self.df[name] = _tracepoint_values([values.get(name) for values in parsed['parsed']], parsed['codes'], self.df.index, column_types.get(name))
+                    added.append(name)
+                    break
+        if added:
+            logger.debug(f"materialized tracepoint columns {added}")
+            if self.compacted:
+                compacted, _ = compact_dtypes(self.df[added])
+                for name in added:
+                    self.df[name] = compacted[name]
+            self._materialized.extend(added)
+            self.version += 1
+        return added
+
+    def _materialize_sql(self, sql:str) -> list:
+        """_materialize_sql(self, sql:str) -> list: materializes the lazy tracepoint columns named in sql"""
+        import re
+        return self.materialize(*re.findall(r'[A-Za-z_][A-Za-z0-9_]*', sql))
+
+    def time_column(self):
+        """time_column(self): name of the time dimension, None if the data was fetched without one"""
+        for name in TIME_DIMENSIONS:
+            if name in self.dimensions and name in self.df.columns:
+                return name
+        return None
+
+    def append(self, other:'TestData'):
+        """
+        append(self, other:'TestData'): appends the rows of a later fetch in place and moves end_time forward.
+        Rows (included or excluded) at or after the first time of `other` are replaced, so a partial aggregation bucket fetched last time gets its final values.
+        `scrub_counts` are recounted for the rows kept.
+        """
+        time_column = self.time_column()
+        new_start = None
+        if time_column is not None:
+            #the first time of the new rows, included or not
+            starts = [_to_datetime(frame[time_column]).min() for frame in (other.df, other.excluded_df) if time_column in frame.columns and not frame.empty]
+            starts = [start for start in starts if pd.notna(start)]
+            new_start = min(starts) if starts else None
+        if new_start is not None:
+            keep = ~(_to_datetime(self.df[time_column]) >= new_start)
+            if not keep.all():
+                self.df = self.df[keep]
+            if time_column in self.excluded_df.columns and not self.excluded_df.empty:
+                keep = ~(_to_datetime(self.excluded_df[time_column]) >= new_start)
+                if not keep.all():
+                    self.excluded_df = self.excluded_df[keep].reset_index(drop=True)
+
+        #lazy tracepoint columns are added again for all rows
+        materialized = self._materialized + [name for name in other._materialized if name not in self._materialized]
+        self.df = pd.concat([self.df.drop(columns=self._materialized), other.df.drop(columns=other._materialized)], ignore_index=True)
+        self._materialized = []
+        self._tracepoint_cache = {}
+        if self.compacted:
+            #categoricals with different categories concat to object columns
+            self.df, _ = compact_dtypes(self.df, dimensions=self.dimensions, metrics=self.metrics)
+        self.materialize(*materialized)
+        if not other.excluded_df.empty:
+            self.excluded_df = pd.concat([self.excluded_df, other.excluded_df], ignore_index=True) if not self.excluded_df.empty else other.excluded_df
+        if self.scrub_counts is not None:
+            #replaced rows are no longer counted
+            self.scrub_counts = self._recount_scrubbed()
+        for test_id in other.test_ids:
+            if test_id not in self.test_ids:
+                self.test_ids.append(test_id)
+        self.end_time = other.end_time
+        #the raw response of the latest fetch only, keeping all of them would grow without bound
+        if other.response_data is not None:
+            self.response_data = other.response_data
+
+    def expire(self, retention_hours:float):
+        """expire(self, retention_hours:float): drops rows and excluded rows older than `retention_hours` before end_time, recounts `scrub_counts` and moves start_time forward"""
+        time_column = self.time_column()
+        if time_column is None:
+            logger.warning(f"no time dimension in {self.dimensions}, can't expire rows")
+            return
+        start = datetime.strptime(self.end_time, '%Y-%m-%dT%H:%M:%S') - timedelta(hours=retention_hours)
+        keep = ~(_to_datetime(self.df[time_column]) < pd.Timestamp(start))
+        if not keep.all():
+            logger.debug(f"expiring {(~keep).sum()} rows older than {start}")
+            self.df = self.df[keep].reset_index(drop=True)
+            self._tracepoint_cache = {}
+        expired_excluded = False
+        if time_column in self.excluded_df.columns and not self.excluded_df.empty:
+            keep_excluded = ~(_to_datetime(self.excluded_df[time_column]) < pd.Timestamp(start))
+            if not keep_excluded.all():
+                self.excluded_df = self.excluded_df[keep_excluded].reset_index(drop=True)
+                expired_excluded = True
+        if self.scrub_counts is not None and (expired_excluded or not keep.all()):
+            self.scrub_counts = self._recount_scrubbed()
+        self.start_time = max(self.start_time, start.strftime('%Y-%m-%dT%H:%M:%S'))
+
+    def _recount_scrubbed(self) -> dict:
+        """
+        _recount_scrubbed(self) -> dict: `scrub_counts` of the rows kept now in df and excluded_df, outliers/errors from their flag columns,
+        potential outliers and null rows re-evaluated with `scrub_policy`
+        """
+        frames = [frame for frame in (self.df, self.excluded_df) if not frame.empty]
+        metrics = [name for name in self.metrics if any(name in frame.columns for frame in frames)]
+        counts = {'rows': sum(len(frame) for frame in frames), 'excluded': len(self.excluded_df)}
+        for flag, name in (('is_outlier', 'outliers'), ('is_error', 'errors')):
+            counts[name] = int(sum(frame[flag].fillna(False).astype(bool).sum() for frame in frames if flag in frame.columns))
+        if frames and self.scrub_policy is not None:
+            values = pd.concat([frame.reindex(columns=metrics) for frame in frames], ignore_index=True) if len(frames) > 1 else frames[0].reindex(columns=metrics)
+            masks = self.scrub_policy.evaluate(values, metrics)
+            counts['potential_outliers'] = int(masks['is_potential_outlier'].sum())
+            counts['null_rows'] = int(masks['has_null'].sum())
+        else:
+            counts['potential_outliers'] = 0
+            counts['null_rows'] = 0
+        return {name: counts[name] for name in ('rows', 'outliers', 'potential_outliers', 'errors', 'null_rows', 'excluded')}
+
+    def refresh(self, api_key:str=None, retention_hours:float=None, **kwargs) -> int:
+        """refresh(self, api_key:str=None, retention_hours:float=None, **kwargs) -> int: fetches the data since end_time in place, see `get_data_since`. Returns the http status code."""
+        status_code, _ = get_data_since(self, api_key=api_key, retention_hours=retention_hours, **kwargs)
+        return status_code
 
-  
 
 
     def query(self, sql:str, conn:sqlite3.Connection=None) -> pd.DataFrame:
-        """query(self, sql:str, conn:sqlite3.Connection=None) -> pd.DataFrame:"""
-        return sql_query(
-                    sql, 
-                    {'rows': self.rows, 'columns': self.columns}, 
-                    conn
-            )
+        """
+        query(self, sql:str, conn:sqlite3.Connection=None) -> pd.DataFrame: runs sql on df as table `data`, lazy tracepoint columns it names are materialized first.
+        Runs on `query_engine`, which loads df once per `version`, results are memoized in `result_cache`.
+        With `conn`, df is copied into that connection for this query instead (see `sql_query`).
+        """
+        self._materialize_sql(sql)
+        if conn is not None:
+            return sql_query(
+                        sql, 
+                        {'df': self.df, 'columns': self.columns}, 
+                        conn
+                )
+        key = ('query', _normalize_sql(sql))
+        version = self._data_version()
+        cache = self.result_cache
+        result = cache.get(key, version) if cache is not None else None
+        if result is None:
+            result = self.query_engine.query(sql, self.df, version)
+            if cache is not None:
+                cache.put(key, version, result)
+        return result
 
     def data_frame(self) -> pd.DataFrame:
         """data_frame(self) -> pd.DataFrame: Converts the test data to a pandas DataFrame and returns it."""
@@ -152,40 +2078,220 @@ class TestData:
         """to_html(self): Converts the test data to an HTML table and returns it as a string."""
         return self.data_frame().to_html()
     
-    def to_csv(self) -> str:
-        """to_csv(self): Converts the test data to a CSV string and returns it."""
-        return self.data_frame().to_csv(index=False)
-    
-    def to_csv(self, file_path) -> bool:
-        """to_csv(self, file_path): Saves the test data as a CSV file at the provided file path. Returns `True` if successful, `False` otherwise."""
+    def to_csv(self, file_path=None):
+        """to_csv(self, file_path=None): Converts the test data to a CSV string and returns it, or saves it as a CSV file at `file_path`. Returns `True` if successful, `False` otherwise."""
+        if file_path is None:
+            return self.data_frame().to_csv(index=False)
+        try:
+            self.data_frame().to_csv(file_path, index=False)
+            return True
+        except Exception as e:
+            logger.error(e)
+            return False
+
+    def _metadata(self) -> dict:
+        """_metadata(self) -> dict: everything but the rows, json serializable"""
+        return {
+            'dimensions': self.dimensions,
+            'metrics': self.metrics,
+            'tracepoints': self.tracepoints,
+            'test_ids': self.test_ids,
+            'start_time': self.start_time,
+            'end_time': self.end_time,
+            'interval': self.interval,
+            'metric_ids': self.metric_ids,
+            'dimension_ids': self.dimension_ids,
+            'sub_source_ids': self.sub_source_ids,
+            'tracepoints_ids': self.tracepoints_ids,
+            'data_type': self.data_type,
+            'compacted': self.compacted,
+            'scrub_policy': vars(self.scrub_policy) if self.scrub_policy is not None else None,
+            'scrub_counts': self.scrub_counts,
+            'header_errors': self.header_errors,
+            'materialized': self._materialized,
+        }
+
+    def to_arrow(self):
+        """
+        to_arrow(self) -> pyarrow.Table: df as an Arrow table, with the excluded_df rows flagged by EXCLUDED_COLUMN
+        and the TestData metadata (dimensions, metrics, tracepoints, test ids, window, interval...) in the schema metadata
+        """
+        import pyarrow as pa
+
+        df = self.df
+        if not self.excluded_df.empty:
+            excluded_df = self.excluded_df.reindex(columns=df.columns)
+            df = pd.concat([df.assign(**{EXCLUDED_COLUMN: False}), excluded_df.assign(**{EXCLUDED_COLUMN: True})], ignore_index=True)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        test_data_metadata = self._metadata()
+        test_data_metadata['dtypes'] = {name: str(dtype) for name, dtype in self.df.dtypes.items()}
+        test_data_metadata['excluded_dtypes'] = {name: str(dtype) for name, dtype in self.excluded_df.dtypes.items()}
+        metadata[TEST_DATA_METADATA_KEY] = json.dumps(test_data_metadata).encode()
+        return table.replace_schema_metadata(metadata)
+
+    @classmethod
+    def from_arrow(cls, table) -> 'TestData':
+        """from_arrow(cls, table) -> TestData: TestData of an Arrow table written by `to_arrow`"""
+        metadata = json.loads(table.schema.metadata[TEST_DATA_METADATA_KEY])
+        df = table.to_pandas(split_blocks=True)
+        excluded_df = pd.DataFrame({name: pd.Series(dtype=dtype) for name, dtype in metadata.get('excluded_dtypes', {}).items()})
+        if EXCLUDED_COLUMN in df.columns:
+            excluded = df[EXCLUDED_COLUMN].to_numpy(dtype=bool)
+            excluded_df = _restore_dtypes(df[excluded].drop(columns=EXCLUDED_COLUMN).reset_index(drop=True), metadata.get('excluded_dtypes', {}))
+            df = df[~excluded].drop(columns=EXCLUDED_COLUMN).reset_index(drop=True)
+        df = _restore_dtypes(df, metadata.get('dtypes', {}))
+        test_data = cls({
+            'frame': df,
+            'excluded_frame': excluded_df,
+            'columns': list(df.columns),
+            'dimension_names': metadata['dimensions'],
+            'metric_names': metadata['metrics'],
+            'tracepoint_names': metadata['tracepoints'],
+            'test_ids': metadata['test_ids'],
+            'start_time': metadata['start_time'],
+            'end_time': metadata['end_time'],
+            'interval': metadata['interval'],
+            'metric_ids': metadata['metric_ids'],
+            'dimension_ids': metadata['dimension_ids'],
+            'sub_source_ids': metadata['sub_source_ids'],
+            'tracepoints_ids': metadata['tracepoints_ids'],
+            'data_type': metadata['data_type'],
+            'scrub_policy': ScrubPolicy(**metadata['scrub_policy']) if metadata.get('scrub_policy') else None,
+            'scrub_counts': metadata.get('scrub_counts'),
+            'header_errors': metadata.get('header_errors', {}),
+        })
+        test_data._materialized = metadata.get('materialized', [])
+        test_data.compacted = metadata.get('compacted', False)
+        return test_data
+
+    def to_parquet(self, file_path, compression:str='zstd') -> bool:
+        """to_parquet(self, file_path, compression:str='zstd') -> bool: Saves the test data, excluded rows and metadata as a parquet file (see `to_arrow`). Returns `True` if successful, `False` otherwise."""
         try:
-            self.data_frame().to_csv(file_path, index=False)
+            import pyarrow.parquet as pq
+            pq.write_table(self.to_arrow(), file_path, compression=compression)
+            return True
+        except Exception as e:
+            logger.error(e)
+            return False
+
+    @classmethod
+    def from_parquet(cls, file_path, memory_map:bool=True) -> 'TestData':
+        """from_parquet(cls, file_path, memory_map:bool=True) -> TestData: loads a file saved by `to_parquet`, memory mapped by default"""
+        import pyarrow.parquet as pq
+        return cls.from_arrow(pq.read_table(file_path, memory_map=memory_map))
+
+    def to_ipc(self, file_path) -> bool:
+        """to_ipc(self, file_path) -> bool: Saves the test data as an uncompressed Arrow IPC (feather v2) file that `from_ipc`, pyarrow, polars or duckdb read memory mapped without copying. Returns `True` if successful, `False` otherwise."""
+        try:
+            import pyarrow as pa
+            table = self.to_arrow()
+            with pa.OSFile(str(file_path), 'wb') as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
             return True
         except Exception as e:
             logger.error(e)
             return False
+
+    @classmethod
+    def from_ipc(cls, file_path) -> 'TestData':
+        """from_ipc(cls, file_path) -> TestData: loads a file saved by `to_ipc`, the Arrow buffers are memory mapped, not read"""
+        import pyarrow as pa
+        #the table's buffers keep the map open
+        return cls.from_arrow(pa.ipc.open_file(pa.memory_map(str(file_path))).read_all())
+
+    def iter_batches(self, rows:int=CP_BATCH_ROWS, columns:list=None, excluded:bool=False):
+        """
+        iter_batches(self, rows:int=CP_BATCH_ROWS, columns:list=None, excluded:bool=False): yields df (excluded_df if `excluded`) `rows` rows at a time,
+        as DataFrames with df's dtypes and a 0 based index. `columns` limits them to those columns, lazy tracepoint columns among them are materialized first.
+        The batches are slices of df, nothing else is copied. For sinks that don't need the whole frame at once (e.g. clickhouse_helper.upload_df per batch).
+        """
+        if rows < 1:
+            raise ValueError("rows must be at least 1")
+        if columns is not None:
+            self.materialize(*columns)
+        df = self.excluded_df if excluded else self.df
+        if columns is not None:
+            df = df[[name for name in columns if name in df.columns]]
+        for start in range(0, len(df), rows):
+            yield df.iloc[start:start + rows].reset_index(drop=True)
     
     def data(self) -> dict:
         """data(self): Converts the test data to a dictionary and returns it."""
         result = {}
+        columns = self.columns
         for i, row in enumerate(self.rows):
-            result[i] = dict(zip(self.columns, row))
+            result[i] = dict(zip(columns, row))
         return result
 
-    def summary(self, sql=None, stat:str='p95', group_by='test') -> pd.DataFrame:
-        """summary(self, sql=None, stat:str='p95', group_by='test'): Returns a summary of the test data, grouped by the provided dimension and calculated with the provided statistic. If an SQL query is provided, it is used to filter the data before calculating the summary."""
-        if group_by not in self.dimensions:
-            raise ValueError(f"No such dimension {group_by}")
-        
+    def select(self, *columns) -> Selection:
+        """select(self, *columns) -> Selection: lazy projection of df on `columns`, see `Selection`"""
+        return Selection(self).select(*columns)
+
+    def where(self, **conditions) -> Selection:
+        """where(self, **conditions) -> Selection: lazy filter of df, e.g. where(country='Japan', test__in=[...], ttfb_ms__gt=500), see `Selection`"""
+        return Selection(self).where(**conditions)
+
+    def sketches(self, group_by='test', relative_accuracy:float=CP_SKETCH_ACCURACY) -> dict:
+        """
+        sketches(self, group_by='test', relative_accuracy:float=CP_SKETCH_ACCURACY) -> dict: {group: {metric: QuantileSketch}} of df, see `build_sketches`.
+        Built once per version of the data. Merge them with the sketches of other fetches (`merge_sketches`), save them with `dump_sketches`.
+        """
+        version, built = self._sketch_cache
+        if version != self._data_version():
+            built = {}
+            self._sketch_cache = (self._data_version(), built)
+        key = (group_by if isinstance(group_by, str) else tuple(group_by), relative_accuracy)
+        if key not in built:
+            built[key] = build_sketches(self.df, group_by=group_by, metrics=self.metrics, relative_accuracy=relative_accuracy)
+        return built[key]
+
+    def summary(self, sql=None, stat:str='p95', group_by='test', stats:list=None, approx:bool=False) -> pd.DataFrame:
+        """
+        summary(self, sql=None, stat:str='p95', group_by='test', stats:list=None, approx:bool=False): Returns a summary of the test data, grouped by the provided dimension (or list of dimensions) and calculated with the provided statistic.
+        If an SQL query is provided, it is used to filter the data before calculating the summary. Results are memoized in `result_cache`.
+        `stats` (e.g. ['p50', 'p90', 'p99', 'mean', 'count', 'std']) computes all of them in one pass instead, columns are (metric, stat), see `get_summary`.
+        `approx=True` answers from quantile sketches (`sketches`), quantiles within CP_SKETCH_ACCURACY, see `sketch_summary`.
+        """
+        for name in ([group_by] if isinstance(group_by, str) else group_by):
+            if name not in self.dimensions:
+                #lazy tracepoint columns can be grouped by too
+                self.materialize(name)
+                if name not in self._materialized:
+                    raise ValueError(f"No such dimension {name}")
+
+        key = ('summary', _normalize_sql(sql) if sql is not None else None, stat, group_by if isinstance(group_by, str) else tuple(group_by), tuple(stats) if stats is not None else None, approx)
+        cache = self.result_cache
+        if cache is not None:
+            if sql is not None:
+                #the query may materialize columns, the version to cache under is the one after it
+                self._materialize_sql(sql)
+            result = cache.get(key, self._data_version())
+            if result is not None:
+                return result
+        result = self._summary(sql=sql, stat=stat, group_by=group_by, stats=stats, approx=approx)
+        if cache is not None:
+            cache.put(key, self._data_version(), result)
+        return result
+
+    def _summary(self, sql=None, stat:str='p95', group_by='test', stats:list=None, approx:bool=False) -> pd.DataFrame:
+        """_summary(self, sql=None, stat:str='p95', group_by='test', stats:list=None, approx:bool=False) -> pd.DataFrame: `summary` without the result cache"""
+        keys = [group_by] if isinstance(group_by, str) else list(group_by)
+        if approx and sql is None:
+            return sketch_summary(self.sketches(group_by), stat=stat, stats=stats, names=keys)
         if sql is not None:
             sub_df = self.query(sql)
+        elif self.df.empty:
+            sub_df = "Query did not return any rows"
         else:
-            columns = [group_by] + self.metrics
-            sql = f"SELECT {','.join(columns)} from data"
-            sub_df = self.query(sql)
+            #no filter, group df directly instead of a round trip through sqlite
+            sub_df = self.df[keys + self.metrics]
 
+        if isinstance(sub_df, pd.DataFrame) and approx:
+            return sketch_summary(build_sketches(sub_df, group_by=group_by), stat=stat, stats=stats, names=keys)
         if isinstance(sub_df, pd.DataFrame):
-            return get_summary(sub_df, stat=stat, group_by=group_by )
+            return get_summary(sub_df, stat=stat, group_by=group_by, stats=stats)
         else:
             logger.error(sub_df)
             return sub_df
@@ -198,7 +2304,13 @@ class TestData:
 ####################################################################
     
 # call api and return a dict that has a list() of all test_ids in the folder and their metadata
-def _fetch_tests_details(folder_id:str, test_type='all', api_key:str=None ):
+def _fetch_tests_details(folder_id:str, test_type='all', api_key:str=None, timeout=None, fields:list=None, use_cache:bool=True ):
+    """
+    _fetch_tests_details(folder_id:str, test_type='all', api_key:str=None, timeout=None, fields:list=None, use_cache:bool=True) -> tuple: (http_status_code, test id -> details)
+    All pages are fetched, the total count comes from the first page and the remaining pages are fetched concurrently.
+    `fields` limits the details to a subset of TESTS_DETAILS_FIELDS and turns off the heavy include* sections the server doesn't need to send for them.
+    Results are kept in `CP_METADATA_CACHE`, a cached fetch of all fields also answers a request for fewer fields. `use_cache=False` always fetches.
+    """
     logger.debug('---')
     
     if test_type not in TESTTYPES and test_type != 'all':
@@ -211,59 +2323,159 @@ def _fetch_tests_details(folder_id:str, test_type='all', api_key:str=None ):
         if api_key is None:
             logger.error("API key not provided")
             raise ValueError("API key not provided")
+
+    cache = CP_METADATA_CACHE if use_cache else None
+    if cache is not None:
+        cache_keys = _tests_cache_keys(cache, api_key, folder_id, test_type, fields)
+        tests = cache.get('tests', *cache_keys)
+        if tests is not None:
+            logger.debug(f"metadata cache hit, tests of folder {folder_id}")
+            return (200, _project_tests_details(tests, fields))
         
-    params = {
+    headers = {
+        'accept': 'application/json',
+        'Authorization': 'Bearer {}'.format(api_key)
+    }
+    tests_end_point = CP_CLIENT.url("/api/v2/tests/")
+
+    def fetch_page(page_number):
+        params = _tests_details_params(folder_id, page_number=page_number, fields=fields)
+        response = CP_CLIENT.get(tests_end_point, headers=headers, params=params, timeout=timeout)
+        logger.debug(f"Request: {response.request.url}")
+        if response.status_code != 200:
+            logger.error(f"Error: {response.status_code}")
+            logger.error(response.text)
+            return (response.status_code, response.text)
+        return (response.status_code, response.json())
+
+    status_code, tests_json = fetch_page(1)
+    if status_code != 200:
+        return (status_code, tests_json)
+
+    pagination = _tests_pagination(tests_json)
+    fetched = None
+    while True:
+        try:
+            page_numbers = pagination.send(fetched)
+        except StopIteration as done:
+            pages = done.value
+            break
+        if len(page_numbers) > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            logger.debug(f"fetching {len(page_numbers)} more pages of folder {folder_id}")
+            with ThreadPoolExecutor(max_workers=min(len(page_numbers), CP_CLIENT.pool_size)) as executor:
+                results = list(executor.map(fetch_page, page_numbers))
+        else:
+            results = [fetch_page(page_numbers[0])]
+        for status_code, page_json in results:
+            if status_code != 200:
+                return (status_code, page_json)
+        fetched = [page_json for _, page_json in results]
+
+    tests = {}
+    for page_json in pages:
+        tests.update(_parse_tests_details(page_json, test_type=test_type, fields=fields))
+    if cache is not None:
+        cache.put('tests', cache_keys[0], tests)
+    return (200, tests)
+
+def _tests_cache_keys(cache:'MetadataCache', api_key:str, folder_id, test_type='all', fields:list=None) -> list:
+    """_tests_cache_keys(cache:'MetadataCache', api_key:str, folder_id, test_type='all', fields:list=None) -> list: metadata cache keys that can answer a tests request, exact match first"""
+    keys = [cache.key(api_key, folder_id, test_type, sorted(fields) if fields is not None else None)]
+    if fields is not None:
+        keys.append(cache.key(api_key, folder_id, test_type, None))
+    return keys
+
+def _project_tests_details(tests:dict, fields:list=None) -> dict:
+    """_project_tests_details(tests:dict, fields:list=None) -> dict: test details limited to `fields`"""
+    if fields is None:
+        return tests
+    return {test_id: {key: value for key, value in details.items() if key in fields} for test_id, details in tests.items()}
+
+def _tests_details_params(folder_id, page_number:int=1, page_size:int=None, fields:list=None) -> dict:
+    """_tests_details_params(folder_id, page_number:int=1, page_size:int=None, fields:list=None) -> dict: query params of a /tests request"""
+    include_all = fields is None
+    return {
 
         'parentFolderIds':folder_id,
         'statusId':0,
-        'pageNumber':1,
-        'pageSize':100,
-        'includeAdvanceSettings':True,
-        'includeRequest':True,
-        'includeInsight':True,
-        'includeTargeting':True,
+        'pageNumber':page_number,
+        'pageSize':page_size if page_size else TESTS_PAGE_SIZE,
+        'includeAdvanceSettings':include_all,
+        'includeRequest':include_all or 'requestData' in fields,
+        'includeInsight':include_all,
+        'includeTargeting':include_all,
         'includeAlerts':False,
         'showInheritedProperties':True
     }
-    headers = {
-        'accept': 'application/json',
-        'Authorization': 'Bearer {}'.format(api_key)
-    }
-    tests_end_point = "https://io.catchpoint.com/api/v2/tests/"
-    response = requests.get(tests_end_point, headers=headers, params=params)
-    logger.debug(f"Request: {response.request.url}")
-    if response.status_code != 200:
-        logger.error(f"Error: {response.status_code}")
-        logger.error(response.text)
-        return (response.status_code, response.text)
 
-    tests_json = response.json()
+def _tests_page_count(tests_json:dict, page_size:int=None):
+    """_tests_page_count(tests_json:dict, page_size:int=None): number of pages from the totalCount of a /tests response, None if it has none"""
+    total = tests_json['data'].get('totalCount')
+    if total is None:
+        return None
+    page_size = page_size if page_size else TESTS_PAGE_SIZE
+    return max(1, -(-int(total) // page_size))
+
+def _tests_pagination(first_page:dict):
+    """
+    _tests_pagination(first_page:dict): generator shared by `_fetch_tests_details` and `tests_async`, yields the list of page numbers to fetch next,
+    is sent back their /tests responses and returns every page. With a totalCount all the remaining pages are asked for at once,
+    without one pages are asked for one by one until a short page, a page without new test ids or TESTS_MAX_PAGES.
+    """
+    pages = [first_page]
+    page_count = _tests_page_count(first_page)
+    if page_count is not None:
+        if page_count > 1:
+            pages.extend((yield list(range(2, page_count + 1))))
+        return pages
+
+    test_ids = {test['id'] for test in first_page['data']['tests']}
+    while len(pages[-1]['data']['tests']) >= TESTS_PAGE_SIZE:
+        if len(pages) >= TESTS_MAX_PAGES:
+            logger.warning(f"stopped paging tests at {TESTS_MAX_PAGES} pages")
+            break
+        page = (yield [len(pages) + 1])[0]
+        page_ids = {test['id'] for test in page['data']['tests']}
+        if page_ids <= test_ids:
+            #the server doesn't page, it sent a page we already have
+            logger.warning(f"page {len(pages) + 1} of tests has no new test ids, stopped paging")
+            break
+        test_ids |= page_ids
+        pages.append(page)
+    return pages
+
+def _parse_tests_details(tests_json:dict, test_type='all', fields:list=None) -> dict:
+    """_parse_tests_details(tests_json:dict, test_type='all', fields:list=None) -> dict: test id -> name, requestData, type and monitor (or just `fields`) of a /tests response"""
     tests = {}
     for test in  tests_json['data']['tests']:
         if(test['testType']['name'] == "Transaction"):
-            req_data = test['testRequestData']['requestData']
+            req_data = test.get('testRequestData', {}).get('requestData')
         elif(test['testType']['name'] == "Web"):
-            req_data = test['url']
+            req_data = test.get('url')
         else:
             req_data='unknown'
         if test_type == 'all' or test['testType']['name'].lower() == test_type:
-            tests[str(test['id'])] =  {
+            details =  {
                 'name': test['name'],
                 'requestData' : req_data,
                 'type' : test['testType']['name'],
                 'monitor': f"{test['monitor']['name']}"
-    }
-    return (response.status_code, tests)
+            }
+            if fields is not None:
+                details = {key: value for key, value in details.items() if key in fields}
+            tests[str(test['id'])] = details
+    return tests
 
 #--alias
-def tests(folder_id:int, test_type='all', api_key:str=None, ):
-    return _fetch_tests_details(folder_id=folder_id, test_type=test_type, api_key=api_key, )
+def tests(folder_id:int, test_type='all', api_key:str=None, timeout=None, fields:list=None, use_cache:bool=True, ):
+    return _fetch_tests_details(folder_id=folder_id, test_type=test_type, api_key=api_key, timeout=timeout, fields=fields, use_cache=use_cache, )
 
-def test_info(folder_id:int, test_type='all', api_key:str=None, ):
-    return _fetch_tests_details(folder_id=folder_id, test_type=test_type, api_key=api_key, )
+def test_info(folder_id:int, test_type='all', api_key:str=None, timeout=None, fields:list=None, use_cache:bool=True, ):
+    return _fetch_tests_details(folder_id=folder_id, test_type=test_type, api_key=api_key, timeout=timeout, fields=fields, use_cache=use_cache, )
 
 
-def _fetch_folder_details(folder_id, api_key:str=None, ):
+def _fetch_folder_details(folder_id, api_key:str=None, timeout=None, use_cache:bool=True, ):
     logger.debug('---')
     
     if api_key is None:  
@@ -272,8 +2484,16 @@ def _fetch_folder_details(folder_id, api_key:str=None, ):
     if api_key is None:
         logger.error("API key not provided")
         raise ValueError("API key not provided")
+
+    cache = CP_METADATA_CACHE if use_cache else None
+    if cache is not None:
+        cache_key = cache.key(api_key, folder_id)
+        folder_details = cache.get('folders', cache_key)
+        if folder_details is not None:
+            logger.debug(f"metadata cache hit, folder {folder_id}")
+            return (200, folder_details)
     
-    folder_end_point = f"https://io.catchpoint.com/api/v2/folders/{folder_id}"
+    folder_end_point = CP_CLIENT.url(f"/api/v2/folders/{folder_id}")
     headers = {
         'accept': 'application/json',
         'Authorization': 'Bearer {}'.format(api_key)
@@ -282,39 +2502,42 @@ def _fetch_folder_details(folder_id, api_key:str=None, ):
         'showInheritedProperties':'true'
     }
     
-    response = requests.get(folder_end_point, headers=headers, params=params)
+    response = CP_CLIENT.get(folder_end_point, headers=headers, params=params, timeout=timeout)
     logger.debug(f"Request: {response.request.url}")
     if response.status_code != 200:
         logger.error(f"Error: {response.status_code}")
         logger.error(response.text)
         return (response.status_code, response.text)
-    
-    folder_json = response.json()
+
+    folder_details = _parse_folder_details(response.json())
+    if cache is not None:
+        cache.put('folders', cache_key, folder_details)
+    return (response.status_code, folder_details)
+
+def _parse_folder_details(folder_json:dict) -> dict:
+    """_parse_folder_details(folder_json:dict) -> dict: id, name, nodes and the raw response of a /folders response"""
     nodes = []
     for node in folder_json['data']['folders'][0]['scheduleSetting']['nodes']:
         nodes.append([node['id'],node['name'],node['networkType']['name']])
-    return (
-        response.status_code,
-        { 
+    return { 
             'id': folder_json['data']['folders'][0]['id'], 
             'name': folder_json['data']['folders'][0]['name'],
             'nodes': nodes,
             'response_data': folder_json,
         }
-    )
 #-------alias 
-def folders(folder_id, api_key:str=None):
+def folders(folder_id, api_key:str=None, timeout=None, use_cache:bool=True):
     """ 
-    _folders(folder_id, api_key:str=None, ) returns (http_status_code, dict with folder details and metadata.)
+    _folders(folder_id, api_key:str=None, timeout=None, use_cache:bool=True) returns (http_status_code, dict with folder details and metadata.)
     """
-    return _fetch_folder_details(folder_id=folder_id, api_key=api_key )
+    return _fetch_folder_details(folder_id=folder_id, api_key=api_key, timeout=timeout, use_cache=use_cache )
 
 
-def folder_info(folder_id, api_key:str=None):
+def folder_info(folder_id, api_key:str=None, timeout=None, use_cache:bool=True):
     """ 
-    _folders(folder_id, api_key:str=None, ) returns (http_status_code, dict with folder details and metadata.)
+    _folders(folder_id, api_key:str=None, timeout=None, use_cache:bool=True) returns (http_status_code, dict with folder details and metadata.)
     """
-    return _fetch_folder_details(folder_id=folder_id, api_key=api_key )
+    return _fetch_folder_details(folder_id=folder_id, api_key=api_key, timeout=timeout, use_cache=use_cache )
 
 
 
@@ -358,178 +2581,415 @@ def hdrs_to_dict(hdrs:str)-> dict:
 """
     
 
+
 ######################################################################
 #return a dict that has test data in a 2d table format with some metadata  
-def _extract_test_data(response_data:dict,
-                        inc_outliers:bool=True,
-                        outlier_threshold:float=2999.99,
-                        inc_errors:bool=True,
-                        ) -> dict:
+def _extract_test_data(response_data:dict) -> dict:
+    """
+    _extract_test_data(response_data:dict) -> dict:
+    DataFrame, columns and the dimension/metric/tracepoint names of a decoded explorer response, see `_extract_test_data_columns`.
+    """
     logger.debug('---')
     response_items = response_data['data']['responseItems'][0]
-    row_index = 0
-    columns = []
-    dimension_names = []
-    metric_names = []
-    header_names = []
-    tracepoints = {}
-    rows = []
-    excluded =[]
-    unknown_count = 0
-    mismatches= 0
-    outliers_count= 0
-    errors_count = 0
-    null_values_count = 0
-    potential_outliers_count = 0
-    exc_outliers_str = "(Excluded)" if inc_outliers is False else "(Included)"
-    exc_errors_str = "(Excluded)" if inc_errors is False else "(Included)"
-    real_item_count = 0
-    extracted_item_count = 0
-    skipped = 0
- 
-
-    
-    
-    ## dimension meatrics and names of response headers extracted will be the columns
-    for dimension in response_items['dimensions']:
-        dimension_names.append(dimension['name'].lower())
-
-    for metric_name in response_items['metrics']:
-        metric_name['name'] = metric_name['name'].lower()
-        metric_name['name'] = metric_name['name'].replace(' ','_')
-        metric_name['name'] = metric_name['name'].replace('%','pct')
-        metric_name['name'] = metric_name['name'].replace('(','')
-        metric_name['name'] = metric_name['name'].replace(')','')
-        metric_name['name'] = metric_name['name'].replace('#','cnt')
-        metric_name['name'] = metric_name['name'].replace('time_to_first_byte_ms','ttfb_ms')
-
-        metric_names.append(metric_name['name'])
-    
-    ## tracepoints : here just looking for specific tracepoints
-    # to do, also extract any tracepoint available 
     if 'tracepoints' not in response_items.keys():
         logger.warn('no tracepoints in response_data')
         logger.debug(response_items.keys())
-        #need to handle this
+    return _extract_test_data_columns(_columns_from_response(response_data))
+
+
+def _extract_test_data_body(body:bytes) -> dict:
+    """_extract_test_data_body(body:bytes) -> dict: `_extract_test_data` of an undecoded explorer response body, see `_columns_from_body`"""
+    logger.debug('---')
+    return _extract_test_data_columns(_columns_from_body(body))
+
+
+#shared extraction worker pools by number of processes, shut down at exit
+_EXTRACT_POOLS = {}
+_EXTRACT_POOLS_LOCK = threading.Lock()
+_EXTRACT_POOLS_AT_EXIT = False
+#set in extraction worker processes only, they run one extraction at a time and nothing else
+_IN_EXTRACT_WORKER = False
+
+
+def _init_extract_worker():
+    global _IN_EXTRACT_WORKER
+    _IN_EXTRACT_WORKER = True
+
+
+def _extract_pool(processes:int):
+    """
+    _extract_pool(processes:int): the shared ProcessPoolExecutor of `processes` extraction workers, kept between calls.
+    Each size has its own pool, a call with another size never shuts down a pool a concurrent fetch is using.
+    """
+    global _EXTRACT_POOLS_AT_EXIT
+    import atexit
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    with _EXTRACT_POOLS_LOCK:
+        pool = _EXTRACT_POOLS.get(processes)
+        if pool is None:
+            start_method = CP_EXTRACT_START_METHOD if CP_EXTRACT_START_METHOD in multiprocessing.get_all_start_methods() else None
+            pool = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context(start_method), initializer=_init_extract_worker)
+            _EXTRACT_POOLS[processes] = pool
+            if not _EXTRACT_POOLS_AT_EXIT:
+                atexit.register(_shutdown_extract_pools)
+                _EXTRACT_POOLS_AT_EXIT = True
+        return pool
+
+
+def _shutdown_extract_pools():
+    """_shutdown_extract_pools(): shuts down the shared extraction worker pools, the next `_extract_pool` call starts new ones"""
+    with _EXTRACT_POOLS_LOCK:
+        pools = list(_EXTRACT_POOLS.values())
+        _EXTRACT_POOLS.clear()
+    for pool in pools:
+        pool.shutdown()
+
+
+def _extract_in_process(pool, body:bytes) -> dict:
+    """_extract_in_process(pool, body:bytes) -> dict: `_extract_in_worker` of a raw explorer response body run in `pool`, with the frame unpacked"""
+    from concurrent.futures.process import BrokenProcessPool
+
+    try:
+        #the registry of this process, workers don't see register_tracepoint calls
+        extracted = pool.submit(_extract_in_worker, body, _eager_headers()).result()
+    except BrokenProcessPool:
+        #a worker died, start a new pool of that size next time
+        with _EXTRACT_POOLS_LOCK:
+            for processes, shared in list(_EXTRACT_POOLS.items()):
+                if shared is pool:
+                    del _EXTRACT_POOLS[processes]
+        raise
+    extracted['frame'] = _unpack_frame(extracted['frame'])
+    return extracted
+
+
+def _extract_in_worker(body:bytes, headers:dict=None) -> dict:
+    """
+    _extract_in_worker(body:bytes, headers:dict=None) -> dict: `_extract_test_data_body` of a raw explorer response body with the eager tracepoints `headers` expanded (`header_errors`),
+    run in an extraction worker process. The frame goes back packed by `_pack_frame`, not as rows.
+    """
+    import gc
+
+    #extraction allocates millions of acyclic objects that trigger full collections for nothing,
+    #the collector is only paused in a worker process where nothing else runs
+    paused = _IN_EXTRACT_WORKER and gc.isenabled()
+    if paused:
+        gc.disable()
+    try:
+        extracted = _extract_test_data_body(body)
+    finally:
+        if paused:
+            gc.enable()
+    headers = _eager_headers() if headers is None else headers
+    extracted['header_errors'] = {}
+    if any(hdr in extracted['frame'].columns for hdr in headers):
+        extracted['frame'], extracted['header_errors'] = expand_headers(extracted['frame'], headers)
+    extracted['frame'] = _pack_frame(extracted['frame'])
+    return extracted
+
+
+def _pack_frame(df:pd.DataFrame) -> dict:
+    """
+    _pack_frame(df:pd.DataFrame) -> dict: df as an Arrow IPC stream (bytes) plus its dtypes when pyarrow is installed,
+    the DataFrame itself (pickled by column blocks) when it isn't or a column doesn't convert
+    """
+    try:
+        import pyarrow as pa
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return {'arrow': sink.getvalue().to_pybytes(), 'dtypes': df.dtypes.to_dict()}
+    except ImportError:
+        return {'frame': df}
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError) as e:
+        logger.debug(f"frame not arrow convertible, sending it pickled: {e}")
+        return {'frame': df}
+
+
+def _unpack_frame(packed:dict) -> pd.DataFrame:
+    """_unpack_frame(packed:dict) -> pd.DataFrame: the DataFrame packed by `_pack_frame`, with its original dtypes"""
+    if 'frame' in packed:
+        return packed['frame']
+    import pyarrow as pa
+    df = pa.ipc.open_stream(packed['arrow']).read_all().to_pandas()
+    for name, dtype in packed['dtypes'].items():
+        if df[name].dtype != dtype:
+            df[name] = df[name].astype(dtype)
+    return df
+
+
+def _columns_from_response(response_data:dict) -> dict:
+    """
+    _columns_from_response(response_data:dict) -> dict: column buffers of responseItems[0] of a decoded explorer response:
+    its dimension, metric and tracepoint metadata, one object array per dimension (strings) and tracepoint column, one float64 array per metric column
+    (NaN for null/non numeric values) and the item_count. Short item lists are padded with None/NaN.
+    """
+    return _columns_from_response_item(response_data['data']['responseItems'][0])
+
+
+def _metric_column_name(name:str) -> str:
+    """_metric_column_name(name:str) -> str: catchpoint metric name to column name, e.g. 'Time To First Byte (ms)' -> 'ttfb_ms'"""
+    name = name.lower()
+    name = name.replace(' ','_')
+    name = name.replace('%','pct')
+    name = name.replace('(','')
+    name = name.replace(')','')
+    name = name.replace('#','cnt')
+    name = name.replace('time_to_first_byte_ms','ttfb_ms')
+    return name
+
+
+class _TeeReader:
+    """file-like wrapper that copies everything read from `raw` into `sink`, used to fill the cache while streaming"""
+
+    def __init__(self, raw, sink):
+        self.raw = raw
+        self.sink = sink
+
+    def read(self, size:int=-1) -> bytes:
+        chunk = self.raw.read(size)
+        if chunk:
+            self.sink.write(chunk)
+        return chunk
+
+
+def _columns_from_response_item(response_items:dict) -> dict:
+    """_columns_from_response_item(response_items:dict) -> dict: `_columns_from_response` of one decoded responseItems entry"""
+    import numpy as np
+
+    items = response_items['items']
+    item_count = len(items)
+
+    def columns(key, width, names=False):
+        #items normally all have `width` values: one flat list reshaped to (items, width), else padded row by row
+        if width == 0:
+            return []
+        value_lists = [item.get(key) or [] for item in items]
+        if set(map(len, value_lists)) <= {width}:
+            if names:
+                flat_values = [value['name'] for values in value_lists for value in values]
+            else:
+                flat_values = [value for values in value_lists for value in values]
+            table = np.fromiter(flat_values, dtype=object, count=item_count * width).reshape(item_count, width)
+        else:
+            table = np.full((item_count, width), None, dtype=object)
+            for row, values in enumerate(value_lists):
+                values = [value['name'] for value in values[:width]] if names else values[:width]
+                table[row, :len(values)] = np.fromiter(values, dtype=object, count=len(values))
+        return [table[:, i] for i in range(width)]
+
+    dimension_columns = columns('dimensions', len(response_items['dimensions']), names=True)
+    for i, col in enumerate(dimension_columns):
+        if not set(map(type, col)) <= {str}:
+            dimension_columns[i] = np.fromiter(map(str, col), dtype=object, count=item_count)
+    tracepoint_columns = columns('tracepoints', len(response_items.get('tracepoints', [])))
+
+    metric_count = len(response_items['metrics'])
+    value_lists = [item['values'] for item in items]
+    if set(map(len, value_lists)) <= {metric_count}:
+        values = [value for values in value_lists for value in values]
     else:
-        logger.debug( response_items['tracepoints'])
-        for tracepoint in response_items['tracepoints']:
-            tracepoints[tracepoint['index']] = tracepoint['name']
-            header_names.append(tracepoint['name'].replace('-','_').lower())
-        
-                        
+        values = [value for values in value_lists for value in (values[:metric_count] + [None] * (metric_count - len(values)))]
+    if not set(map(type, values)) <= {int, float, type(None)}:
+        #strings (and anything else that isn't a number) count as nulls, like None
+        values = [value if isinstance(value, (int, float)) and not isinstance(value, bool) else None for value in values]
+    metrics = np.array(values, dtype=np.float64).reshape(item_count, metric_count)
+    metric_columns = [metrics[:, i] for i in range(metric_count)]
+
+    return {
+        'dimensions': response_items['dimensions'],
+        'metrics': response_items['metrics'],
+        'tracepoints': response_items.get('tracepoints', []),
+        'dimension_columns': dimension_columns,
+        'metric_columns': metric_columns,
+        'tracepoint_columns': tracepoint_columns,
+        'item_count': item_count,
+    }
+
+
+def _columns_from_body(body:bytes) -> dict:
+    """
+    _columns_from_body(body:bytes) -> dict: `_columns_from_response` of an undecoded explorer response body.
+    Decoded natively by pyarrow when it is installed and the items have regular shapes (`_arrow_columns`), with json.loads otherwise.
+    """
+    try:
+        columns_data = _arrow_columns(body)
+    except ImportError:
+        columns_data = None
+    if columns_data is None:
+        columns_data = _columns_from_response(json.loads(body))
+    return columns_data
+
+
+def _arrow_columns(body:bytes) -> dict:
+    """
+    _arrow_columns(body:bytes) -> dict: `_columns_from_body` decoded with pyarrow's json reader, without building Python objects for the items.
+    None when the response isn't regular: items of unexpected widths or value types, non string dimension names or tracepoint values...
+    """
+    import io
+    import numpy as np
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.json as pa_json
+
+    def lists(struct, name, width):
+        #the list<> field `name` of every item, None unless all of them have exactly `width` values
+        if struct.type.get_field_index(name) < 0:
+            return None
+        values = struct.field(name)
+        if not pa.types.is_list(values.type) or values.null_count:
+            return None
+        lengths = pc.min_max(pc.list_value_length(values)).as_py()
+        if lengths['min'] != width or lengths['max'] != width:
+            return None
+        return values.flatten()
+
+    def object_columns(values, width):
+        #dictionary encoded so repeated strings are converted once and share one object
+        if pa.types.is_null(values.type):
+            return [np.full(item_count, None, dtype=object) for _ in range(width)]
+        encoded = pc.dictionary_encode(values)
+        words = np.append(encoded.dictionary.to_numpy(zero_copy_only=False), None).astype(object)
+        codes = encoded.indices.fill_null(len(words) - 1).to_numpy()
+        table = words[codes].reshape(item_count, width)
+        return [table[:, i] for i in range(width)]
+
+    try:
+        table = pa_json.read_json(io.BytesIO(body),
+                                  read_options=pa_json.ReadOptions(use_threads=False, block_size=len(body) + 1),
+                                  parse_options=pa_json.ParseOptions(newlines_in_values=True))
+        if table.num_rows != 1 or 'data' not in table.column_names:
+            return None
+        response_items = table.column('data').chunk(0).field('responseItems')
+        if not pa.types.is_list(response_items.type) or not pa.types.is_struct(response_items.type.value_type) or not len(response_items.flatten()):
+            return None
+        response_item = response_items.flatten().slice(0, 1)
+        meta = {}
+        for name in ('dimensions', 'metrics', 'tracepoints'):
+            meta[name] = response_item.field(name).flatten().to_pylist() if response_item.type.get_field_index(name) >= 0 else []
+            meta[name] = [{key: value for key, value in entry.items() if value is not None} for entry in meta[name]]
+        if response_item.type.get_field_index('items') < 0 or not pa.types.is_list(response_item.field('items').type):
+            return None
+        items = response_item.field('items').flatten()
+        item_count = len(items)
+        if not item_count or not pa.types.is_struct(items.type):
+            return None
+
+        dimension_count, metric_count, tracepoint_count = len(meta['dimensions']), len(meta['metrics']), len(meta['tracepoints'])
+        dimension_columns = []
+        if dimension_count:
+            dimensions = lists(items, 'dimensions', dimension_count)
+            if dimensions is None or not pa.types.is_struct(dimensions.type) or dimensions.type.get_field_index('name') < 0:
+                return None
+            names = dimensions.field('name')
+            #the decoded path turns non string names into strings, str() of a number isn't always its json text
+            if not pa.types.is_string(names.type) or names.null_count:
+                return None
+            dimension_columns = object_columns(names, dimension_count)
+        tracepoint_columns = []
+        if tracepoint_count:
+            tracepoints = lists(items, 'tracepoints', tracepoint_count)
+            if tracepoints is None or not (pa.types.is_string(tracepoints.type) or pa.types.is_null(tracepoints.type)):
+                return None
+            tracepoint_columns = object_columns(tracepoints, tracepoint_count)
+        values = lists(items, 'values', metric_count)
+        #strings and booleans are nulls in the decoded path, arrow would parse or cast them
+        if values is None or not (pa.types.is_integer(values.type) or pa.types.is_floating(values.type) or pa.types.is_null(values.type)):
+            return None
+        metrics = pc.cast(values, pa.float64(), safe=False).to_numpy(zero_copy_only=False).reshape(item_count, metric_count)
+    except (KeyError, pa.ArrowException) as e:
+        logger.debug(f"response not arrow decodable, decoding it with json: {e}")
+        return None
+
+    return {
+        'dimensions': meta['dimensions'],
+        'metrics': meta['metrics'],
+        'tracepoints': meta['tracepoints'],
+        'dimension_columns': dimension_columns,
+        'metric_columns': [metrics[:, i] for i in range(metric_count)],
+        'tracepoint_columns': tracepoint_columns,
+        'item_count': item_count,
+    }
 
 
+def _stream_explorer_columns(fh) -> dict:
+    """
+    _stream_explorer_columns(fh) -> dict: incrementally parses an explorer response from a binary file-like object (socket, gzip file...)
+    into the column buffers of `_columns_from_response`, without holding the body. Requires ijson.
+    The response item's dimensions, metrics, tracepoints and items are built by ijson's C backend (when compiled) one key at a time, later responseItems are ignored.
+    """
+    import ijson
+
+    response_items = {}
+    first_item = True
+    for key, value in ijson.kvitems(fh, 'data.responseItems.item', use_float=True):
+        #a key seen again belongs to the next responseItems entry, read on to the end of the body (it may be teed into the cache)
+        if key in response_items:
+            first_item = False
+        if first_item:
+            response_items[key] = value
+    if 'items' not in response_items:
+        raise ValueError("no responseItems in explorer response")
+    return _columns_from_response_item(response_items)
+
+
+def _extract_test_data_columns(columns_data:dict) -> dict:
+    """
+    _extract_test_data_columns(columns_data:dict) -> dict:
+    DataFrame (dimension columns + metric columns + tracepoint columns) of the column buffers returned by `_stream_explorer_columns`/`_columns_from_response`.
+    Null and non numeric metric values are NaN, but failure counts which are 0, the other metric values are truncated to int (int64 columns when they have no nulls).
+    All rows are kept, outliers and errors are flagged afterwards over the merged data by a `ScrubPolicy`.
+    """
+    import numpy as np
+
+    logger.debug('---')
+    dimension_names = [dimension['name'].lower() for dimension in columns_data['dimensions']]
+    metric_names = [_metric_column_name(metric['name']) for metric in columns_data['metrics']]
+    header_names = [tracepoint['name'].replace('-','_').lower() for tracepoint in columns_data['tracepoints']]
+    columns = dimension_names + metric_names + header_names
+    item_count = columns_data['item_count']
     logger.debug(f"Dimension names:{dimension_names}")
     logger.debug(f"Metric names:{metric_names}")
     logger.debug(f"Headers names:{header_names}")
-    columns =  dimension_names + metric_names + header_names
-
-
-    #####  data rows #############################
-    for item in response_items['items']:
-
-        header_values = []
-        for  header_value in item['tracepoints']:
-            header_values.append(header_value)
-               
-
-        dimension_values = []
-        ###### single row dimension values
-        for dimension_value in item['dimensions']:
-            dimension_values.append(str(dimension_value['name']))
-       # for tracepoint_value in item['tracepoints']:
-        #    dimension_values.append(tracepoint_value['name'])
-        ########single row metric values
-        metric_values = item['values']
-        has_null_value = False
-        for n in metric_values:
-            if n is None or  isinstance(n, str):
-                # 'cnt_connection_failures', 'cnt_ssl_failures', 'cnt_response_failures', 'cnt_timeout_failures'
-                if metric_names[metric_values.index(n)] in ['cnt_connection_failures', 'cnt_ssl_failures', 'cnt_response_failures', 'cnt_timeout_failures']:
-                    metric_values[metric_values.index(n)] = 0
-                else:
-                    metric_values[metric_values.index(n)] = None
-                    has_null_value = True
-            else:
-                metric_values[metric_values.index(n)] = int(n)   
-      
-        if has_null_value:
-            null_values_count+=1
-            logger.debug(f"row {row_index} has null values in metrics {metric_names}:{metric_values}")  
-           
-        
-        ### srcub bad data points
-        has_outlier = False
-        has_error = False
-        has_valid_error = False
-        if not has_null_value:
-            for v in metric_values:
-    
-                if v >= outlier_threshold:
-                    has_outlier = True
-                    break
-                if v >= (outlier_threshold * 0.6):
-                    potential_outliers_count+=1
-            
-        
-        if has_outlier is False:
-            for i in  range( 0, len(metric_names)-1):
-                if metric_names[i].endswith('availibility') and metric_values[i] < 100:
-                    #possibly a valid error 
-                    has_error = False
-                    has_valid_error = True
-                if metric_names[i].endswith('failures') and metric_values[i] > 0 and has_valid_error is False:
-                    has_error = True
-
-        if has_outlier is False and  has_error is False:
-            rows.append(dimension_values+metric_values + header_values)
-            row_index+=1
-            continue
 
-        if has_outlier is True and inc_outliers is True:
-            outliers_count=+1
-            rows.append(dimension_values+metric_values + header_values)
-            row_index+=1
-            continue
+    def object_columns(cols, count):
+        cols = [np.asarray(col, dtype=object) if len(col) == item_count else np.full(item_count, None, dtype=object) for col in cols[:count]]
+        while len(cols) < count:
+            cols.append(np.full(item_count, None, dtype=object))
+        return cols
 
-        if has_error is True and inc_errors is True:
-            errors_count+=1
-            rows.append(dimension_values+metric_values + header_values)
-            row_index+=1
-            continue
+    metrics = np.full((item_count, len(metric_names)), np.nan)
+    for i, col in enumerate(columns_data['metric_columns'][:len(metric_names)]):
+        if len(col) == item_count:
+            metrics[:, i] = np.asarray(col, dtype=np.float64)
+    metrics = np.trunc(metrics)
 
-        
-        excluded.append(dimension_values+metric_values + header_values)
-        skipped+=1
-        if has_outlier:
-            outliers_count+=1
-        if has_error:
-            errors_count+=1
-        row_index+=1
-            #logger.debug(f":Excluded {excluded[-1]}...")
-            #logger.debug(f"Reason: has_error={has_error}. has_outlier={has_outlier}")
+    ### null values, failure counts are 0 when null
+    failure_metrics = np.array([name in FAILURE_METRICS for name in metric_names], dtype=bool)
+    metrics[:, failure_metrics] = np.nan_to_num(metrics[:, failure_metrics], nan=0.0)
+    is_null = np.isnan(metrics)
 
-        
-        #################### end all rows  ############################
-    real_item_count = len(response_items['items'])
-    extracted_item_count = len(rows) + skipped
-    logger.debug(f"Expected data points in current data set: {real_item_count}")
-    logger.debug(f"Extracted data points: {extracted_item_count}")
-    logger.debug(f"Outliers found: {exc_outliers_str}: {outliers_count}")
-    logger.debug(f"Failures found: {exc_errors_str}: {errors_count}")
-    logger.debug(f"Total data points excluded: {skipped}")
-    logger.debug(f"Potential outliers(included): {potential_outliers_count}")
-    logger.debug(f"Data field mismatch count {mismatches}")
-    logger.debug(f"Null metric valuies count {null_values_count}")
+    ### one column array per column, no row lists
+    metric_columns = []
+    for i in range(len(metric_names)):
+        metric_columns.append(metrics[:, i] if is_null[:, i].any() else metrics[:, i].astype(np.int64))
+    all_columns = object_columns(columns_data['dimension_columns'], len(dimension_names)) + metric_columns + object_columns(columns_data['tracepoint_columns'], len(header_names))
+    df = pd.DataFrame({i: col for i, col in enumerate(all_columns)}, index=pd.RangeIndex(item_count))
+    df.columns = columns
+
+    logger.debug(f"Expected data points in current data set: {item_count}")
+    logger.debug(f"Extracted data points: {len(df)}")
     return {
-        'rows':rows,
+        'frame':df,
         'columns':columns,
         'dimension_names':dimension_names,
         'metric_names': metric_names,
         'tracepoint_names': header_names,
-        'excluded_rows': excluded
     }
+
 #####################################################################
 ##### FETCH TEST DATA
 # call api and return TestData() object that has a 2d table  with dimensions + metrics columns and metadata   
@@ -547,8 +3007,97 @@ def _fetch_test_data(test_id=None,
                     sub_source_ids:list=SUB_SOURCE_IDS,
                     tracepoints_ids:list=TRACEPOINTS_IDS,
                     api_key:str=None,
+                    timeout=None,
+                    max_parallel:int=1,
+                    batch_size:int=None,
+                    shard_hours:float=None,
+                    retries:int=CP_SHARD_RETRIES,
+                    use_cache:bool=True,
+                    stream:bool=False,
+                    keep_response:bool=False,
+                    compact:bool=True,
+                    scrub_policy:ScrubPolicy=None,
+                    extract_processes:int=0,
                     ) -> TestData:
     logger.debug('---')
+    status_code, plan = _fetch_plan(test_id=test_id,
+                                    test_ids=test_ids,
+                                    folder_id=folder_id,
+                                    test_type=test_type,
+                                    data_type=data_type,
+                                    time_delta=time_delta,
+                                    start_time=start_time,
+                                    end_time=end_time,
+                                    interval=interval,
+                                    metric_ids=metric_ids,
+                                    dimension_ids=dimension_ids,
+                                    sub_source_ids=sub_source_ids,
+                                    tracepoints_ids=tracepoints_ids,
+                                    api_key=api_key,
+                                    timeout=timeout,
+                                    max_parallel=max_parallel,
+                                    batch_size=batch_size,
+                                    shard_hours=shard_hours,
+                                    retries=retries,
+                                    use_cache=use_cache,
+                                    stream=stream,
+                                    keep_response=keep_response,
+                                    extract_processes=extract_processes)
+    if status_code != 200:
+        return status_code, plan
+
+    params_list, fetch_batch = plan['params_list'], plan['fetch_batch']
+    if len(params_list) == 1:
+        results = [fetch_batch(params_list[0])]
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=plan['workers']) as executor:
+            results = list(executor.map(fetch_batch, params_list))
+
+    return _test_data_from_results(results,
+                                   test_ids=plan['test_ids'],
+                                   start_time=plan['start_time'],
+                                   end_time=plan['end_time'],
+                                   interval=interval,
+                                   metric_ids=metric_ids,
+                                   dimension_ids=dimension_ids,
+                                   sub_source_ids=sub_source_ids,
+                                   tracepoints_ids=tracepoints_ids,
+                                   data_type=data_type,
+                                   compact=compact,
+                                   scrub_policy=scrub_policy)
+
+
+def _fetch_plan(test_id=None,
+                    test_ids:list=[],
+                    folder_id=None,
+                    test_type='all',
+                    data_type='aggregated',
+                    time_delta:float=1.0,
+                    start_time:str=None,
+                    end_time:str=None,
+                    interval:str=INTERVALS['15m'],
+                    metric_ids:list=METRIC_IDS,
+                    dimension_ids:list=DIMENSION_IDS,
+                    sub_source_ids:list=SUB_SOURCE_IDS,
+                    tracepoints_ids:list=TRACEPOINTS_IDS,
+                    api_key:str=None,
+                    timeout=None,
+                    max_parallel:int=1,
+                    batch_size:int=None,
+                    shard_hours:float=None,
+                    retries:int=CP_SHARD_RETRIES,
+                    use_cache:bool=True,
+                    stream:bool=False,
+                    keep_response:bool=False,
+                    extract_processes:int=0,
+                    ) -> tuple:
+    """
+    _fetch_plan(...) -> tuple: (200, plan) for the get_data arguments, plan is a dict of the resolved test_ids, start_time and end_time,
+    the explorer params_list, the number of workers and fetch_batch(params) -> (http_status_code, response_data, extracted) that fetches one of them with retries.
+    (http_status_code, error) if the folder's tests can't be listed.
+    """
+    logger.debug('---')
     test_ids_to_fetch = []
     if not api_key:
         load_env() 
@@ -567,11 +3116,11 @@ def _fetch_test_data(test_id=None,
 
     elif test_ids:
         logger.debug(f'fetching test ids {test_ids}')
-        test_ids_to_fetch = test_ids
+        test_ids_to_fetch = [str(test_id) for test_id in test_ids]
     
     elif folder_id:
         logger.debug(f'fetching test info in folder {folder_id}')
-        resp_code, tests_details = _fetch_tests_details(folder_id, test_type=test_type,  api_key=api_key)
+        resp_code, tests_details = _fetch_tests_details(folder_id, test_type=test_type,  api_key=api_key, timeout=timeout, fields=FOLDER_TESTS_FIELDS, use_cache=use_cache)
         if resp_code != 200:
             logger.error(f" {resp_code} response code")
             logger.error(f"{tests_details}")
@@ -584,67 +3133,302 @@ def _fetch_test_data(test_id=None,
   
     
 
+    start_time, end_time = _time_window(start_time, end_time, time_delta)
+
+    num_of_tests = len(test_ids_to_fetch)
+    logger.debug(f"total tests to fetch: {num_of_tests}")
+    if num_of_tests < 1:
+        logger.error("No test ids found ")
+        return 0, "No Test ids Found"
+
+    params_list, workers = _explorer_params(test_ids_to_fetch, start_time, end_time,
+                                            data_type=data_type,
+                                            interval=interval,
+                                            metric_ids=metric_ids,
+                                            dimension_ids=dimension_ids,
+                                            sub_source_ids=sub_source_ids,
+                                            tracepoints_ids=tracepoints_ids,
+                                            max_parallel=max_parallel,
+                                            batch_size=batch_size,
+                                            shard_hours=shard_hours)
+
+    stream = _use_stream(stream, keep_response)
+    pool = None
+    if extract_processes and keep_response:
+        logger.warning("keep_response needs the decoded response, extracting in threads")
+    elif extract_processes:
+        pool = _extract_pool(extract_processes)
+        stream = False
+
+    #bodies are extracted undecoded (`_extract_test_data_body`) unless the decoded response is kept or streamed
+    raw = not (stream or keep_response)
+
+    def fetch_batch(params):
+        for attempt in range(retries + 1):
+            try:
+                status_code, response_data = _request_test_data(params, data_type=data_type, api_key=api_key, timeout=timeout, use_cache=use_cache, stream=stream, raw=raw)
+            except requests.exceptions.RequestException as e:
+                logger.error(f"Request error: {e}")
+                status_code, response_data = 0, f"ERROR: {str(e)}"
+            if status_code == 200 and pool is not None:
+                try:
+                    return status_code, None, _extract_in_process(pool, response_data)
+                except Exception as e:
+                    logger.error(f"Extraction error: {e}")
+                    return 0, f"ERROR: {str(e)}", None
+            if status_code == 200 and raw:
+                try:
+                    return status_code, None, _extract_test_data_body(response_data)
+                except ValueError as e:
+                    logger.error(f"Error decoding response: {e}")
+                    status_code, response_data = 0, f"ERROR: {str(e)}"
+            elif status_code == 200:
+                if stream:
+                    return status_code, None, _extract_test_data_columns(response_data)
+                return status_code, response_data, _extract_test_data(response_data)
+            if not _retryable(status_code):
+                break
+            if attempt < retries:
+                logger.warning(f"shard {params['startTime']} - {params['endTime']} failed with {status_code}, retry {attempt + 1}/{retries}")
+                time.sleep(2 ** attempt)
+        return status_code, response_data, None
+
+    return (200, {
+        'test_ids': test_ids_to_fetch,
+        'start_time': start_time,
+        'end_time': end_time,
+        'params_list': params_list,
+        'workers': workers,
+        'fetch_batch': fetch_batch,
+    })
+
+
+def _time_window(start_time:str=None, end_time:str=None, time_delta:float=1.0) -> tuple:
+    """_time_window(start_time:str=None, end_time:str=None, time_delta:float=1.0) -> tuple: (start_time, end_time) strings, the last `time_delta` hours if no start_time"""
     if not start_time:
         start_time = (datetime.utcnow()-timedelta(hours=time_delta)).strftime('%Y-%m-%dT%H:%M:%S')
         end_time = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S')
     else:
         start_time = datetime.strptime(start_time, '%Y-%m-%dT%H:%M:%S').strftime('%Y-%m-%dT%H:%M:%S')
         end_time = datetime.strptime(end_time, '%Y-%m-%dT%H:%M:%S').strftime('%Y-%m-%dT%H:%M:%S')
+    return start_time, end_time
 
 
-    num_of_tests = len(test_ids_to_fetch)
-    logger.debug(f"total tests to fetch: {num_of_tests}")
-    if num_of_tests < 1:
-        logger.error("No test ids found ")
-        return 0, "No Test ids Found"
+def _explorer_params(test_ids:list,
+                     start_time:str,
+                     end_time:str,
+                     data_type='aggregated',
+                     interval:str=INTERVALS['15m'],
+                     metric_ids:list=METRIC_IDS,
+                     dimension_ids:list=DIMENSION_IDS,
+                     sub_source_ids:list=SUB_SOURCE_IDS,
+                     tracepoints_ids:list=TRACEPOINTS_IDS,
+                     max_parallel:int=1,
+                     batch_size:int=None,
+                     shard_hours:float=None,
+                     ) -> tuple:
+    """
+    _explorer_params(...) -> tuple: (params_list, workers)
+    one explorer params dict per (time window, test id batch), ordered by window then batch so merged rows come out in time order,
+    and the number of workers to fetch them with.
+    """
+    num_of_tests = len(test_ids)
+    if batch_size is None and max_parallel > 1:
+        batch_size = -(-num_of_tests // max_parallel)
+    if batch_size is None or batch_size >= num_of_tests:
+        batches = [test_ids]
+    else:
+        batches = [test_ids[i:i+batch_size] for i in range(0, num_of_tests, batch_size)]
 
-    params = {
-        'testIds': ",".join(test_ids_to_fetch),
-        'startTime':start_time,
-        'endTime':end_time,
-        'interval':interval,
-        'metricIds': ",".join(metric_ids),
-        'dimensionIds':",".join(dimension_ids),
-        'subSourceIds':",".join(sub_source_ids),
-        'tracepointIds':",".join(tracepoints_ids),
-    }
-    test_data_end_point = f"https://io.catchpoint.com/api/v2/tests/explorer/{data_type}"
+    windows = _shard_windows(start_time, end_time, data_type=data_type, interval=interval, shard_hours=shard_hours)
+    if len(windows) > 1:
+        logger.debug(f"{start_time} - {end_time} sharded into {len(windows)} windows")
+
+    params_list = []
+    for window_start, window_end in windows:
+        for batch in batches:
+            params_list.append({
+                'testIds': ",".join(batch),
+                'startTime':window_start,
+                'endTime':window_end,
+                'interval':interval,
+                'metricIds': ",".join(metric_ids),
+                'dimensionIds':",".join(dimension_ids),
+                'subSourceIds':",".join(sub_source_ids),
+                'tracepointIds':",".join(tracepoints_ids),
+            })
+
+    workers = max_parallel
+    if len(windows) > 1 and max_parallel <= 1:
+        workers = min(len(params_list), CP_CLIENT.pool_size)
+    workers = max(1, workers)
+    if len(params_list) > 1:
+        logger.debug(f"fetching {num_of_tests} tests in {len(batches)} batches x {len(windows)} windows, {workers} in parallel")
+    return params_list, workers
+
+
+def _use_stream(stream:bool=False, keep_response:bool=False) -> bool:
+    """_use_stream(stream:bool=False, keep_response:bool=False) -> bool: whether explorer responses get stream decoded, only when asked for, ijson is installed and the raw response isn't kept"""
+    if not stream:
+        return False
+    if keep_response:
+        logger.warning("keep_response needs the decoded response, not streaming")
+        return False
+    try:
+        import ijson
+    except ImportError:
+        logger.warning("ijson is not installed, not streaming")
+        return False
+    return True
+
+
+def _retryable(status_code:int) -> bool:
+    """_retryable(status_code:int) -> bool: client errors won't get better on a retry, everything else might"""
+    return not (400 <= status_code < 500 and status_code != 429)
+
+
+def _test_data_from_results(results:list,
+                            test_ids:list,
+                            start_time:str,
+                            end_time:str,
+                            interval:str,
+                            metric_ids:list,
+                            dimension_ids:list,
+                            sub_source_ids:list,
+                            tracepoints_ids:list,
+                            data_type='aggregated',
+                            compact:bool=False,
+                            scrub_policy:ScrubPolicy=None,
+                            ) -> tuple:
+    """
+    _test_data_from_results(results:list, ...) -> tuple:
+    (200, TestData) built from a list of (http_status_code, response_data, extracted) results, its rows flagged by `scrub_policy` (default CP_SCRUB_POLICY),
+    or the (http_status_code, error) of the first failed one.
+    """
+    for status_code, response_data, extracted in results:
+        if status_code != 200:
+            return (status_code, response_data)
+
+    test_data = _merge_test_data([extracted for _, _, extracted in results])
+    scrub_policy = scrub_policy if scrub_policy is not None else CP_SCRUB_POLICY
+    test_data['frame'], test_data['excluded_frame'], test_data['scrub_counts'] = scrub_policy.apply(test_data['frame'], test_data['metric_names'])
+    test_data['columns'] = list(test_data['frame'].columns)
+    test_data['scrub_policy'] = scrub_policy
+    test_data['test_ids'] = test_ids
+    test_data['start_time'] = start_time
+    test_data['end_time'] = end_time
+    test_data['interval'] = interval
+    test_data['metric_ids'] = metric_ids
+    test_data['dimension_ids'] = dimension_ids
+    test_data['sub_source_ids'] = sub_source_ids
+    test_data['tracepoints_ids'] = tracepoints_ids
+    test_data['data_type'] = data_type
+    test_data['compact'] = compact
+    test_data['response_data'] = _merge_response_data([response_data for _, response_data, _ in results if response_data is not None])
+
+    return (200, TestData(test_data))
+
+
+def _shard_windows(start_time:str, end_time:str, data_type='aggregated', interval:str=INTERVALS['15m'], shard_hours:float=None) -> list:
+    """
+    _shard_windows(start_time:str, end_time:str, data_type='aggregated', interval:str=INTERVALS['15m'], shard_hours:float=None) -> list:
+    splits [start_time, end_time] into a list of contiguous (start, end) windows.
+    Default window size is RAW_SHARD_HOURS for raw data and AGGREGATED_SHARD_BUCKETS intervals for aggregated data, `shard_hours=0` returns the whole range.
+    Window ends stop one second short of the next window start so no data point is fetched twice.
+    Inner boundaries of aggregated windows are floored to the interval grid, so each aggregation bucket is in exactly one window.
+    """
+    if shard_hours is None:
+        if data_type == 'raw':
+            shard_hours = RAW_SHARD_HOURS
+        else:
+            shard_hours = AGGREGATED_SHARD_BUCKETS * INTERVAL_MINUTES.get(str(interval), 15) / 60
+    if not shard_hours or shard_hours <= 0:
+        return [(start_time, end_time)]
+
+    time_format = '%Y-%m-%dT%H:%M:%S'
+    start = datetime.strptime(start_time, time_format)
+    end = datetime.strptime(end_time, time_format)
+    step = timedelta(hours=shard_hours)
+    if end - start <= step:
+        return [(start_time, end_time)]
+    grid = None
+    if data_type != 'raw':
+        grid = timedelta(minutes=INTERVAL_MINUTES.get(str(interval), 15))
+
+    windows = []
+    window_start = start
+    while window_start < end:
+        window_end = window_start + step
+        if grid is not None:
+            #buckets are aligned on the epoch, a boundary inside one would return it partially from both windows
+            window_end -= (window_end - datetime(1970, 1, 1)) % grid
+            if window_end <= window_start:
+                window_end += grid
+        if window_end >= end:
+            windows.append((window_start.strftime(time_format), end.strftime(time_format)))
+            break
+        windows.append((window_start.strftime(time_format), (window_end - timedelta(seconds=1)).strftime(time_format)))
+        window_start = window_end
+    return windows
+
+
+def _request_test_data(params:dict, data_type='aggregated', api_key:str=None, timeout=None, use_cache:bool=True, stream:bool=False, raw:bool=False) -> tuple:
+    """
+    _request_test_data(params:dict, data_type='aggregated', api_key:str=None, timeout=None, use_cache:bool=True, stream:bool=False, raw:bool=False) -> tuple:
+    one explorer request, returns (http_status_code, decoded response dict or error text). Answered from `CP_CACHE` when possible.
+    With `stream=True` the body is parsed while it is read from the socket (or the cache file) and the result is the column buffers of `_stream_explorer_columns`.
+    With `raw=True` the result is the undecoded body (bytes), for `_extract_test_data_body` in this process or an extraction worker.
+    """
+    test_data_end_point = CP_CLIENT.url(f"/api/v2/tests/explorer/{data_type}")
     logger.debug(f"End Point URL: {test_data_end_point}")
     logger.debug(f"Params: {json.dumps(params, indent=2)}")
+    cache = CP_CACHE if use_cache else None
+    if cache is not None:
+        cache_key = cache.key(api_key, test_data_end_point, params)
+        if stream:
+            cache_file = cache.open(cache_key)
+            if cache_file is not None:
+                logger.debug(f"cache hit {cache_key}")
+                try:
+                    with cache_file:
+                        return (200, _stream_explorer_columns(cache_file))
+                except (OSError, EOFError, ValueError) as e:
+                    logger.warning(f"dropping unreadable cache entry {cache_key}: {e}")
+                    cache._remove(cache_file.name)
+        else:
+            body = cache.get(cache_key)
+            if body is not None:
+                logger.debug(f"cache hit {cache_key}")
+                return (200, body if raw else json.loads(body))
     headers = {
         'accept': 'application/json',
         'Authorization': f'Bearer {api_key}'
     }
     logger.debug(f"Headers:{json.dumps(headers, indent=2 )}")
-    time.sleep(1)
     logger.debug("Fetching test data...")
-    response = requests.get(test_data_end_point, headers=headers, params=params)
+    # pacing and 429 retries are handled by the client's rate limiter
+    response = CP_CLIENT.get(test_data_end_point, headers=headers, params=params, timeout=timeout, stream=stream)
     logger.debug(f"Response satus code: {response.status_code}")
     if response.status_code != 200:
         if response.status_code == 429:
-            error_count = 0
-            error_max = 5
-            wait_time = 5
-            while(response.status_code == 429):
-                error_count+=1
-                logger.debug("Rate limit exceeded, retrying in 2 seconds...")
-                logger.debug("X-Rate-Limit:" + response.headers['X-Rate-Limit-Limit'])
-                logger.debug("X-Rate-Limit-Remaining:"+response.headers['X-Rate-Limit-Remaining'])
-                logger.debug("X-Rate-Limit-Reset:"+response.headers['X-Rate-Limit-Reset'])
-                logger.debug("X-Rate-Limit-Reset:"+response.headers['Date'])
-                time.sleep(5)
-                if(error_count > error_max):
-                    logger.error(f"Rate limit exceeded {error_count} times, exiting")
-                    logger.debug(f"Error Response: {response.text}")
-                    logger.debug(f"Error Response Headers: {response.headers}")
-                    return (response.status_code, response.text)
-                response = requests.get(test_data_end_point, headers=headers, params=params)
+            logger.error(f"Rate limit exceeded {CP_RATE_LIMIT_RETRIES} times, exiting")
+            logger.debug(f"Error Response: {response.text}")
+            logger.debug(f"Error Response Headers: {response.headers}")
+            return (response.status_code, response.text)
         else:
             logger.error(f"Req {response.url} error {response.status_code}")
             logger.debug(f"Response: {response.text}")
             logger.debug(f"Response Headers: {response.headers}")
             return(response.status_code, response.text)
-    
+
+    if stream:
+        return _stream_test_data(response, cache, cache_key if cache is not None else None, params)
+
+    if raw:
+        if cache is not None:
+            cache.put(cache_key, response.content, closed=cache.is_closed(params))
+        return (response.status_code, response.content)
+
     try:
         response_data = response.json()
     except json.JSONDecodeError as e:
@@ -654,19 +3438,110 @@ def _fetch_test_data(test_id=None,
             logger.error(f"Error decoding response: {e}")
             return (0,f"ERROR: {str(e)}\n\n {response.text}" )
 
+    if cache is not None:
+        cache.put(cache_key, response.content, closed=cache.is_closed(params))
+    return (response.status_code, response_data)
+
+
+def _stream_test_data(response:requests.Response, cache:'ResponseCache'=None, cache_key:str=None, params:dict=None) -> tuple:
+    """
+    _stream_test_data(response:requests.Response, cache:'ResponseCache'=None, cache_key:str=None, params:dict=None) -> tuple:
+    (200, column buffers) parsed from a `stream=True` response, the body is copied into `cache` as it goes by.
+    """
+    import ijson
+    import urllib3
+
+    response.raw.decode_content = True
+    reader = response.raw
+    writer = None
+    if cache is not None:
+        writer = cache.writer(cache_key, closed=cache.is_closed(params))
+    if writer is not None:
+        reader = _TeeReader(reader, writer)
+    try:
+        columns_data = _stream_explorer_columns(reader)
+    except (ijson.JSONError, ValueError) as e:
+        logger.error(f"Error decoding response: {e}")
+        if writer is not None:
+            writer.abort()
+        return (0, f"ERROR: {str(e)}")
+    except (urllib3.exceptions.HTTPError, requests.exceptions.RequestException, OSError) as e:
+        #the connection dropped or timed out mid body, a status 0 error is retried like a failed request
+        logger.error(f"Error reading response: {e}")
+        if writer is not None:
+            writer.abort()
+        return (0, f"ERROR: {str(e)}")
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+    finally:
+        response.close()
+    if writer is not None:
+        writer.commit()
+    return (200, columns_data)
+
 
-    test_data = _extract_test_data(response_data)
-    test_data['test_ids'] = test_ids_to_fetch
-    test_data['start_time'] = start_time
-    test_data['end_time'] = end_time
-    test_data['interval'] = interval
-    test_data['metric_ids'] = metric_ids
-    test_data['dimension_ids'] = dimension_ids
-    test_data['sub_source_ids'] = sub_source_ids
-    test_data['tracepoints_ids'] = tracepoints_ids
-    test_data['response_data'] = response_data
-   
-    return (response.status_code, TestData(test_data))
+def _merge_test_data(extracted_list:list) -> dict:
+    """
+    _merge_test_data(extracted_list:list) -> dict: merges the dicts returned by `_extract_test_data` for several requests into one.
+    Columns are the union of all parts (dimensions, then metrics, then tracepoints, expanded debug headers in place of their tracepoint), rows of a part missing a column get NaN.
+    """
+    if len(extracted_list) == 1:
+        return extracted_list[0]
+
+    dimension_names = []
+    metric_names = []
+    tracepoint_names = []
+    for extracted in extracted_list:
+        for names, merged in ((extracted['dimension_names'], dimension_names),
+                              (extracted['metric_names'], metric_names),
+                              (extracted['tracepoint_names'], tracepoint_names)):
+            for name in names:
+                if name not in merged:
+                    merged.append(name)
+    #debug headers expanded by extraction workers are replaced by their columns in place, as `expand_headers` does
+    frame_columns = {}
+    for extracted in extracted_list:
+        frame_columns.update(dict.fromkeys(extracted['frame'].columns))
+    headers = _eager_headers()
+    columns = []
+    for name in dimension_names + metric_names + tracepoint_names:
+        if name in frame_columns:
+            columns.append(name)
+        elif name in headers:
+            columns.extend(column for column, _ in headers[name].values() if column in frame_columns)
+
+    def concat(frames):
+        frames = [df if list(df.columns) == columns else df.reindex(columns=columns) for df in frames]
+        frames = [df for df in frames if not df.empty] or frames[:1]
+        return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0].reset_index(drop=True)
+
+    return {
+        'frame':concat([extracted['frame'] for extracted in extracted_list]),
+        'columns':columns,
+        'dimension_names':dimension_names,
+        'metric_names': metric_names,
+        'tracepoint_names': tracepoint_names,
+        'header_errors': {hdr: sum(extracted.get('header_errors', {}).get(hdr, 0) for extracted in extracted_list)
+                          for hdr in TRACEPOINT_REGISTRY if any(hdr in extracted.get('header_errors', {}) for extracted in extracted_list)},
+    }
+
+
+def _merge_response_data(response_list:list) -> dict:
+    """_merge_response_data(response_list:list) -> dict: a single explorer response dict whose items are the items of all responses, in order. None if no response was kept."""
+    if not response_list:
+        return None
+    if len(response_list) == 1:
+        return response_list[0]
+    merged_items = dict(response_list[0]['data']['responseItems'][0])
+    merged_items['items'] = []
+    for response_data in response_list:
+        merged_items['items'].extend(response_data['data']['responseItems'][0]['items'])
+    merged = dict(response_list[0])
+    merged['data'] = dict(response_list[0]['data'])
+    merged['data']['responseItems'] = [merged_items]
+    return merged
 
 #---------
 def get_data(test_id:str=None,
@@ -683,7 +3558,17 @@ def get_data(test_id:str=None,
             sub_source_ids:list=SUB_SOURCE_IDS,
             tracepoints_ids:list=TRACEPOINTS_IDS,
             api_key:str=None,
-            
+            timeout=None,
+            max_parallel:int=1,
+            batch_size:int=None,
+            shard_hours:float=None,
+            retries:int=CP_SHARD_RETRIES,
+            use_cache:bool=True,
+            stream:bool=False,
+            keep_response:bool=False,
+            compact:bool=True,
+            scrub_policy:ScrubPolicy=None,
+            extract_processes:int=0,
              ) -> TestData:
     """
     get_data(test_id:str=None,
@@ -698,8 +3583,32 @@ def get_data(test_id:str=None,
             dimension_ids:list=DIMENSION_IDS,
             sub_source_ids:list=SUB_SOURCE_IDS,
             api_key:str=None,
-            
+            timeout=None,
+            max_parallel:int=1,
+            batch_size:int=None,
+            shard_hours:float=None,
+            retries:int=CP_SHARD_RETRIES,
+            use_cache:bool=True,
+            stream:bool=False,
+            keep_response:bool=False,
+            compact:bool=True,
+            scrub_policy:ScrubPolicy=None,
+            extract_processes:int=0,
              ) -> TestData:
+    `timeout` is a per-call (connect, read) timeout in seconds, defaults to the shared client timeout.
+    `max_parallel`/`batch_size` split the test ids into batches of `batch_size` (default: evenly over `max_parallel`) that are fetched
+    concurrently on `max_parallel` workers and merged into a single TestData with the same columns and metadata as a single fetch.
+    `shard_hours` splits long start_time/end_time ranges into sub-windows fetched concurrently and stitched in time order,
+    default (None) sizes them by data_type and interval (see `_shard_windows`), 0 disables sharding.
+    A failed window is retried up to `retries` times on its own.
+    `use_cache=False` bypasses the on-disk response cache `CP_CACHE` and the folder test list cache `CP_METADATA_CACHE`.
+    `stream=True` parses explorer responses (with ijson) while they are read from the socket instead of decoding whole bodies, it keeps memory flat on very large responses but decodes slower.
+    `keep_response=True` keeps the decoded explorer response in TestData.response_data (None otherwise), it turns streaming off.
+    `compact=True` stores dimensions as categoricals and metrics/header values as nullable Int32/Float32, see `compact_dtypes`.
+    `scrub_policy` flags outliers/errors and decides which rows are excluded, default CP_SCRUB_POLICY (see `ScrubPolicy`, `configure_scrub_policy`).
+    `extract_processes=N` extracts the responses (and expands their debug headers) on a shared pool of N worker processes instead of the fetch threads,
+    frames come back as Arrow IPC when pyarrow is installed. Not with keep_response.
+    `get_data_stream` yields the same rows in batches as the shards arrive, without building the whole TestData.
     """
     
     
@@ -718,13 +3627,255 @@ def get_data(test_id:str=None,
             sub_source_ids=sub_source_ids,
             tracepoints_ids=tracepoints_ids,
             api_key=api_key,
-            
-    
+            timeout=timeout,
+            max_parallel=max_parallel,
+            batch_size=batch_size,
+            shard_hours=shard_hours,
+            retries=retries,
+            use_cache=use_cache,
+            stream=stream,
+            keep_response=keep_response,
+            compact=compact,
+            scrub_policy=scrub_policy,
+            extract_processes=extract_processes,
     )
 
+
+def get_data_since(previous:TestData, end_time:str=None, retention_hours:float=None, api_key:str=None, **kwargs) -> tuple:
+    """
+    get_data_since(previous:TestData, end_time:str=None, retention_hours:float=None, api_key:str=None, **kwargs) -> tuple:
+    fetches only the data after `previous.end_time` (up to `end_time`, default now) for the same tests, interval, metrics and dimensions,
+    and appends it to `previous` in place. With `retention_hours` rows older than that before the new end_time are dropped.
+    `previous` needs a time dimension (TIME_DIMENSIONS) to replace the rows at its end_time, ValueError otherwise.
+    Extra kwargs (max_parallel, shard_hours, use_cache...) are passed to `get_data`, scrub_policy defaults to `previous.scrub_policy`. Returns (http_status_code, previous or error).
+
+    Usage:
+    http_status, test_data = cp.get_data(test_ids=test_ids, time_delta=6.0)
+    #every 5 minutes
+    http_status, test_data = cp.get_data_since(test_data, retention_hours=6.0)
+    """
+    logger.debug('---')
+    if end_time is None:
+        end_time = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S')
+    if end_time <= previous.end_time:
+        logger.debug(f"nothing to fetch, {previous.end_time} is not before {end_time}")
+        return (200, previous)
+    if previous.time_column() is None:
+        #rows at previous.end_time are fetched again and can only be replaced by their time
+        logger.error(f"no time dimension in {previous.dimensions}, can't refresh")
+        raise ValueError(f"refreshing needs a time dimension ({TIME_DIMENSIONS}), fetch with one of them in dimension_ids")
+
+    kwargs.setdefault('scrub_policy', previous.scrub_policy)
+    status_code, new_data = get_data(test_ids=previous.test_ids,
+                                     data_type=previous.data_type,
+                                     start_time=previous.end_time,
+                                     end_time=end_time,
+                                     interval=previous.interval,
+                                     metric_ids=previous.metric_ids,
+                                     dimension_ids=previous.dimension_ids,
+                                     sub_source_ids=previous.sub_source_ids,
+                                     tracepoints_ids=previous.tracepoints_ids,
+                                     api_key=api_key,
+                                     **kwargs)
+    if status_code != 200:
+        return (status_code, new_data)
+
+    logger.debug(f"appending {len(new_data.df)} rows fetched {previous.end_time} - {end_time}")
+    previous.append(new_data)
+    if retention_hours is not None:
+        previous.expire(retention_hours)
+    return (status_code, previous)
+
+
+def get_data_stream(test_id:str=None,
+                    test_ids:list=[],
+                    folder_id:str=None,
+                    test_type='all',
+                    data_type='aggregated',
+                    start_time:str=None,
+                    time_delta:float=1.0,
+                    end_time:str=None,
+                    interval:str=INTERVALS['15m'],
+                    metric_ids:list=METRIC_IDS,
+                    dimension_ids:list=DIMENSION_IDS,
+                    sub_source_ids:list=SUB_SOURCE_IDS,
+                    tracepoints_ids:list=TRACEPOINTS_IDS,
+                    api_key:str=None,
+                    timeout=None,
+                    max_parallel:int=1,
+                    batch_size:int=None,
+                    shard_hours:float=None,
+                    retries:int=CP_SHARD_RETRIES,
+                    use_cache:bool=True,
+                    stream:bool=False,
+                    compact:bool=True,
+                    scrub_policy:ScrubPolicy=None,
+                    extract_processes:int=0,
+                    rows:int=CP_BATCH_ROWS,
+                    ):
+    """
+    get_data_stream(..., rows:int=CP_BATCH_ROWS): generator version of `get_data` (same arguments, no keep_response) for long backfills.
+    Yields (200, DataFrame) batches of up to `rows` included rows (see `TestData.iter_batches`) as the shards arrive, in time order,
+    so only the shards being fetched (at most the number of workers) and the one being yielded are in memory.
+    Each shard is scrubbed on its own, so `scrub_policy` percentile thresholds are per shard, and its batches only have the columns it returned.
+    A failed shard (after its retries) yields its (http_status_code, error) and ends the stream.
+
+    Usage:
+    for http_status, batch in cp.get_data_stream(test_ids=test_ids, start_time='2024-01-01T00:00:00', end_time='2024-02-01T00:00:00'):
+        if http_status != 200:
+            #handle error
+            break
+        upload_df(batch, table_name)
+    """
+    logger.debug('---')
+    status_code, plan = _fetch_plan(test_id=test_id,
+                                    test_ids=test_ids,
+                                    folder_id=folder_id,
+                                    test_type=test_type,
+                                    data_type=data_type,
+                                    time_delta=time_delta,
+                                    start_time=start_time,
+                                    end_time=end_time,
+                                    interval=interval,
+                                    metric_ids=metric_ids,
+                                    dimension_ids=dimension_ids,
+                                    sub_source_ids=sub_source_ids,
+                                    tracepoints_ids=tracepoints_ids,
+                                    api_key=api_key,
+                                    timeout=timeout,
+                                    max_parallel=max_parallel,
+                                    batch_size=batch_size,
+                                    shard_hours=shard_hours,
+                                    retries=retries,
+                                    use_cache=use_cache,
+                                    stream=stream,
+                                    extract_processes=extract_processes)
+    if status_code != 200:
+        yield (status_code, plan)
+        return
+
+    import itertools
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor
+    params_iter = iter(plan['params_list'])
+    executor = ThreadPoolExecutor(max_workers=plan['workers'])
+    #keeps `workers` shards in flight, a new one is started when the oldest is taken
+    pending = deque((params, executor.submit(plan['fetch_batch'], params)) for params in itertools.islice(params_iter, plan['workers']))
+    try:
+        while pending:
+            params, future = pending.popleft()
+            result = future.result()
+            next_params = next(params_iter, None)
+            if next_params is not None:
+                pending.append((next_params, executor.submit(plan['fetch_batch'], next_params)))
+            status_code, shard = _test_data_from_results([result],
+                                                         test_ids=plan['test_ids'],
+                                                         start_time=params['startTime'],
+                                                         end_time=params['endTime'],
+                                                         interval=interval,
+                                                         metric_ids=metric_ids,
+                                                         dimension_ids=dimension_ids,
+                                                         sub_source_ids=sub_source_ids,
+                                                         tracepoints_ids=tracepoints_ids,
+                                                         data_type=data_type,
+                                                         compact=compact,
+                                                         scrub_policy=scrub_policy)
+            del result
+            if status_code != 200:
+                yield (status_code, shard)
+                return
+            for batch in shard.iter_batches(rows):
+                yield (200, batch)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
 ##########################################################################    
 
 
+def compact_dtypes(df:pd.DataFrame, dimensions:list=None, metrics:list=None) -> tuple:
+    """
+    compact_dtypes(df:pd.DataFrame, dimensions:list=None, metrics:list=None) -> tuple: (df with compact dtypes, memory report dict)
+    Dimension columns but time (TIME_DIMENSIONS, kept as strings so range filters and min/max keep working) become categoricals, metric columns Int32 (Int64 if a value doesn't fit, Float32 if not integral),
+    expanded header columns get their HEADER_COLUMN_TYPES type (String ones become categoricals when repetitive).
+    Nulls stay nulls (pd.NA). The report has bytes_before, bytes_after and bytes_saved.
+    """
+    before = int(df.memory_usage(deep=True).sum())
+    dimensions = dimensions or []
+    metrics = metrics or []
+    compacted = df.copy(deep=False)
+    for name in df.columns:
+        col = df[name]
+        if name in metrics:
+            compacted[name] = _compact_numeric(col)
+        elif HEADER_COLUMN_TYPES.get(name) in ('Int32', 'Float32'):
+            compacted[name] = _compact_numeric(col, HEADER_COLUMN_TYPES[name])
+        elif isinstance(col.dtype, pd.CategoricalDtype):
+            if len(col.cat.categories) > col.nunique():
+                compacted[name] = col.cat.remove_unused_categories()
+        elif name in TIME_DIMENSIONS:
+            continue
+        elif col.dtype == object or pd.api.types.is_string_dtype(col.dtype):
+            if name in dimensions or col.nunique(dropna=True) <= len(col) * CATEGORY_MAX_RATIO:
+                compacted[name] = col.astype('category')
+    after = int(compacted.memory_usage(deep=True).sum())
+    return compacted, {'bytes_before': before, 'bytes_after': after, 'bytes_saved': before - after}
+
+
+def _compact_numeric(col:pd.Series, column_type:str='Int32') -> pd.Series:
+    """_compact_numeric(col:pd.Series, column_type:str='Int32') -> pd.Series: nullable Int32 column, or the smallest nullable type that keeps the values"""
+    import numpy as np
+
+    values = _to_numeric(col)
+    if column_type == 'Float32':
+        return values.astype('Float32')
+    if isinstance(values.dtype, pd.api.extensions.ExtensionDtype):
+        values = values.astype('float64')
+    present = values.dropna()
+    if len(present) and not (np.floor(present) == present).all():
+        return values.astype('Float32')
+    if len(present) and (present.min() < np.iinfo(np.int32).min or present.max() > np.iinfo(np.int32).max):
+        return values.astype('Int64')
+    return values.astype('Int32')
+
+
+def _to_numeric(col:pd.Series) -> pd.Series:
+    """_to_numeric(col:pd.Series) -> pd.Series: pd.to_numeric(col, errors='coerce'), string columns that parse cleanly skip its per value type checks"""
+    import numpy as np
+
+    if col.dtype == object:
+        values = col.to_numpy(copy=True)
+        values[pd.isna(values)] = np.nan
+        try:
+            return pd.Series(values.astype(np.float64), index=col.index, name=col.name)
+        except (ValueError, TypeError):
+            pass
+    return pd.to_numeric(col, errors='coerce')
+
+
+def _to_datetime(col:pd.Series) -> pd.Series:
+    """_to_datetime(col:pd.Series) -> pd.Series: datetimes of a time column (strings or categorical strings), NaT where it doesn't parse"""
+    if isinstance(col.dtype, pd.CategoricalDtype):
+        col = col.astype(object)
+    return pd.to_datetime(col, errors='coerce')
+
+
+def _restore_dtypes(df:pd.DataFrame, dtypes:dict) -> pd.DataFrame:
+    """_restore_dtypes(df:pd.DataFrame, dtypes:dict) -> pd.DataFrame: df with the columns whose dtype isn't the saved one ({column: str(dtype)}) cast back to it"""
+    changed = {name: dtype for name, dtype in dtypes.items() if name in df.columns and str(df[name].dtype) != dtype}
+    for name, dtype in changed.items():
+        try:
+            df[name] = df[name].astype(dtype)
+        except (TypeError, ValueError) as e:
+            logger.debug(f"keeping {name} as {df[name].dtype}, not {dtype}: {e}")
+    return df
+
+
+def _object_rows(df:pd.DataFrame) -> list:
+    """_object_rows(df:pd.DataFrame) -> list: rows of df as lists of python values, None for nulls"""
+    values = df.astype(object)
+    return values.where(df.notna(), None).values.tolist()
+
+
 def sql_query(sql:str, test_data:dict, conn:sqlite3.Connection=None, ) -> pd.DataFrame:
     """
     Executes an SQL query on a SQLite database connection and returns the result as a pandas DataFrame.
@@ -734,6 +3885,7 @@ def sql_query(sql:str, test_data:dict, conn:sqlite3.Connection=None, ) -> pd.Dat
         test_data (dict): A dictionary containing the test data to be used for the query. It should have two keys:
                           'rows' - a list of rows, where each row is a list of values.
                           'columns' - a list of column names.
+                          or a 'df' key with the data as a pandas DataFrame instead of 'rows'.
         conn (sqlite3.Connection, optional): The SQLite database connection to use. If not provided, a new in-memory
                                              database connection will be created.
 
@@ -755,7 +3907,7 @@ def sql_query(sql:str, test_data:dict, conn:sqlite3.Connection=None, ) -> pd.Dat
 
     try:
         assert test_data != {}
-        df = pd.DataFrame(test_data['rows'], columns=test_data['columns'])
+        df = test_data['df'] if 'df' in test_data else pd.DataFrame(test_data['rows'], columns=test_data['columns'])
         df.to_sql('data', conn, index=False, if_exists='replace')
         sub_df = pd.read_sql_query(sql, conn)
         if(sub_df.empty):
@@ -775,27 +3927,296 @@ def sql_query(sql:str, test_data:dict, conn:sqlite3.Connection=None, ) -> pd.Dat
     
     return sub_df
 
-def get_summary(sub_df:pd.DataFrame, stat:str='p95', group_by='host', ):
-    """get_summary(sub_df:pd.DataFrame, stat:str='p95', group_by='host', )"""
+def get_summary(sub_df:pd.DataFrame, stat:str='p95', group_by='host', stats:list=None):
+    """
+    get_summary(sub_df:pd.DataFrame, stat:str='p95', group_by='host', stats:list=None) categorical group keys and nullable metric columns give the same plain result as object/float columns.
+    `stat` is 'mean', 'median' or any quantile 'pNN' ('p95', 'p99.9') of the numeric columns, `group_by` a column or a list of them.
+    With `stats` (any of SUMMARY_STATS and quantiles) all of them are computed in one grouped pass (see `_grouped_stats`), columns are a (metric, stat) MultiIndex.
+    """
     logger.debug('---')
-    if stat == "p95":
-        return sub_df.groupby(group_by).quantile(0.95)
-    if stat == "p75":
-        return sub_df.groupby(group_by).quantile(0.75)
-    if stat == "p50":
-        return sub_df.groupby(group_by).quantile(0.50)
+    if stats is not None:
+        return _grouped_stats(sub_df, group_by, stats)
+    keys = [group_by] if isinstance(group_by, str) else list(group_by)
+    grouped = sub_df[keys + _numeric_metrics(sub_df, keys)].groupby(group_by, observed=True)
     if stat == "mean":
-        return sub_df.groupby(group_by).mean()
+        return _plain_summary(grouped.mean())
     if stat == "median":
-        return sub_df.groupby(group_by).median()
+        return _plain_summary(grouped.median())
+    quantile = _stat_quantile(stat)
+    if quantile is not None:
+        return _plain_summary(grouped.quantile(quantile))
     raise ValueError(f"Unsupported stat {stat}")
 
-def get_enumerations(api_key:str=None) -> tuple:
+def _numeric_metrics(df:pd.DataFrame, keys:list) -> list:
+    """_numeric_metrics(df:pd.DataFrame, keys:list) -> list: the columns of df summarized by default, numeric ones that aren't group keys or scrub flags (sql returns those as 0/1)"""
+    return [name for name in df.columns if name not in keys and name not in SCRUB_FLAG_COLUMNS
+            and pd.api.types.is_numeric_dtype(df[name].dtype) and not pd.api.types.is_bool_dtype(df[name].dtype)]
+
+def _stat_quantile(stat:str) -> float:
+    """_stat_quantile(stat:str) -> float: the quantile of a 'pNN' stat ('p99.9' -> 0.999), None if it isn't one"""
+    if not isinstance(stat, str) or not stat.startswith('p'):
+        return None
+    try:
+        quantile = float(stat[1:]) / 100
+    except ValueError:
+        return None
+    return quantile if 0 <= quantile <= 1 else None
+
+def _grouped_stats(sub_df:pd.DataFrame, group_by, stats:list) -> pd.DataFrame:
+    """
+    _grouped_stats(sub_df:pd.DataFrame, group_by, stats:list) -> pd.DataFrame: every stat of every numeric non group_by column of sub_df per group, in one pass.
+    Rows are grouped once, each metric is sorted by (group, value) once so all quantiles, median, min and max are lookups (linear interpolation, like pandas),
+    count, sum, mean and std (ddof=1) are bincounts. Columns are a (metric, stat) MultiIndex, count columns are int64, the rest float64.
+    """
+    import numpy as np
+    for stat in stats:
+        if stat not in SUMMARY_STATS and _stat_quantile(stat) is None:
+            raise ValueError(f"Unsupported stat {stat}")
+    keys = [group_by] if isinstance(group_by, str) else list(group_by)
+    metrics = _numeric_metrics(sub_df, keys)
+    index, codes, in_group = _group_codes(sub_df, keys)
+    ngroups = len(index)
+
+    columns = {}
+    for metric in metrics:
+        values = pd.to_numeric(sub_df[metric], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)[in_group]
+        present = ~np.isnan(values)
+        metric_codes, values = codes[present], values[present]
+        #by value, then by group keeping the value order, 4x faster than a lexsort
+        order = np.argsort(values)
+        order = order[np.argsort(metric_codes[order], kind='stable')]
+        metric_codes, values = metric_codes[order], values[order]
+        counts = np.bincount(metric_codes, minlength=ngroups)
+        starts = np.cumsum(counts) - counts
+        has_values = counts > 0
+        sums = np.bincount(metric_codes, weights=values, minlength=ngroups)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.where(has_values, sums / counts, np.nan)
+
+        def quantile(q):
+            if not len(values):
+                return np.full(ngroups, np.nan)
+            position = np.where(has_values, starts + q * (counts - 1), 0)
+            low = np.floor(position).astype(np.int64)
+            high = np.ceil(position).astype(np.int64)
+            return np.where(has_values, values[low] + (values[high] - values[low]) * (position - low), np.nan)
+
+        for stat in stats:
+            if stat == 'count':
+                column = counts.astype(np.int64)
+            elif stat == 'sum':
+                column = sums
+            elif stat == 'mean':
+                column = means
+            elif stat in ('std', 'stddev'):
+                squares = np.bincount(metric_codes, weights=(values - means[metric_codes]) ** 2, minlength=ngroups)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    column = np.where(counts > 1, np.sqrt(squares / (counts - 1)), np.nan)
+            elif stat == 'min':
+                column = quantile(0.0)
+            elif stat == 'max':
+                column = quantile(1.0)
+            elif stat == 'median':
+                column = quantile(0.5)
+            else:
+                column = quantile(_stat_quantile(stat))
+            columns[(metric, stat)] = column
+
+    summary_df = pd.DataFrame(columns, index=index)
+    summary_df.columns = pd.MultiIndex.from_tuples(list(columns), names=['metric', 'stat'])
+    return summary_df
+
+def _group_codes(df:pd.DataFrame, keys:list) -> tuple:
+    """
+    _group_codes(df:pd.DataFrame, keys:list) -> tuple: (index, codes, in_group) of grouping df by the `keys` columns,
+    index has the sorted group keys (categoricals as plain values), codes the group number of each row in a group, in_group which rows are (keys not null).
+    """
+    import numpy as np
+    grouped = df.groupby(keys, observed=True)
+    index = grouped.size().index
+    if isinstance(index, pd.MultiIndex):
+        index = index.set_levels([level.astype(level.categories.dtype) if isinstance(level.dtype, pd.CategoricalDtype) else level for level in index.levels])
+    elif isinstance(index.dtype, pd.CategoricalDtype):
+        index = index.astype(index.categories.dtype)
+    codes = grouped.ngroup().to_numpy(dtype='float64', na_value=np.nan)
+    in_group = ~np.isnan(codes)
+    #small codes stable sort with a radix sort
+    codes = codes[in_group].astype(np.int16 if len(index) < 2**15 else np.int64)
+    return index, codes, in_group
+
+def build_sketches(df:pd.DataFrame, group_by='test', metrics:list=None, relative_accuracy:float=CP_SKETCH_ACCURACY) -> dict:
+    """
+    build_sketches(df:pd.DataFrame, group_by='test', metrics:list=None, relative_accuracy:float=CP_SKETCH_ACCURACY) -> dict:
+    {group: {metric: QuantileSketch}} of df's `metrics` (default the numeric columns but group_by) per group (a tuple with several group_by columns),
+    in one vectorized pass per metric. Sketches of other fetches, shards or get_data_stream batches merge with `merge_sketches`.
+    """
+    import numpy as np
+    keys = [group_by] if isinstance(group_by, str) else list(group_by)
+    if metrics is None:
+        metrics = _numeric_metrics(df, keys)
+    index, codes, in_group = _group_codes(df, keys)
+    ngroups = len(index)
+    template = QuantileSketch(relative_accuracy=relative_accuracy)
+    #numpy scalars (nullable Int32 keys) as python ones, so groups of other sketch sets and `load_sketches` match them
+    group_keys = [_plain_group(group) for group in index]
+    sketch_set = {group: {} for group in group_keys}
+
+    for metric in metrics:
+        values = pd.to_numeric(df[metric], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)[in_group]
+        present = ~np.isnan(values)
+        metric_codes, values = codes[present].astype(np.int64), values[present]
+        counts = np.bincount(metric_codes, minlength=ngroups)
+        sums = np.bincount(metric_codes, weights=values, minlength=ngroups)
+        sum_squares = np.bincount(metric_codes, weights=values ** 2, minlength=ngroups)
+        minimums = np.full(ngroups, np.nan)
+        maximums = np.full(ngroups, np.nan)
+        if len(values):
+            order = np.argsort(metric_codes, kind='stable')
+            starts = np.flatnonzero(np.diff(metric_codes[order], prepend=-1))
+            groups = metric_codes[order][starts]
+            minimums[groups] = np.minimum.reduceat(values[order], starts)
+            maximums[groups] = np.maximum.reduceat(values[order], starts)
+        zero = np.abs(values) <= SKETCH_MIN_VALUE
+        zero_counts = np.bincount(metric_codes[zero], minlength=ngroups)
+
+        #(group, bucket key) pairs counted at once, then split by group
+        stores = []
+        for selected, magnitudes in ((values > SKETCH_MIN_VALUE, values), (values < -SKETCH_MIN_VALUE, -values)):
+            bucket_keys = template._keys(magnitudes[selected])
+            if not len(bucket_keys):
+                stores.append(None)
+                continue
+            low = bucket_keys.min()
+            span = int(bucket_keys.max() - low + 1)
+            pairs, pair_counts = np.unique(metric_codes[selected] * span + (bucket_keys - low), return_counts=True)
+            bounds = np.searchsorted(pairs // span, np.arange(ngroups + 1))
+            stores.append(((pairs % span + low).tolist(), pair_counts.tolist(), bounds))
+
+        for code, group in enumerate(group_keys):
+            bins = []
+            for store in stores:
+                if store is None:
+                    bins.append({})
+                else:
+                    bucket_keys, bucket_counts, bounds = store
+                    bins.append(dict(zip(bucket_keys[bounds[code]:bounds[code + 1]], bucket_counts[bounds[code]:bounds[code + 1]])))
+            sketch = QuantileSketch(relative_accuracy=relative_accuracy)
+            sketch._add_parts(bins[0], bins[1], int(zero_counts[code]), int(counts[code]), float(sums[code]), float(sum_squares[code]),
+                              float(minimums[code]), float(maximums[code]))
+            sketch_set[group][metric] = sketch
+    return sketch_set
+
+def merge_sketches(*sketch_sets) -> dict:
+    """merge_sketches(*sketch_sets) -> dict: one {group: {metric: QuantileSketch}} of all the groups and metrics of several `build_sketches` results, the inputs aren't changed"""
+    merged = {}
+    for sketch_set in sketch_sets:
+        for group, sketches in sketch_set.items():
+            merged_sketches = merged.setdefault(group, {})
+            for metric, sketch in sketches.items():
+                if metric in merged_sketches:
+                    merged_sketches[metric].merge(sketch)
+                else:
+                    merged_sketches[metric] = sketch.copy()
+    return merged
+
+def sketch_summary(sketch_set:dict, stat:str='p95', stats:list=None, names:list=None) -> pd.DataFrame:
+    """
+    sketch_summary(sketch_set:dict, stat:str='p95', stats:list=None, names:list=None) -> pd.DataFrame: `get_summary` of a {group: {metric: QuantileSketch}},
+    quantiles (and median) are within the sketches' relative accuracy, count, sum, mean, std, min and max are exact. `names` names the index levels.
+    """
+    import math
+    for name in ([stat] if stats is None else stats):
+        if name not in SUMMARY_STATS and _stat_quantile(name) is None:
+            raise ValueError(f"Unsupported stat {name}")
+
+    def value(sketch, name):
+        if sketch is None:
+            return 0 if name == 'count' else float('nan')
+        if name == 'count':
+            return sketch.count
+        if name == 'sum':
+            return sketch.sum
+        if name == 'mean':
+            return sketch.mean
+        if name in ('std', 'stddev'):
+            return sketch.std
+        if name == 'min':
+            return sketch.min
+        if name == 'max':
+            return sketch.max
+        if name == 'median':
+            return sketch.quantile(0.5)
+        return sketch.quantile(_stat_quantile(name))
+
+    groups = sorted(sketch_set)
+    metrics = []
+    for sketches in sketch_set.values():
+        metrics.extend(metric for metric in sketches if metric not in metrics)
+    if groups and isinstance(groups[0], tuple):
+        index = pd.MultiIndex.from_tuples(groups, names=names)
+    else:
+        index = pd.Index(groups, name=names[0] if names else None)
+    columns = {(metric, name): [value(sketch_set[group].get(metric), name) for group in groups]
+               for metric in metrics for name in ([stat] if stats is None else stats)}
+    if stats is None:
+        return pd.DataFrame({metric: values for (metric, _), values in columns.items()}, index=index, dtype='float64')
+    summary_df = pd.DataFrame(columns, index=index)
+    summary_df.columns = pd.MultiIndex.from_tuples(list(columns), names=['metric', 'stat'])
+    return summary_df
+
+def _plain_group(group):
+    """_plain_group(group): a group key (or tuple of them) with numpy scalars converted to python ones"""
+    import numpy as np
+    if isinstance(group, tuple):
+        return tuple(_plain_group(value) for value in group)
+    return group.item() if isinstance(group, np.generic) else group
+
+def _dump_group_value(value):
+    """_dump_group_value(value): a group key value as json, timestamps as {'timestamp': iso string} so `_load_group_value` gets the same key back"""
+    value = _plain_group(value)
+    if isinstance(value, pd.Timestamp):
+        return {'timestamp': value.isoformat()}
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    raise TypeError(f"group key {value!r} of type {type(value).__name__} can't be dumped")
+
+def _load_group_value(value):
+    """_load_group_value(value): the group key value of a `_dump_group_value` json"""
+    if isinstance(value, dict):
+        return pd.Timestamp(value['timestamp'])
+    return value
+
+def dump_sketches(sketch_set:dict) -> str:
+    """dump_sketches(sketch_set:dict) -> str: json of a {group: {metric: QuantileSketch}}, `load_sketches` reads it back with the same group keys (str, int, float, bool, None, Timestamp)"""
+    return json.dumps([{'group': [_dump_group_value(value) for value in group] if isinstance(group, tuple) else _dump_group_value(group),
+                        'metric': metric, 'sketch': sketch.to_dict()}
+                       for group, sketches in sketch_set.items() for metric, sketch in sketches.items()])
+
+def load_sketches(text:str) -> dict:
+    """load_sketches(text:str) -> dict: the {group: {metric: QuantileSketch}} of a `dump_sketches` json"""
+    sketch_set = {}
+    for entry in json.loads(text):
+        group = tuple(_load_group_value(value) for value in entry['group']) if isinstance(entry['group'], list) else _load_group_value(entry['group'])
+        sketch_set.setdefault(group, {})[entry['metric']] = QuantileSketch.from_dict(entry['sketch'])
+    return sketch_set
+
+def _plain_summary(summary_df:pd.DataFrame) -> pd.DataFrame:
+    """_plain_summary(summary_df:pd.DataFrame) -> pd.DataFrame: float64 columns and a plain index"""
+    if isinstance(summary_df.index.dtype, pd.CategoricalDtype):
+        summary_df.index = summary_df.index.astype(summary_df.index.categories.dtype)
+    nullable = [c for c in summary_df.columns if isinstance(summary_df[c].dtype, pd.api.extensions.ExtensionDtype)]
+    if nullable:
+        summary_df = summary_df.astype({c: 'float64' for c in nullable})
+    return summary_df
+
+def get_enumerations(api_key:str=None, timeout=None, use_cache:bool=True) -> tuple:
     """
     Retrieves enumerations from the Catchpoint API.
 
     Args:
         api_key (str, optional): The API key to authenticate the request. If not provided, it will be loaded from the environment variable 'CP_API_KEY'.
+        timeout (optional): per-call (connect, read) timeout in seconds, defaults to the shared client timeout.
+        use_cache (bool, optional): answer from `CP_METADATA_CACHE` while the cached enumerations are younger than their ttl. Defaults to True.
 
     Returns:
         tuple: A tuple containing the HTTP status code and a dictionary of enumerations.
@@ -811,20 +4232,27 @@ def get_enumerations(api_key:str=None) -> tuple:
     if api_key is None:
         load_env() 
         api_key = os.environ['CP_API_KEY']
+
+    cache = CP_METADATA_CACHE if use_cache else None
+    if cache is not None:
+        cache_key = cache.key(api_key)
+        enumerations = cache.get('enumerations', cache_key)
+        if enumerations is not None:
+            logger.debug("metadata cache hit, enumerations")
+            return (200, enumerations)
     
-    url="https://io.catchpoint.com/api/v2/tests/explorer/enumeration?includeDimensions=true&includeMetrics=true&includeSubSourceTypes=true&includeTimeIntervals=true"
+    url=CP_CLIENT.url("/api/v2/tests/explorer/enumeration?includeDimensions=true&includeMetrics=true&includeSubSourceTypes=true&includeTimeIntervals=true")
     enumerations = {}
 
     headers = {
     'accept': 'application/json',
     'Authorization': f'Bearer {api_key}'    }
     
-    response = requests.get(url, headers=headers)
+    response = CP_CLIENT.get(url, headers=headers, timeout=timeout)
     if response.status_code == 200:
-        
-        sections = response.json()['data']['sections']
-        for section in sections:
-            enumerations[section['section']] = section['enumeration']
+        enumerations = _parse_enumerations(response.json())
+        if cache is not None:
+            cache.put('enumerations', cache_key, enumerations)
     else:
         logger.error(f"Error: {response.status_code}")
         logger.error(response.text)
@@ -833,6 +4261,278 @@ def get_enumerations(api_key:str=None) -> tuple:
     return (response.status_code, enumerations)
 
 
+def _parse_enumerations(enumerations_json:dict) -> dict:
+    """_parse_enumerations(enumerations_json:dict) -> dict: section name -> enumeration"""
+    enumerations = {}
+    for section in enumerations_json['data']['sections']:
+        enumerations[section['section']] = section['enumeration']
+    return enumerations
+
+
+######################################################################
+##### ASYNC
+
+def _get_api_key(api_key:str=None) -> str:
+    """_get_api_key(api_key:str=None) -> str: the given key or CP_API_KEY from the env file"""
+    if not api_key:
+        load_env()
+        api_key = os.environ.get('CP_API_KEY')
+    if not api_key:
+        logger.error("API key not provided")
+        raise ValueError("API key not provided")
+    return api_key
+
+
+async def tests_async(folder_id, test_type='all', api_key:str=None, timeout=None, fields:list=None, use_cache:bool=True) -> tuple:
+    """tests_async(folder_id, test_type='all', api_key:str=None, timeout=None, fields:list=None, use_cache:bool=True) -> tuple: asyncio version of `tests`, all pages after the first are fetched concurrently"""
+    import asyncio
+
+    logger.debug('---')
+    if test_type not in TESTTYPES and test_type != 'all':
+        logger.error(f"test type {test_type}")
+        raise ValueError(f"Unsupported test type {test_type}")
+    api_key = _get_api_key(api_key)
+    cache = CP_METADATA_CACHE if use_cache else None
+    if cache is not None:
+        cache_keys = _tests_cache_keys(cache, api_key, folder_id, test_type, fields)
+        tests = cache.get('tests', *cache_keys)
+        if tests is not None:
+            return (200, _project_tests_details(tests, fields))
+
+    async def fetch_page(page_number):
+        params = _tests_details_params(folder_id, page_number=page_number, fields=fields)
+        status_code, body, _ = await CP_ASYNC_CLIENT.get(CP_ASYNC_CLIENT.url("/api/v2/tests/"), api_key=api_key, params=params, timeout=timeout)
+        if status_code != 200:
+            logger.error(f"Error: {status_code}")
+            logger.error(body)
+            return (status_code, body)
+        return (status_code, json.loads(body))
+
+    status_code, tests_json = await fetch_page(1)
+    if status_code != 200:
+        return (status_code, tests_json)
+
+    pagination = _tests_pagination(tests_json)
+    fetched = None
+    while True:
+        try:
+            page_numbers = pagination.send(fetched)
+        except StopIteration as done:
+            pages = done.value
+            break
+        results = await asyncio.gather(*[fetch_page(page_number) for page_number in page_numbers])
+        for status_code, page_json in results:
+            if status_code != 200:
+                return (status_code, page_json)
+        fetched = [page_json for _, page_json in results]
+
+    tests = {}
+    for page_json in pages:
+        tests.update(_parse_tests_details(page_json, test_type=test_type, fields=fields))
+    if cache is not None:
+        cache.put('tests', cache_keys[0], tests)
+    return (200, tests)
+
+
+async def folders_async(folder_id, api_key:str=None, timeout=None, use_cache:bool=True) -> tuple:
+    """folders_async(folder_id, api_key:str=None, timeout=None, use_cache:bool=True) -> tuple: asyncio version of `folders`"""
+    logger.debug('---')
+    api_key = _get_api_key(api_key)
+    cache = CP_METADATA_CACHE if use_cache else None
+    if cache is not None:
+        cache_key = cache.key(api_key, folder_id)
+        folder_details = cache.get('folders', cache_key)
+        if folder_details is not None:
+            return (200, folder_details)
+
+    status_code, body, _ = await CP_ASYNC_CLIENT.get(CP_ASYNC_CLIENT.url(f"/api/v2/folders/{folder_id}"), api_key=api_key, params={'showInheritedProperties':'true'}, timeout=timeout)
+    if status_code != 200:
+        logger.error(f"Error: {status_code}")
+        logger.error(body)
+        return (status_code, body)
+    folder_details = _parse_folder_details(json.loads(body))
+    if cache is not None:
+        cache.put('folders', cache_key, folder_details)
+    return (status_code, folder_details)
+
+
+async def get_enumerations_async(api_key:str=None, timeout=None, use_cache:bool=True) -> tuple:
+    """get_enumerations_async(api_key:str=None, timeout=None, use_cache:bool=True) -> tuple: asyncio version of `get_enumerations`"""
+    logger.debug('---')
+    api_key = _get_api_key(api_key)
+    cache = CP_METADATA_CACHE if use_cache else None
+    if cache is not None:
+        cache_key = cache.key(api_key)
+        enumerations = cache.get('enumerations', cache_key)
+        if enumerations is not None:
+            return (200, enumerations)
+
+    url = CP_ASYNC_CLIENT.url("/api/v2/tests/explorer/enumeration?includeDimensions=true&includeMetrics=true&includeSubSourceTypes=true&includeTimeIntervals=true")
+    status_code, body, _ = await CP_ASYNC_CLIENT.get(url, api_key=api_key, timeout=timeout)
+    if status_code != 200:
+        logger.error(f"Error: {status_code}")
+        logger.error(body)
+        return (status_code, body)
+    enumerations = _parse_enumerations(json.loads(body))
+    if cache is not None:
+        cache.put('enumerations', cache_key, enumerations)
+    return (status_code, enumerations)
+
+
+async def _request_test_data_async(params:dict, data_type='aggregated', api_key:str=None, timeout=None, use_cache:bool=True, raw:bool=False) -> tuple:
+    """_request_test_data_async(params:dict, data_type='aggregated', api_key:str=None, timeout=None, use_cache:bool=True, raw:bool=False) -> tuple: asyncio version of `_request_test_data`, bodies are decoded in a worker thread"""
+    import asyncio
+
+    test_data_end_point = CP_ASYNC_CLIENT.url(f"/api/v2/tests/explorer/{data_type}")
+    logger.debug(f"End Point URL: {test_data_end_point}")
+    logger.debug(f"Params: {json.dumps(params, indent=2)}")
+    cache = CP_CACHE if use_cache else None
+    if cache is not None:
+        cache_key = cache.key(api_key, test_data_end_point, params)
+        #reading and gunzipping a cached body is file io, it runs in a worker thread like the decoding
+        cached_body = await asyncio.to_thread(cache.get, cache_key)
+        if cached_body is not None:
+            logger.debug(f"cache hit {cache_key}")
+            return (200, cached_body if raw else await asyncio.to_thread(json.loads, cached_body))
+    status_code, body, response_headers = await CP_ASYNC_CLIENT.get(test_data_end_point, api_key=api_key, params=params, timeout=timeout)
+    logger.debug(f"Response satus code: {status_code}")
+    if status_code != 200:
+        logger.error(f"Req {test_data_end_point} error {status_code}")
+        logger.debug(f"Response: {body}")
+        logger.debug(f"Response Headers: {response_headers}")
+        return (status_code, body)
+    if raw:
+        if cache is not None:
+            await asyncio.to_thread(cache.put, cache_key, body.encode(), closed=cache.is_closed(params))
+        return (status_code, body.encode())
+    try:
+        response_data = await asyncio.to_thread(json.loads, body)
+    except json.JSONDecodeError as e:
+        logger.error(f"Error decoding response: {e}")
+        return (0,f"ERROR: {str(e)}\n\n {body}" )
+    if cache is not None:
+        await asyncio.to_thread(cache.put, cache_key, body.encode(), closed=cache.is_closed(params))
+    return (status_code, response_data)
+
+
+async def get_data_async(test_id:str=None,
+            test_ids:list=[],
+            folder_id:str=None,
+            test_type='all',
+            data_type='aggregated',
+            start_time:str=None,
+            time_delta:float=1.0,
+            end_time:str=None,
+            interval:str=INTERVALS['15m'],
+            metric_ids:list=METRIC_IDS,
+            dimension_ids:list=DIMENSION_IDS,
+            sub_source_ids:list=SUB_SOURCE_IDS,
+            tracepoints_ids:list=TRACEPOINTS_IDS,
+            api_key:str=None,
+            timeout=None,
+            max_parallel:int=1,
+            batch_size:int=None,
+            shard_hours:float=None,
+            retries:int=CP_SHARD_RETRIES,
+            use_cache:bool=True,
+            keep_response:bool=False,
+            compact:bool=True,
+            scrub_policy:ScrubPolicy=None,
+            extract_processes:int=0,
+             ) -> tuple:
+    """
+    get_data_async(...) -> tuple: asyncio version of `get_data`, same arguments (but `stream`) and (http_status_code, TestData) result.
+    Batches and time shards run as concurrent requests on `CP_ASYNC_CLIENT`, decoding, extraction (worker process with extract_processes) and the final merge run in worker threads so the loop keeps serving other requests.
+    """
+    import asyncio
+    import aiohttp
+
+    logger.debug('---')
+    api_key = _get_api_key(api_key)
+    if(not test_id  and not test_ids  and not folder_id):
+        logger.error("input error, throwing exception")
+        raise ValueError("test_id[s] or folder_id is a required argument")
+
+    if test_id:
+        test_ids_to_fetch = [str(test_id)]
+    elif test_ids:
+        test_ids_to_fetch = [str(test_id) for test_id in test_ids]
+    else:
+        resp_code, tests_details = await tests_async(folder_id, test_type=test_type, api_key=api_key, timeout=timeout, fields=FOLDER_TESTS_FIELDS, use_cache=use_cache)
+        if resp_code != 200:
+            logger.error(f" {resp_code} response code")
+            logger.error(f"{tests_details}")
+            return resp_code, tests_details
+        test_ids_to_fetch = list(tests_details.keys())
+        logger.debug(f"Fetchinng Test ids in folder {folder_id}: {test_ids_to_fetch}")
+
+    start_time, end_time = _time_window(start_time, end_time, time_delta)
+    if len(test_ids_to_fetch) < 1:
+        logger.error("No test ids found ")
+        return 0, "No Test ids Found"
+
+    params_list, workers = _explorer_params(test_ids_to_fetch, start_time, end_time,
+                                            data_type=data_type,
+                                            interval=interval,
+                                            metric_ids=metric_ids,
+                                            dimension_ids=dimension_ids,
+                                            sub_source_ids=sub_source_ids,
+                                            tracepoints_ids=tracepoints_ids,
+                                            max_parallel=max_parallel,
+                                            batch_size=batch_size,
+                                            shard_hours=shard_hours)
+    semaphore = asyncio.Semaphore(workers)
+    pool = None
+    if extract_processes and keep_response:
+        logger.warning("keep_response needs the decoded response, extracting in threads")
+    elif extract_processes:
+        pool = _extract_pool(extract_processes)
+
+    async def fetch_batch(params):
+        async with semaphore:
+            for attempt in range(retries + 1):
+                try:
+                    status_code, response_data = await _request_test_data_async(params, data_type=data_type, api_key=api_key, timeout=timeout, use_cache=use_cache, raw=not keep_response)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logger.error(f"Request error: {e}")
+                    status_code, response_data = 0, f"ERROR: {str(e)}"
+                if status_code == 200 and pool is not None:
+                    try:
+                        return status_code, None, await asyncio.to_thread(_extract_in_process, pool, response_data)
+                    except Exception as e:
+                        logger.error(f"Extraction error: {e}")
+                        return 0, f"ERROR: {str(e)}", None
+                if status_code == 200 and not keep_response:
+                    try:
+                        return status_code, None, await asyncio.to_thread(_extract_test_data_body, response_data)
+                    except ValueError as e:
+                        logger.error(f"Error decoding response: {e}")
+                        status_code, response_data = 0, f"ERROR: {str(e)}"
+                elif status_code == 200:
+                    return status_code, response_data, await asyncio.to_thread(_extract_test_data, response_data)
+                if not _retryable(status_code):
+                    break
+                if attempt < retries:
+                    logger.warning(f"shard {params['startTime']} - {params['endTime']} failed with {status_code}, retry {attempt + 1}/{retries}")
+                    await asyncio.sleep(2 ** attempt)
+            return status_code, response_data, None
+
+    results = await asyncio.gather(*[fetch_batch(params) for params in params_list])
+    #merging, scrubbing and compacting a large fetch takes a while, the loop keeps serving other requests meanwhile
+    return await asyncio.to_thread(_test_data_from_results, list(results),
+                                   test_ids=test_ids_to_fetch,
+                                   start_time=start_time,
+                                   end_time=end_time,
+                                   interval=interval,
+                                   metric_ids=metric_ids,
+                                   dimension_ids=dimension_ids,
+                                   sub_source_ids=sub_source_ids,
+                                   tracepoints_ids=tracepoints_ids,
+                                   data_type=data_type,
+                                   compact=compact,
+                                   scrub_policy=scrub_policy)
+
+
 ################################## testies 
 
 
@@ -890,82 +4590,251 @@ def _test(folder_id=73339, api_key = os.environ.get('CP_API_KEY')):
 
 
 def parse_info_hdrs(dbg_header, conversion_dict=None):
-  
+    """
+    parse_info_hdrs(dbg_header, conversion_dict=None) -> dict: {column name: value string or None} of a single "[k=v,k=v]" header value,
+    keys are mapped to column names by `conversion_dict` (keys it doesn't know are left out). None if the value is null, "unknown" or malformed.
+    """
     import re
-    if "unknown" in dbg_header.lower():
+
+    if not isinstance(dbg_header, str) or "unknown" in dbg_header.lower():
         return None
-    if pd.isnull(dbg_header) or dbg_header is None:
+    value = re.sub(r'[\[\]]', '', dbg_header.strip())
+    if not re.fullmatch(HEADER_VALUE_PATTERN, value):
+        logger.debug(f"failed to parse :{dbg_header}")
         return None
-    
-    try:
-        value = re.sub(r'[\[\]]', '', dbg_header)
-        value_list = value.split(',')
-        value_dict = {}
-        for v in value_list:
-            key, val = v.split('=')
-            if val == '':
-                val = None
-            if conversion_dict:
-                if key in conversion_dict.keys():
-                    key_value = conversion_dict[key][0]
-                else:
-                    #logger.debug(f"key {key} is not in {conversion_dict}")
-                    exit(1)
-
-            value_dict[key_value] = val
-        
-        return value_dict
-    except Exception as e:
-        logger.debug(f"failed to parse :{value}")
-        logger.error(f"Error extracting key-value pairs: {e}")
-        sys.exit(1)
-        
+    value_dict = {}
+    for pair in value.split(','):
+        key, val = pair.split('=')
+        if conversion_dict:
+            if key not in conversion_dict:
+                continue
+            key = conversion_dict[key][0]
+        value_dict[key] = val if val != '' else None
+    return value_dict
 
 
+def expand_headers(df:pd.DataFrame, headers:dict=None) -> tuple:
+    """
+    expand_headers(df:pd.DataFrame, headers:dict=None) -> tuple: (df, errors)
+    replaces the "[k=v,k=v]" debug header columns of df (`headers`, default the eager kv tracepoints of TRACEPOINT_REGISTRY: column -> {key: [column name, type]}) with one typed column per key, in place,
+    String values stay strings, Int32/Float32 become nullable numbers (see `_compact_numeric`). Null and "unknown" values give nulls.
+    Malformed values (not key=value pairs, or a value that doesn't convert to its type) give nulls too, errors counts them per header column.
+    Each distinct string of a column is parsed and converted once (or taken from `CP_HEADER_CACHE`) and broadcast to its rows.
+    """
+    import numpy as np
 
-def extract_and_combine(df: pd.DataFrame) -> pd.DataFrame:
-    columns_to_check = {'x_aka_info': X_AKA_INFO, 
-                        'x_es_info' : X_ES_INFO, 
-                        'akamai_request_bc': AKAMAI_REQUEST_BC
-    }
-    
-    new_dfs = []
-    new_df_count = 0
-    for col in columns_to_check.keys():
-        if col in df.columns:
-            #logger.debug(f"found {col}")
-            #logger.debug(f"{columns_to_check[col]}")
-          
-            key_value_lists = df[col].dropna().apply(lambda item: parse_info_hdrs(item, conversion_dict=columns_to_check[col])) 
-            
-            key_value_dicts = [d for d in key_value_lists.tolist() if d is not None]
-            
-            if new_df_count == 0:
-                logger.debug(f"key_value_lists: {key_value_dicts[0] if key_value_dicts else 'Empty'}")
-            
-            if key_value_dicts:
-                new_df = pd.DataFrame(key_value_dicts)
-                new_df = new_df.reindex(df.index) 
-                new_dfs.append(new_df)
-            new_df_count += 1
-
-    if new_df_count == 0:
+    headers = _eager_headers() if headers is None else headers
+    present = [col for col in headers if col in df.columns]
+    if not present:
         logger.warning("No columns found in the dataframe to extract key-value pairs")
         logger.debug(f"df columns passed: {df.columns}")
-        return df
+        return df, {}
+
+    expanded = {}
+    errors = {}
+    for col in present:
+        codes, uniques = pd.factorize(df[col].astype(object))
+        if CP_HEADER_CACHE is not None:
+            CP_HEADER_CACHE.record(len(codes), len(uniques))
+        columns, malformed = _intern_header_values(col, np.asarray(uniques, dtype=object), headers[col])
+        #code -1 (null) picks the None/False appended last
+        for name, column_type in headers[col].values():
+            raw = pd.Series(columns[name], dtype=object)
+            if column_type in ('Int32', 'Float32'):
+                typed = _compact_numeric(raw, column_type)
+                malformed |= (raw.notna() & typed.isna()).to_numpy()
+                values = typed.array.take(codes, allow_fill=True)
+            else:
+                values = np.append(columns[name], None)[codes]
+            expanded[name] = pd.Series(values, index=df.index, dtype=values.dtype)
+        errors[col] = int(np.append(malformed, False)[codes].sum())
+        if errors[col]:
+            logger.warning(f"{errors[col]} malformed {col} values set to null")
+
+    #expanded columns take the place of their header column
+    order = []
+    for name in df.columns:
+        order.extend([column for column, _ in headers[name].values()] if name in present else [name])
+    df = pd.concat([df.drop(columns=present), pd.DataFrame(expanded, index=df.index)], axis=1)
+    return df[order], errors
+
+
+def _intern_header_values(column:str, uniques, conversion_dict:dict) -> tuple:
+    """
+    _intern_header_values(column:str, uniques, conversion_dict:dict) -> tuple: `_expand_header_column` of the distinct header strings of a column,
+    the ones in `CP_HEADER_CACHE` for the same conversion spec aren't parsed again
+    """
+    import numpy as np
+
+    cache = CP_HEADER_CACHE
+    names = [name for name, _ in conversion_dict.values()]
+    if cache is None:
+        return _expand_header_column(pd.Series(uniques, dtype=object), conversion_dict)
+    #a tracepoint registered again with other columns must not get the tuples of its previous spec
+    key = (column, tuple((header_key, tuple(spec)) for header_key, spec in conversion_dict.items()))
+    entries = cache.lookup(key, uniques)
+    missing = [i for i, entry in enumerate(entries) if entry is None]
+    if missing:
+        columns, malformed = _expand_header_column(pd.Series(uniques[missing], dtype=object), conversion_dict)
+        parsed = [(tuple(columns[name][j] for name in names), bool(malformed[j])) for j in range(len(missing))]
+        cache.store(key, uniques[missing], parsed)
+        for i, entry in zip(missing, parsed):
+            entries[i] = entry
+    columns = {name: np.empty(len(uniques), dtype=object) for name in names}
+    for j, name in enumerate(names):
+        columns[name][:] = [entry[0][j] for entry in entries]
+    return columns, np.array([entry[1] for entry in entries], dtype=bool)
+
+
+def _expand_header_column(values:pd.Series, conversion_dict:dict) -> tuple:
+    """
+    _expand_header_column(values:pd.Series, conversion_dict:dict) -> tuple: ({column name: object array of value strings or None}, malformed row mask)
+    Values are tokenized in a single regex pass over the joined column, for the key order of the first value,
+    values in another order (or with brackets, spaces...) are parsed one by one with `parse_info_hdrs`.
+    """
+    import re
+    import numpy as np
+
+    lines = [value if isinstance(value, str) else '' for value in values.tolist()]
+    is_null = np.array([line == '' for line in lines], dtype=bool)
+    malformed = np.array([not (isinstance(value, str) or pd.isnull(value)) for value in values.tolist()], dtype=bool)
+    names = {key: conversion_dict[key][0] for key in conversion_dict}
+    columns = {name: np.full(len(lines), None, dtype=object) for name in names.values()}
+
+    #key order of the first parsable value, the conversion dict order if there is none
+    order = list(conversion_dict)
+    for line in lines:
+        first = parse_info_hdrs(line)
+        if first:
+            if all(key in conversion_dict for key in first):
+                order = list(first)
+            break
 
-    # Concatenate all new dataframes created from the key-value pairs
-    if new_dfs:
-        combined_new_df = pd.concat(new_dfs, axis=1)
+    text = '\n'.join(lines)
+    matches = []
+    if text.count('\n') == len(lines) - 1:
+        pairs = ','.join(f'{re.escape(key)}=([^,\\[\\]\\n]*)' for key in order)
+        pattern = re.compile(rf'^(?:\[?{pairs}\]?|(.*))$', re.MULTILINE)
+        matches = pattern.findall(text)
+    if len(matches) == len(lines) and lines:
+        tokens = np.array(matches, dtype=object).reshape(len(lines), len(order) + 1)
+        fast = (tokens[:, -1] == '') & ~is_null
+        if 'unknown' in text.lower():
+            fast &= np.array(['unknown' not in line.lower() for line in lines], dtype=bool)
+        for i, key in enumerate(order):
+            column = tokens[:, i]
+            column[~fast | (column == '')] = None
+            columns[names[key]] = column
+        slow = np.flatnonzero(~fast & ~is_null)
     else:
-        logger.debug("new difs is empty???????")
-        return df
-    #else:
-     #   combined_new_df = pd.DataFrame(index=df.index)  # Create an empty dataframe with the same index
-    df_remaining = df.drop(columns=list(columns_to_check.keys()), errors='ignore')
-
-    final_df = pd.concat([df_remaining, combined_new_df], axis=1)
-    return final_df
+        slow = np.flatnonzero(~is_null)
+
+    for i in slow:
+        parsed = parse_info_hdrs(lines[i], conversion_dict)
+        if parsed is None:
+            malformed[i] = "unknown" not in lines[i].lower()
+            continue
+        for name, value in parsed.items():
+            columns[name][i] = value
+    return columns, malformed
+
+def extract_and_combine(df: pd.DataFrame) -> pd.DataFrame:
+    """extract_and_combine(df: pd.DataFrame) -> pd.DataFrame: df with its debug header columns expanded, see `expand_headers`"""
+    return expand_headers(df)[0]
+
+
+def register_tracepoint(name:str, format:str='kv', columns:dict=None, lazy:bool=True) -> dict:
+    """
+    register_tracepoint(name:str, format:str='kv', columns:dict=None, lazy:bool=True) -> dict: adds or replaces the TRACEPOINT_REGISTRY entry of a tracepoint.
+    `name` as the api returns it ('Resp-Json' is the resp_json column), `format` 'kv' or 'json', `columns` {key: [column name, type]} names and types kv keys
+    (default {tracepoint}_{key}, types guessed from the values). Only kv tracepoints with columns can be expanded eagerly (lazy=False).
+
+    Usage:
+    cp.register_tracepoint('X-Cache-Key', format='kv', columns={'h': ['cache_host', 'String'], 'ttl': ['cache_ttl', 'Int32']})
+    cp.register_tracepoint('tls_json', format='json')
+    """
+    if format not in ('kv', 'json'):
+        raise ValueError(f"unknown tracepoint format {format}, use 'kv' or 'json'")
+    if not lazy and (format != 'kv' or not columns):
+        raise ValueError("only kv tracepoints with columns can be expanded eagerly")
+    column = name.replace('-','_').lower()
+    TRACEPOINT_REGISTRY[column] = {'format': format, 'columns': columns, 'lazy': lazy}
+    if columns:
+        HEADER_COLUMN_TYPES.update({sub_column: column_type for sub_column, column_type in columns.values()})
+    return TRACEPOINT_REGISTRY[column]
+
+
+def _eager_headers() -> dict:
+    """_eager_headers() -> dict: {tracepoint column: kv columns} of the TRACEPOINT_REGISTRY tracepoints expanded at extraction"""
+    return {name: spec['columns'] for name, spec in TRACEPOINT_REGISTRY.items()
+            if not spec.get('lazy', True) and spec['format'] == 'kv' and spec.get('columns')}
+
+
+def _tracepoint_format(name:str, values:pd.Series):
+    """_tracepoint_format(name:str, values:pd.Series): 'kv' or 'json' for a registered tracepoint, else guessed from its first value, None if it's neither"""
+    if name in TRACEPOINT_REGISTRY:
+        return TRACEPOINT_REGISTRY[name]['format']
+    first = values.dropna()
+    if first.empty or not isinstance(first.iloc[0], str):
+        return None
+    first = first.iloc[0].strip()
+    if first.startswith('{'):
+        return 'json'
+    return 'kv' if parse_info_hdrs(first) else None
+
+
+def _tracepoint_column(tracepoint:str, key:str) -> str:
+    """_tracepoint_column(tracepoint:str, key:str) -> str: column name of a tracepoint key, 'resp_json', 'AK-Region' -> 'resp_json_ak_region'"""
+    import re
+    return f"{tracepoint}_{re.sub(r'[^0-9a-zA-Z]+', '_', str(key)).strip('_').lower()}"
+
+
+def _parse_tracepoint_values(tracepoint:str, uniques, format:str, columns:dict=None) -> tuple:
+    """
+    _parse_tracepoint_values(tracepoint:str, uniques, format:str, columns:dict=None) -> tuple: ([{column name: value} per distinct value], malformed count)
+    json objects keep their value types (nested objects/lists as json strings), kv values are strings.
+    """
+    parsed = []
+    malformed = 0
+    for value in uniques:
+        values = None
+        if format == 'json':
+            try:
+                decoded = json.loads(value) if isinstance(value, str) else None
+            except ValueError:
+                decoded = None
+            if isinstance(decoded, dict):
+                values = {_tracepoint_column(tracepoint, key): json.dumps(item) if isinstance(item, (dict, list)) else item
+                          for key, item in decoded.items()}
+        elif columns:
+            values = parse_info_hdrs(value, columns)
+        else:
+            values = parse_info_hdrs(value)
+            if values is not None:
+                values = {_tracepoint_column(tracepoint, key): item for key, item in values.items()}
+        if values is None:
+            malformed += isinstance(value, str) and "unknown" not in value.lower()
+            values = {}
+        parsed.append(values)
+    return parsed, malformed
+
+
+def _tracepoint_values(values:list, codes, index, column_type:str=None) -> pd.Series:
+    """
+    _tracepoint_values(values:list, codes, index, column_type:str=None) -> pd.Series: column of the distinct `values` taken by factorize `codes` (-1: null),
+    Int32/Float32 `column_type` gives nullable numbers, String strings, no type numbers when every value is one (bools aren't) and strings otherwise
+    """
+    import numpy as np
+
+    uniques = pd.Series(values + [None], dtype=object)
+    if column_type is None:
+        present = [value for value in values if value is not None]
+        numeric = _to_numeric(uniques)
+        if present and not any(isinstance(value, bool) for value in present) and numeric.notna().sum() == len(present):
+            column_type = 'Number'
+    if column_type in ('Int32', 'Float32', 'Number'):
+        uniques = _compact_numeric(uniques, 'Float32' if column_type == 'Float32' else 'Int32')
+    return pd.Series(uniques.array.take(np.asarray(codes)), index=index)
 
 ############ extract end #####
 
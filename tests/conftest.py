@@ -0,0 +1,166 @@
+"""
+pytest fixtures: a local stub of the catchpoint api, the fetch functions are pointed at it with `configure_client(base_url=...)`.
+Explorer items are derived from (test id, time, country) only, so any split of a request into windows or test batches returns the same rows.
+"""
+import os
+import sys
+import json
+import gzip
+import random
+import threading
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+import catchpoint_helper as cp
+
+API_KEY = 'stub-key'
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+#minutes of the explorer interval ids, raw data has a point every RAW_MINUTES
+STUB_INTERVALS = {'4': 5, '5': 10, '6': 15, '7': 30, '8': 60, '9': 1440, '11': 120, '12': 180, '13': 240, '15': 300, '16': 360}
+RAW_MINUTES = 5
+COUNTRIES = {'Japan': 'Tokyo', 'US': 'NYC'}
+
+
+class StubState:
+    """StubState: what the stub server was asked and how it misbehaves, reset before each test"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = []
+        self.tests_count = 150
+        self.ignore_paging = False
+        self.fail_paths = {}
+
+    def count(self, path:str) -> int:
+        with self.lock:
+            return sum(1 for request in self.requests if path in request['path'])
+
+
+STUB = StubState()
+
+
+def explorer_body(query:dict, data_type:str) -> dict:
+    start = datetime.strptime(query['startTime'][0], TIME_FORMAT)
+    end = datetime.strptime(query['endTime'][0], TIME_FORMAT)
+    step = timedelta(minutes=RAW_MINUTES if data_type == 'raw' else STUB_INTERVALS[query.get('interval', ['6'])[0]])
+    #points sit on the interval grid like catchpoint's buckets
+    point = datetime(1970, 1, 1) + step * -(-(start - datetime(1970, 1, 1)) // step)
+    items = []
+    while point <= end:
+        for test_id in query['testIds'][0].split(','):
+            for country, city in COUNTRIES.items():
+                rnd = random.Random(f'{test_id}{point}{country}')
+                ttfb = rnd.randint(50, 900) if rnd.random() > 0.05 else 4000
+                failures = None if rnd.random() < 0.03 else (1 if rnd.random() < 0.03 else 0)
+                items.append({
+                    'dimensions': [{'name': point.strftime(TIME_FORMAT)}, {'name': f'test{test_id}', 'id': int(test_id)},
+                                   {'name': country}, {'name': city}, {'name': f'host{int(test_id) % 3}'}],
+                    'values': [rnd.randint(1, 50), rnd.randint(1, 100), ttfb, failures, 100],
+                    'tracepoints': [f'[i=1.2.3.{int(test_id) % 250},b=5.6.7.8,g=9.9.9.9,p=1,r={int(test_id) % 7},t=12]',
+                                    '[a=2914,l=Tokyo,c=JP,x=35.6,y=139.7]' if country == 'Japan' else '[a=7018,l=NYC,c=US,x=40.7,y=-74.0]',
+                                    '[a=1.1.1.1,b=99,c=g,n=Tokyo,o=20940]'],
+                })
+        point += step
+    return {'data': {'responseItems': [{
+        'dimensions': [{'name': 'Time'}, {'name': 'Test'}, {'name': 'Country'}, {'name': 'City'}, {'name': 'Host'}],
+        'metrics': [{'name': 'DNS (ms)'}, {'name': 'Connect (ms)'}, {'name': 'Time To First Byte (ms)'},
+                    {'name': '# Connection Failures'}, {'name': 'Availability (%)'}],
+        'tracepoints': [{'index': 0, 'name': 'X-Aka-Info'}, {'index': 1, 'name': 'X-Es-Info'}, {'index': 2, 'name': 'Akamai-Request-BC'}],
+        'items': items,
+    }]}}
+
+
+def tests_body(query:dict) -> dict:
+    page_number = 1 if STUB.ignore_paging else int(query.get('pageNumber', ['1'])[0])
+    page_size = 100 if STUB.ignore_paging else int(query.get('pageSize', ['100'])[0])
+    tests = []
+    for i in range((page_number - 1) * page_size, min(page_number * page_size, STUB.tests_count)):
+        tests.append({'id': 1000 + i, 'name': f'test{i}', 'testType': {'id': 0, 'name': 'Web'}, 'monitor': {'id': 18, 'name': 'Chrome'},
+                      'url': f'https://example.com/{i}'})
+    data = {'tests': tests}
+    if not STUB.ignore_paging:
+        data['totalCount'] = STUB.tests_count
+    return {'data': data}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        with STUB.lock:
+            STUB.requests.append({'path': self.path, 'authorization': self.headers.get('Authorization')})
+            failing = [path for path, count in STUB.fail_paths.items() if path in self.path and count > 0]
+            for path in failing:
+                STUB.fail_paths[path] -= 1
+        if failing:
+            return self.send(500, {'errors': ['stub failure']})
+        path = url.path
+        if path.startswith('/api/v2/tests/explorer/enumeration'):
+            body = {'data': {'sections': [{'section': 'metrics', 'enumeration': [{'id': 1, 'name': 'DNS (ms)'}]}]}}
+        elif path.startswith('/api/v2/tests/explorer/'):
+            body = explorer_body(query, path.rsplit('/', 1)[1])
+        elif path.startswith('/api/v2/tests'):
+            body = tests_body(query)
+        elif path.startswith('/api/v2/folders/'):
+            body = {'data': {'folders': [{'id': int(path.rstrip('/').rsplit('/', 1)[1]), 'name': 'stub folder',
+                                          'scheduleSetting': {'nodes': [{'id': 1, 'name': 'Tokyo - NTT', 'networkType': {'name': 'Backbone'}}]}}]}}
+        else:
+            return self.send(404, {'errors': ['not found']})
+        self.send(200, body)
+
+    def send(self, status_code:int, body:dict):
+        raw = json.dumps(body).encode()
+        gzipped = 'gzip' in self.headers.get('Accept-Encoding', '')
+        if gzipped:
+            raw = gzip.compress(raw)
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('X-Rate-Limit-Limit', '100000')
+        self.send_header('X-Rate-Limit-Remaining', '100000')
+        self.send_header('X-Rate-Limit-Reset', '60')
+        if gzipped:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+
+@pytest.fixture(scope='session')
+def stub_url():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+
+
+@pytest.fixture
+def stub(stub_url, tmp_path):
+    """the stub's StubState, with CP_CLIENT pointed at the stub and an empty response cache"""
+    STUB.reset()
+    cp.configure_client(base_url=stub_url)
+    cp.configure_cache(cache_dir=str(tmp_path / 'cache'))
+    yield STUB
+    cp.configure_client(base_url=cp.CP_API_BASE_URL)
+    cp.configure_cache()
+
+
+def fetch_kwargs(**kwargs) -> dict:
+    """get_data arguments for four test ids over a fixed 12 hours, overridden by kwargs"""
+    fetch = {'test_ids': [str(i) for i in range(1, 5)], 'api_key': API_KEY,
+             'start_time': '2024-01-01T00:00:00', 'end_time': '2024-01-01T12:00:00'}
+    fetch.update(kwargs)
+    return fetch
@@ -0,0 +1,60 @@
+import gc
+import asyncio
+import warnings
+
+import catchpoint_helper as cp
+from conftest import API_KEY, fetch_kwargs
+
+
+def _sorted(df):
+    return df.sort_values(['time', 'test', 'country']).reset_index(drop=True)
+
+
+def test_get_data_async_matches_get_data(stub):
+    status_code, expected = cp.get_data(**fetch_kwargs(shard_hours=0))
+    assert status_code == 200
+    status_code, test_data = asyncio.run(cp.get_data_async(**fetch_kwargs(shard_hours=2, batch_size=2)))
+    assert status_code == 200
+    assert stub.count('/explorer/') == 1 + 6 * 2
+    assert _sorted(test_data.df).equals(_sorted(expected.df))
+
+
+def test_metadata_async_matches_blocking_calls(stub):
+    async def fetch_all():
+        return await asyncio.gather(cp.tests_async(11, api_key=API_KEY), cp.folders_async(11, api_key=API_KEY),
+                                    cp.get_enumerations_async(api_key=API_KEY))
+
+    tests, folders, enumerations = asyncio.run(fetch_all())
+    assert tests == cp.tests(11, api_key=API_KEY)
+    assert folders == cp.folders(11, api_key=API_KEY)
+    assert enumerations == cp.get_enumerations(api_key=API_KEY)
+
+
+def test_tests_async_pages(stub):
+    stub.tests_count = 250
+    status_code, tests = asyncio.run(cp.tests_async(12, api_key=API_KEY))
+    assert status_code == 200
+    assert len(tests) == 250
+    assert stub.count('/api/v2/tests/?') == 3
+    stub.ignore_paging = True
+    status_code, tests = asyncio.run(cp.tests_async(13, api_key=API_KEY))
+    assert len(tests) == 100
+    assert stub.count('/api/v2/tests/?') == 3 + 2
+
+
+def test_failed_request_is_retried_async(stub):
+    stub.fail_paths['/explorer/'] = 1
+    status_code, test_data = asyncio.run(cp.get_data_async(**fetch_kwargs()))
+    assert status_code == 200
+    assert len(test_data.df) > 0
+    assert stub.count('/explorer/') == 2
+
+
+def test_sessions_of_finished_loops_are_closed(stub):
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        for _ in range(2):
+            status_code, _ = asyncio.run(cp.get_data_async(**fetch_kwargs()))
+            assert status_code == 200
+        gc.collect()
+    assert not [warning for warning in caught if 'Unclosed' in str(warning.message)]
@@ -0,0 +1,48 @@
+import asyncio
+
+import catchpoint_helper as cp
+from conftest import fetch_kwargs
+
+
+def test_closed_windows_are_served_from_the_cache(stub):
+    status_code, fetched = cp.get_data(**fetch_kwargs())
+    assert status_code == 200
+    status_code, cached = cp.get_data(**fetch_kwargs())
+    assert status_code == 200
+    assert stub.count('/explorer/') == 1
+    assert cached.df.equals(fetched.df)
+    assert cp.CP_CACHE.stats()['hits'] == 1
+
+
+def test_cache_entries_belong_to_one_account(stub):
+    cp.get_data(**fetch_kwargs())
+    status_code, _ = cp.get_data(**fetch_kwargs(api_key='other-key'))
+    assert status_code == 200
+    assert stub.count('/explorer/') == 2
+    assert stub.requests[-1]['authorization'] == 'Bearer other-key'
+    cp.get_data(**fetch_kwargs(api_key='other-key'))
+    assert stub.count('/explorer/') == 2
+
+
+def test_use_cache_false_always_fetches(stub):
+    cp.get_data(**fetch_kwargs())
+    cp.get_data(**fetch_kwargs(use_cache=False))
+    assert stub.count('/explorer/') == 2
+
+
+def test_async_fetch_shares_the_cache(stub):
+    _, fetched = cp.get_data(**fetch_kwargs())
+    status_code, cached = asyncio.run(cp.get_data_async(**fetch_kwargs()))
+    assert status_code == 200
+    assert stub.count('/explorer/') == 1
+    assert cached.df.equals(fetched.df)
+
+
+def test_cache_is_kept_under_max_bytes(stub, tmp_path):
+    cache = cp.configure_cache(cache_dir=str(tmp_path / 'small'), max_bytes=20000)
+    for day in range(1, 6):
+        cp.get_data(**fetch_kwargs(start_time=f'2024-01-0{day}T00:00:00', end_time=f'2024-01-0{day}T12:00:00'))
+    stats = cache.stats()
+    assert stats['writes'] == 5
+    assert stats['evictions'] > 0
+    assert stats['bytes'] <= 20000
@@ -0,0 +1,93 @@
+import json
+
+import pandas as pd
+
+import catchpoint_helper as cp
+from conftest import explorer_body
+
+FAILURE_METRICS = ['cnt_connection_failures', 'cnt_ssl_failures', 'cnt_response_failures', 'cnt_timeout_failures']
+
+
+def _row_loop_frame(response_data:dict) -> pd.DataFrame:
+    """the row by row extraction loop the vectorized one replaced (all rows kept), as a DataFrame"""
+    response_items = response_data['data']['responseItems'][0]
+    dimension_names = [dimension['name'].lower() for dimension in response_items['dimensions']]
+    metric_names = [cp._metric_column_name(metric['name']) for metric in response_items['metrics']]
+    header_names = [tracepoint['name'].replace('-','_').lower() for tracepoint in response_items.get('tracepoints', [])]
+    rows = []
+    for item in response_items['items']:
+        header_values = list(item['tracepoints'])
+        dimension_values = [str(dimension_value['name']) for dimension_value in item['dimensions']]
+        metric_values = list(item['values'])
+        for i, n in enumerate(metric_values):
+            if n is None or isinstance(n, str):
+                metric_values[i] = 0 if metric_names[i] in FAILURE_METRICS else None
+            else:
+                metric_values[i] = int(n)
+        rows.append(dimension_values + metric_values + header_values)
+    return pd.DataFrame(rows, columns=dimension_names + metric_names + header_names)
+
+
+def _body(**query) -> dict:
+    query = {'startTime': ['2024-01-01T00:00:00'], 'endTime': ['2024-01-01T06:00:00'], 'testIds': ['1,2,3,4,5'], **query}
+    return explorer_body(query, 'aggregated')
+
+
+def _assert_extracts_like_the_row_loop(response_data:dict):
+    expected = _row_loop_frame(json.loads(json.dumps(response_data)))
+    body = json.dumps(response_data).encode()
+    pd.testing.assert_frame_equal(cp._extract_test_data_body(body)['frame'], expected)
+    pd.testing.assert_frame_equal(cp._extract_test_data(json.loads(body))['frame'], expected)
+
+
+def test_arrow_extraction_matches_the_row_loop():
+    response_data = _body()
+    assert cp._arrow_columns(json.dumps(response_data).encode()) is not None
+    _assert_extracts_like_the_row_loop(response_data)
+
+
+def test_pretty_printed_body_is_arrow_decoded():
+    body = json.dumps(_body(), indent=2).encode()
+    assert cp._arrow_columns(body) is not None
+    pd.testing.assert_frame_equal(cp._extract_test_data_body(body)['frame'], _row_loop_frame(json.loads(body)))
+
+
+def test_float_and_null_values_match_the_row_loop():
+    response_data = _body()
+    for i, item in enumerate(response_data['data']['responseItems'][0]['items']):
+        item['values'][0] = item['values'][0] + 0.75
+        if i % 7 == 0:
+            item['values'][1] = None
+        if i % 11 == 0:
+            item['tracepoints'][2] = None
+    assert cp._arrow_columns(json.dumps(response_data).encode()) is not None
+    _assert_extracts_like_the_row_loop(response_data)
+
+
+def test_irregular_responses_fall_back_to_json():
+    for change in ('string value', 'int name', 'object tracepoint'):
+        response_data = _body()
+        item = response_data['data']['responseItems'][0]['items'][3]
+        if change == 'string value':
+            item['values'][2] = 'n/a'
+            item['values'][3] = 'n/a'
+        elif change == 'int name':
+            item['dimensions'][4]['name'] = 17
+        else:
+            item['tracepoints'][0] = {'i': '1.2.3.4'}
+        assert cp._arrow_columns(json.dumps(response_data).encode()) is None, change
+        if change != 'object tracepoint':
+            _assert_extracts_like_the_row_loop(response_data)
+
+
+def test_short_item_lists_are_padded():
+    response_data = _body()
+    items = response_data['data']['responseItems'][0]['items']
+    items[0]['values'] = items[0]['values'][:2]
+    items[1]['tracepoints'] = []
+    body = json.dumps(response_data).encode()
+    assert cp._arrow_columns(body) is None
+    df = cp._extract_test_data_body(body)['frame']
+    assert len(df) == len(items)
+    assert df['ttfb_ms'].isna().iloc[0] and df['cnt_connection_failures'].iloc[0] == 0
+    assert pd.isna(df['x_aka_info'].iloc[1])
@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta
+
+import catchpoint_helper as cp
+from conftest import API_KEY, fetch_kwargs
+
+
+def _sorted(df):
+    return df.sort_values(['time', 'test', 'country']).reset_index(drop=True)
+
+
+def test_get_data(stub):
+    status_code, test_data = cp.get_data(**fetch_kwargs())
+    assert status_code == 200
+    assert len(test_data.df) > 0
+    assert stub.count('/explorer/') == 1
+
+
+def test_sharded_fetch_matches_single_request(stub):
+    status_code, whole = cp.get_data(**fetch_kwargs(shard_hours=0))
+    assert status_code == 200
+    assert stub.count('/explorer/') == 1
+    status_code, sharded = cp.get_data(**fetch_kwargs(shard_hours=1.1, batch_size=3))
+    assert status_code == 200
+    assert stub.count('/explorer/') == 1 + 12 * 2
+    assert _sorted(sharded.df).equals(_sorted(whole.df))
+
+
+def test_raw_shards_match_single_request(stub):
+    _, whole = cp.get_data(**fetch_kwargs(data_type='raw', end_time='2024-01-01T03:00:00', shard_hours=0))
+    _, sharded = cp.get_data(**fetch_kwargs(data_type='raw', end_time='2024-01-01T03:00:00'))
+    assert stub.count('/explorer/') == 1 + 3
+    assert _sorted(sharded.df).equals(_sorted(whole.df))
+
+
+def test_shard_windows_follow_the_interval_grid():
+    windows = cp._shard_windows('2024-01-01T00:07:00', '2024-01-03T00:00:00', interval=cp.INTERVALS['15m'], shard_hours=1.1)
+    time_format = '%Y-%m-%dT%H:%M:%S'
+    assert windows[0][0] == '2024-01-01T00:07:00' and windows[-1][1] == '2024-01-03T00:00:00'
+    for (_, previous_end), (start, _) in zip(windows, windows[1:]):
+        start = datetime.strptime(start, time_format)
+        assert datetime.strptime(previous_end, time_format) == start - timedelta(seconds=1)
+        assert start.minute % 15 == 0 and start.second == 0
+
+
+def test_failed_shard_is_retried(stub):
+    stub.fail_paths['/explorer/'] = 1
+    status_code, test_data = cp.get_data(**fetch_kwargs(shard_hours=4))
+    assert status_code == 200
+    assert stub.count('/explorer/') == 3 + 1
+    _, whole = cp.get_data(**fetch_kwargs(shard_hours=0))
+    assert _sorted(test_data.df).equals(_sorted(whole.df))
+
+
+def test_configure_client_keeps_the_rate_limiter(stub):
+    rate_limiter = cp.RateLimiter()
+    cp.CP_CLIENT.rate_limiter = rate_limiter
+    client = cp.configure_client(pool_size=4)
+    assert client.pool_size == 4
+    assert client.rate_limiter is rate_limiter
+    status_code, _ = cp.get_data(**fetch_kwargs())
+    assert status_code == 200
+    assert rate_limiter.stats()['limit'] == 100000
+    client.rate_limiter = None
+
+
+def test_tests_of_a_folder_are_paged(stub):
+    stub.tests_count = 250
+    status_code, tests = cp.tests(21, api_key=API_KEY)
+    assert status_code == 200
+    assert len(tests) == 250
+    assert stub.count('/api/v2/tests/?') == 3
+
+
+def test_paging_stops_when_the_server_ignores_it(stub):
+    stub.tests_count = 500
+    stub.ignore_paging = True
+    status_code, tests = cp.tests(22, api_key=API_KEY)
+    assert status_code == 200
+    assert len(tests) == 100
+    assert stub.count('/api/v2/tests/?') == 2
+
+
+def test_streamed_fetch_matches_decoded(stub):
+    _, decoded = cp.get_data(**fetch_kwargs(shard_hours=0, use_cache=False))
+    _, streamed = cp.get_data(**fetch_kwargs(shard_hours=0, stream=True))
+    #the second streamed fetch reads the body teed into the cache
+    _, cached = cp.get_data(**fetch_kwargs(shard_hours=0, stream=True))
+    assert stub.count('/explorer/') == 2
+    assert streamed.df.equals(decoded.df)
+    assert cached.df.equals(decoded.df)
+
+
+def test_extract_processes_match_threads(stub):
+    _, threaded = cp.get_data(**fetch_kwargs(shard_hours=4))
+    _, pooled = cp.get_data(**fetch_kwargs(shard_hours=4, extract_processes=1))
+    assert pooled.df.equals(threaded.df)
+
+
+def test_pools_of_other_sizes_stay_usable(stub):
+    pool = cp._extract_pool(1)
+    assert cp._extract_pool(2) is not pool
+    assert cp._extract_pool(1) is pool
+    #a pool a concurrent fetch still holds isn't shut down by a fetch with another size
+    status_code, _ = cp.get_data(**fetch_kwargs(extract_processes=2))
+    assert status_code == 200
+    assert pool.submit(abs, -1).result() == 1
@@ -0,0 +1,31 @@
+import catchpoint_helper as cp
+from conftest import fetch_kwargs
+
+SQL = "SELECT count(*) AS n FROM data WHERE country = 'Japan'"
+
+
+def test_results_are_cached_until_the_data_changes(stub):
+    _, test_data = cp.get_data(**fetch_kwargs())
+    first = test_data.query(SQL)
+    assert test_data.query(SQL).equals(first)
+    assert test_data.result_cache.stats()['hits'] == 1
+    test_data.df = test_data.df[test_data.df['country'] != 'Japan'].reset_index(drop=True)
+    assert test_data.query(SQL)['n'].iloc[0] == 0
+    assert test_data.result_cache.stats()['invalidations'] == 1
+
+
+def test_in_place_edits_need_a_clear_or_reassignment(stub):
+    _, test_data = cp.get_data(**fetch_kwargs())
+    summary = test_data.summary(stat='p50', group_by='host')
+    test_data.df.loc[:, 'ttfb_ms'] = 1
+    #in place edits aren't seen by the cache
+    assert test_data.summary(stat='p50', group_by='host').equals(summary)
+    test_data.result_cache.clear()
+    assert (test_data.summary(stat='p50', group_by='host')['ttfb_ms'] == 1).all()
+
+    count = test_data.query(SQL)['n'].iloc[0]
+    loads = test_data.query_engine.loads
+    test_data.df.drop(index=test_data.df.index[test_data.df['country'] == 'Japan'], inplace=True)
+    test_data.df = test_data.df
+    assert test_data.query(SQL)['n'].iloc[0] == 0 < count
+    assert test_data.query_engine.loads == loads + 1
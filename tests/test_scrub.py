@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+import catchpoint_helper as cp
+from conftest import fetch_kwargs
+
+
+def _sorted(df):
+    return df.sort_values(['time', 'test', 'country']).reset_index(drop=True)
+
+
+def test_default_policy_flags_outliers_and_errors(stub):
+    _, test_data = cp.get_data(**fetch_kwargs())
+    df = test_data.df
+    assert len(test_data.excluded_df) == 0
+    is_outlier = (df['ttfb_ms'] >= cp.OUTLIER_THRESHOLD).to_numpy()
+    is_error = (df['cnt_connection_failures'] > 0).to_numpy() & (df['availability_pct'] >= 100).to_numpy() & ~is_outlier
+    assert is_outlier.any() and is_error.any()
+    assert np.array_equal(df['is_outlier'].to_numpy(), is_outlier)
+    assert np.array_equal(df['is_error'].to_numpy(), is_error)
+    assert test_data.scrub_counts['rows'] == len(df)
+    assert test_data.scrub_counts['outliers'] == is_outlier.sum()
+    assert test_data.scrub_counts['errors'] == is_error.sum()
+    assert test_data.scrub_counts['excluded'] == 0
+
+
+def test_excluded_rows_move_to_excluded_df(stub):
+    _, included = cp.get_data(**fetch_kwargs())
+    _, test_data = cp.get_data(**fetch_kwargs(scrub_policy=cp.ScrubPolicy(inc_outliers=False, inc_errors=False)))
+    assert len(test_data.df) + len(test_data.excluded_df) == len(included.df)
+    assert not (test_data.df['is_outlier'] | test_data.df['is_error']).any()
+    assert (test_data.excluded_df['is_outlier'] | test_data.excluded_df['is_error']).all()
+    assert test_data.scrub_counts['excluded'] == len(test_data.excluded_df)
+
+
+def test_rescrub_matches_a_fetch_with_the_policy(stub):
+    policy = cp.ScrubPolicy(metric_thresholds={'ttfb_ms': 800}, inc_outliers=False)
+    _, fetched = cp.get_data(**fetch_kwargs(scrub_policy=policy))
+    _, test_data = cp.get_data(**fetch_kwargs())
+    counts = test_data.scrub(policy)
+    assert counts == fetched.scrub_counts
+    assert _sorted(test_data.df).equals(_sorted(fetched.df))
+    #excluded_df isn't compacted by a fetch, compare its values
+    keys = ['time', 'test', 'country', 'ttfb_ms']
+    assert _sorted(test_data.excluded_df)[keys].astype(str).equals(_sorted(fetched.excluded_df)[keys].astype(str))
+
+
+def test_percentile_thresholds_cover_all_shards(stub):
+    policy = cp.ScrubPolicy(percentile_thresholds={'ttfb_ms': 0.9})
+    _, whole = cp.get_data(**fetch_kwargs(shard_hours=0, scrub_policy=policy))
+    _, sharded = cp.get_data(**fetch_kwargs(shard_hours=2, scrub_policy=policy))
+    assert sharded.scrub_counts == whole.scrub_counts
+    assert _sorted(sharded.df).equals(_sorted(whole.df))
+
+
+def test_invalid_policies_raise():
+    with pytest.raises(ValueError):
+        cp.ScrubPolicy(percentile_thresholds={'ttfb_ms': 1.5})
+    with pytest.raises(ValueError):
+        cp.ScrubPolicy(error_rules=[('*failures', '~', 0)])
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+import catchpoint_helper as cp
+from conftest import fetch_kwargs
+
+
+def test_approx_summary_is_within_the_sketch_accuracy(stub):
+    _, test_data = cp.get_data(**fetch_kwargs())
+    exact = test_data.summary(stats=['count'], group_by='host')
+    approx = test_data.summary(stats=['p50', 'p95', 'count'], group_by='host', approx=True)
+    assert approx.index.tolist() == exact.index.tolist()
+    grouped = test_data.df.astype({'host': str}).groupby('host')
+    for metric in ('ttfb_ms', 'dns_ms'):
+        assert (approx[(metric, 'count')] == exact[(metric, 'count')]).all()
+        for stat, q in (('p50', 0.5), ('p95', 0.95)):
+            #a sketch quantile is the value at a rank, pandas would interpolate between the values around it
+            low = grouped[metric].quantile(q, interpolation='lower').astype(float) * (1 - cp.CP_SKETCH_ACCURACY)
+            high = grouped[metric].quantile(q, interpolation='higher').astype(float) * (1 + cp.CP_SKETCH_ACCURACY)
+            values = approx[(metric, stat)].set_axis(approx.index.astype(str))
+            assert ((values >= low - 1e-9) & (values <= high + 1e-9)).all()
+
+
+def test_sketches_of_shards_merge_into_the_whole(stub):
+    _, whole = cp.get_data(**fetch_kwargs())
+    parts = [cp.get_data(**fetch_kwargs(start_time=start, end_time=end, shard_hours=0))[1]
+             for start, end in (('2024-01-01T00:00:00', '2024-01-01T05:59:59'), ('2024-01-01T06:00:00', '2024-01-01T12:00:00'))]
+    merged = cp.merge_sketches(*[part.sketches('test') for part in parts])
+    expected = cp.sketch_summary(whole.sketches('test'), stats=['p50', 'p99', 'count', 'mean'])
+    pd.testing.assert_frame_equal(cp.sketch_summary(merged, stats=['p50', 'p99', 'count', 'mean']), expected)
+
+
+def test_dumped_sketches_keep_their_group_keys():
+    df = pd.DataFrame({'code': pd.array([200, 500, 200, 500], dtype='Int32'),
+                       'time': pd.to_datetime(['2024-01-01', '2024-01-02'] * 2),
+                       'host': ['a', 'a', 'b', 'b'],
+                       'ttfb_ms': [100.0, 200.0, 300.0, 400.0]})
+    for group_by in ('code', 'time', ['code', 'host'], ['time', 'host']):
+        sketch_set = cp.build_sketches(df, group_by=group_by)
+        loaded = cp.load_sketches(cp.dump_sketches(sketch_set))
+        assert list(loaded) == list(sketch_set)
+        merged = cp.merge_sketches(sketch_set, loaded)
+        assert len(merged) == len(sketch_set)
+        assert all(merged[group]['ttfb_ms'].count == 2 * sketch_set[group]['ttfb_ms'].count for group in sketch_set)
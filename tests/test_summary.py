@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+
+import catchpoint_helper as cp
+from conftest import fetch_kwargs
+
+
+def test_grouped_stats_match_pandas(stub):
+    _, test_data = cp.get_data(**fetch_kwargs())
+    summary = test_data.summary(stats=['p50', 'p95', 'mean', 'count', 'std', 'min', 'max'], group_by='host')
+    df = test_data.df.astype({name: 'float64' for name in test_data.metrics})
+    grouped = df.groupby(df['host'].astype(str))
+    for metric in test_data.metrics:
+        expected = pd.DataFrame({
+            'p50': grouped[metric].quantile(0.5), 'p95': grouped[metric].quantile(0.95), 'mean': grouped[metric].mean(),
+            'count': grouped[metric].count(), 'std': grouped[metric].std(), 'min': grouped[metric].min(), 'max': grouped[metric].max(),
+        })
+        got = summary[metric]
+        got.index = got.index.astype(str)
+        pd.testing.assert_frame_equal(got, expected, check_names=False, check_dtype=False)
+
+
+def test_single_stat_matches_grouped_stats(stub):
+    _, test_data = cp.get_data(**fetch_kwargs())
+    single = test_data.summary(stat='p95', group_by='test')
+    grouped = test_data.summary(stats=['p95'], group_by='test')
+    for metric in test_data.metrics:
+        assert np.allclose(single[metric].to_numpy(dtype=float), grouped[(metric, 'p95')].to_numpy(dtype=float))
+
+
+def test_only_numeric_columns_are_summarized(stub):
+    _, test_data = cp.get_data(**fetch_kwargs())
+    sql = "SELECT test, host, country, ttfb_ms, is_outlier FROM data"
+    summary = test_data.summary(sql=sql, stats=['p50', 'count'])
+    assert list(summary.columns.get_level_values('metric').unique()) == ['ttfb_ms']
+    assert not summary.isna().any().any()
+    single = test_data.summary(sql=sql, stat='p50')
+    assert list(single.columns) == ['ttfb_ms']
+    df = test_data.df[['test', 'host', 'ttfb_ms']]
+    assert cp.get_summary(df, stats=['mean'], group_by='test').columns.get_level_values('metric').tolist() == ['ttfb_ms']
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+import catchpoint_helper as cp
+from conftest import fetch_kwargs
+
+
+def _test_data():
+    _, test_data = cp.get_data(**fetch_kwargs())
+    df = test_data.df.copy()
+    df.loc[df.index % 10 == 0, 'ttfb_ms'] = pd.NA
+    test_data.df = df
+    return test_data
+
+
+def test_where_matches_pandas_filters(stub):
+    test_data = _test_data()
+    df = test_data.df
+    ttfb = df['ttfb_ms'].astype('float64')
+    cases = [
+        ({'country': 'Japan'}, df['country'] == 'Japan'),
+        ({'test__in': ['test1', 'test3']}, df['test'].isin(['test1', 'test3'])),
+        ({'host__ne': 'host1'}, df['host'] != 'host1'),
+        ({'ttfb_ms__gt': 500, 'country__ne': 'US'}, (ttfb > 500) & (df['country'] != 'US')),
+        ({'ttfb_ms__between': (100, 300)}, (ttfb >= 100) & (ttfb <= 300)),
+        ({'ttfb_ms__isnull': True}, ttfb.isna()),
+    ]
+    for conditions, expected in cases:
+        assert test_data.where(**conditions).count() == int(expected.fillna(False).sum()), conditions
+        selected = test_data.where(**conditions).data_frame()
+        assert selected.equals(df[expected.fillna(False).to_numpy()].reset_index(drop=True)), conditions
+
+
+def test_ne_never_matches_nulls(stub):
+    test_data = _test_data()
+    ttfb = test_data.df['ttfb_ms']
+    assert test_data.where(ttfb_ms__ne=500).count() == int((ttfb.notna() & (ttfb != 500)).sum())
+    assert test_data.where(ttfb_ms__not_in=[500, 600]).count() == int((ttfb.notna() & ~ttfb.isin([500, 600])).sum())
+
+
+def test_summary_cache_keys_use_every_value(stub):
+    test_data = _test_data()
+    #numpy abbreviates the repr of arrays over 1000 values, these two only differ in the middle
+    first = np.array(['test1'] * 1500, dtype=object)
+    second = first.copy()
+    first[700], second[700] = 'test2', 'test3'
+    assert repr(first) == repr(second)
+    one = test_data.where(test__in=first).summary(stats=['count'], group_by='test')
+    other = test_data.where(test__in=second).summary(stats=['count'], group_by='test')
+    assert one.index.astype(str).tolist() == ['test1', 'test2']
+    assert other.index.astype(str).tolist() == ['test1', 'test3']
+    assert test_data.where(test__in=list(first)).summary(stats=['count'], group_by='test').equals(one)
+
+
+def test_unhashable_conditions_are_not_cached(stub):
+    test_data = _test_data()
+    selection = test_data.where(test__in={'test1': 'a', 'test2': 'b'})
+    summary = selection.summary(stat='p50', group_by='test')
+    assert summary.index.astype(str).tolist() == ['test1', 'test2']
+    assert selection.summary(stat='p50', group_by='test').equals(summary)
+    assert test_data.result_cache.stats()['entries'] == 0